@@ -3,6 +3,7 @@ from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.contrib.auth.models import User, Group
 
 from .models import UserProfile, SystemSettings
+from .utils import invalidate_user_role
 
 
 admin.site.unregister(User)
@@ -37,6 +38,7 @@ class UserAdmin(BaseUserAdmin):
             if obj.is_staff and not obj.is_superuser:
                 obj.is_staff = False
                 obj.save(update_fields=['is_staff'])
+        invalidate_user_role(obj)
 
 
 @admin.register(UserProfile)
@@ -47,4 +49,4 @@ class UserProfileAdmin(admin.ModelAdmin):
 
 @admin.register(SystemSettings)
 class SystemSettingsAdmin(admin.ModelAdmin):
-    list_display = ("site_name", "contact_email", "currency")
+    list_display = ("site_name", "contact_email", "currency", "request_timing_enabled")
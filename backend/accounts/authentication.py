@@ -0,0 +1,101 @@
+from django.contrib.auth import get_user_model
+from django.utils.functional import cached_property
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .utils import get_user_role, role_claim_is_current, user_is_active
+
+
+class ClaimsUser(TokenUser):
+    """Request user built from the signed access token claims, without a database row.
+
+    It carries id, email and role but is no model instance: read paths must
+    filter on ``user.id`` rather than pass the user as a related object.
+    """
+
+    @cached_property
+    def email(self):
+        return self.token.get("email", "")
+
+
+class RoleJWTAuthentication(JWTAuthentication):
+    """JWTAuthentication that reuses the signed ``role`` claim.
+
+    The claim seeds the role memoized by get_user_role, so permissions and
+    querysets do not query the user's groups. Tokens issued before the last
+    role change (see invalidate_user_role) fall back to the database.
+    """
+
+    def get_user(self, validated_token):
+        user = super().get_user(validated_token)
+        if self.role_claim(validated_token):
+            user._role_cache = validated_token["role"]
+        return user
+
+    def role_claim(self, validated_token):
+        role = validated_token.get("role")
+        user_id = validated_token.get(api_settings.USER_ID_CLAIM)
+        return bool(role) and role_claim_is_current(user_id, validated_token.get("iat", 0))
+
+
+class StatelessReadJWTAuthentication(RoleJWTAuthentication):
+    """Skips the user query on read-only requests.
+
+    For safe methods the user is a ClaimsUser built from the id, email and
+    role claims. Deactivated accounts are still rejected through the cached
+    user_is_active check. Writes, and tokens whose claims are missing or
+    stale, load the full user like RoleJWTAuthentication.
+    """
+
+    def authenticate(self, request):
+        self.read_only = request.method in SAFE_METHODS
+        return super().authenticate(request)
+
+    def get_user(self, validated_token):
+        if not (self.read_only and validated_token.get("email") and self.role_claim(validated_token)):
+            return super().get_user(validated_token)
+
+        user = ClaimsUser(validated_token)
+        if not user_is_active(user.id):
+            raise AuthenticationFailed("User is inactive", code="user_inactive")
+        user._role_cache = validated_token["role"]
+        return user
+
+
+class EventStreamJWTAuthentication(StatelessReadJWTAuthentication):
+    """Also takes the access token from ``?token=``.
+
+    Browsers' EventSource cannot send an Authorization header. Query strings
+    end up in access logs, so this is only used by the event stream, whose
+    tokens are short-lived access tokens.
+    """
+
+    def authenticate(self, request):
+        raw_token = request.GET.get("token")
+        if raw_token is None:
+            return super().authenticate(request)
+        self.read_only = request.method in SAFE_METHODS
+        validated_token = self.get_validated_token(raw_token.encode())
+        return self.get_user(validated_token), validated_token
+
+
+class RoleRefreshToken(RefreshToken):
+    """Refresh token that re-reads a changed role before issuing access tokens.
+
+    Access tokens copy the refresh token's claims, so without this a token
+    refreshed after a role change would carry the old role with a new ``iat``.
+    """
+
+    @property
+    def access_token(self):
+        user_id = self.payload.get(api_settings.USER_ID_CLAIM)
+        if user_id and not role_claim_is_current(user_id, self.payload.get("iat", 0)):
+            user = get_user_model().objects.filter(pk=user_id).first()
+            if user is not None:
+                self["role"] = get_user_role(user)
+                self.set_iat()
+        return super().access_token
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.7 on 2026-10-17 03:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='systemsettings',
+            name='request_timing_enabled',
+            field=models.BooleanField(default=False, help_text='Add Server-Timing headers and timing log lines to every request.'),
+        ),
+    ]
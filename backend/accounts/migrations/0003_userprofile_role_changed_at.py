@@ -0,0 +1,18 @@
+# Generated by Django 5.1.7 on 2026-10-17 04:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0002_request_timing_enabled'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='role_changed_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+    ]
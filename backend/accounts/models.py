@@ -11,6 +11,8 @@ class UserProfile(models.Model):
     avatar = models.ImageField(upload_to="avatars/", blank=True, null=True)
     phone = models.CharField(max_length=30, blank=True)
     address = models.TextField(blank=True)
+    # Role claims in tokens issued before this are not trusted
+    role_changed_at = models.DateTimeField(null=True, blank=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -28,6 +30,10 @@ class SystemSettings(models.Model):
     sms_alerts_enabled = models.BooleanField(default=False)
     two_factor_enabled = models.BooleanField(default=False)
     session_timeout_minutes = models.PositiveIntegerField(default=30)
+    request_timing_enabled = models.BooleanField(
+        default=False,
+        help_text="Add Server-Timing headers and timing log lines to every request.",
+    )
 
     class Meta:
         verbose_name = "System Settings"
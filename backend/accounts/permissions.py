@@ -1,3 +1,6 @@
+import hmac
+
+from django.conf import settings
 from rest_framework.permissions import BasePermission, SAFE_METHODS
 from .utils import get_user_role
 
@@ -84,3 +87,17 @@ class IsSelfOrAdmin(BasePermission):
         if role == 'customer' and hasattr(obj, 'email'):
             return obj.email == request.user.email
         return False
+
+
+class HasMetricsToken(BasePermission):
+    """Lets scrapers in with ``Authorization: Metrics <METRICS_TOKEN>``.
+
+    The Metrics scheme is ignored by the JWT authentication classes, so the
+    header does not need to be a valid token.
+    """
+    keyword = 'Metrics'
+
+    def has_permission(self, request, view):
+        token = getattr(settings, 'METRICS_TOKEN', '')
+        scheme, _, credentials = request.headers.get('Authorization', '').partition(' ')
+        return bool(token) and scheme == self.keyword and hmac.compare_digest(credentials.encode(), token.encode())
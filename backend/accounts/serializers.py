@@ -2,8 +2,9 @@ from rest_framework import serializers
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import Group
 from django.contrib.auth.password_validation import validate_password
-from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
 
+from .authentication import RoleRefreshToken
 from .models import UserProfile, SystemSettings
 from .utils import get_user_role
 
@@ -72,6 +73,10 @@ class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
         return data
 
 
+class CustomTokenRefreshSerializer(TokenRefreshSerializer):
+    token_class = RoleRefreshToken
+
+
 class UserSerializer(serializers.ModelSerializer):
     role = serializers.SerializerMethodField()
 
@@ -98,4 +103,5 @@ class SystemSettingsSerializer(serializers.ModelSerializer):
             "site_name", "contact_email", "timezone", "currency", "logo",
             "email_alerts_enabled", "sms_alerts_enabled",
             "two_factor_enabled", "session_timeout_minutes",
+            "request_timing_enabled",
         ]
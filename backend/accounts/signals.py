@@ -1,10 +1,16 @@
 from django.conf import settings
+from django.contrib.auth import get_user_model
 from django.contrib.auth.models import Group, Permission
 from django.db.models import Q
-from django.db.models.signals import post_save, post_migrate
+from django.db.models.signals import m2m_changed, post_save, post_migrate, pre_delete, pre_save
 from django.dispatch import receiver
 
-from .models import UserProfile
+from .models import SystemSettings, UserProfile
+from .utils import forget_user_state, invalidate_user_role, invalidate_user_roles, set_request_timing_enabled
+
+
+# User fields that change the role or whether the role claim may be trusted
+ROLE_FIELDS = ("is_superuser", "is_active")
 
 
 @receiver(post_save, sender=settings.AUTH_USER_MODEL)
@@ -13,6 +19,53 @@ def create_user_profile(sender, instance, created, **kwargs):
         UserProfile.objects.get_or_create(user=instance)
 
 
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def forget_cached_user_state(sender, instance, **kwargs):
+    forget_user_state(instance.pk)
+
+
+@receiver(post_save, sender=SystemSettings)
+def publish_request_timing_switch(sender, instance, **kwargs):
+    # This worker applies it at once, the others when their cached value expires
+    set_request_timing_enabled(instance.request_timing_enabled)
+
+
+@receiver(m2m_changed, sender=get_user_model().groups.through)
+def invalidate_role_on_group_change(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse and action == "pre_clear":
+        # post_clear has no pk_set, so note the members before they go
+        instance._cleared_user_ids = list(instance.user_set.values_list("pk", flat=True))
+        return
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    if not reverse:
+        invalidate_user_role(instance)
+    elif action == "post_clear":
+        invalidate_user_roles(instance.__dict__.pop("_cleared_user_ids", []))
+    else:
+        invalidate_user_roles(pk_set)
+
+
+@receiver(pre_delete, sender=Group)
+def invalidate_role_on_group_delete(sender, instance, **kwargs):
+    invalidate_user_roles(list(instance.user_set.values_list("pk", flat=True)))
+
+
+@receiver(pre_save, sender=settings.AUTH_USER_MODEL)
+def remember_role_fields(sender, instance, raw=False, update_fields=None, **kwargs):
+    instance._previous_role_fields = None
+    if raw or instance._state.adding or (update_fields is not None and not set(update_fields) & set(ROLE_FIELDS)):
+        return
+    instance._previous_role_fields = sender.objects.filter(pk=instance.pk).values_list(*ROLE_FIELDS).first()
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def invalidate_role_on_user_change(sender, instance, **kwargs):
+    previous = getattr(instance, "_previous_role_fields", None)
+    if previous is not None and previous != tuple(getattr(instance, field) for field in ROLE_FIELDS):
+        invalidate_user_role(instance)
+
+
 @receiver(post_migrate)
 def create_default_groups(sender, **kwargs):
     admin_group, _ = Group.objects.get_or_create(name="admin")
@@ -0,0 +1,105 @@
+import time
+
+from django.contrib.auth.models import Group, User
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from .authentication import RoleRefreshToken
+from .models import SystemSettings, UserProfile
+from .serializers import CustomTokenObtainPairSerializer
+from .utils import request_timing_enabled, role_claim_is_current
+
+
+class RoleInvalidationTests(TestCase):
+    """Role claims issued before a change of the user's role are no longer trusted."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = Group.objects.get(name="staff")
+        cls.user = User.objects.create_user("user", "user@example.com", "password")
+        cls.other = User.objects.create_user("other", "other@example.com", "password")
+
+    def setUp(self):
+        self.forget_changes()
+        # A claim issued a second ago, before the change under test
+        self.issued_at = int(time.time()) - 1
+
+    def forget_changes(self):
+        UserProfile.objects.update(role_changed_at=None)
+        cache.clear()
+
+    def assertClaimTrusted(self, user, trusted=True):
+        self.assertEqual(role_claim_is_current(user.pk, self.issued_at), trusted)
+
+    def assertInvalidated(self, *users):
+        for user in users:
+            self.assertClaimTrusted(user, False)
+
+    def member_change(self, change, *users):
+        """Run ``change`` on a staff membership and check the users' claims were invalidated."""
+        self.staff.user_set.add(*users)
+        self.forget_changes()
+        change()
+        self.assertInvalidated(*users)
+
+    def test_forward_add_remove_clear(self):
+        self.user.groups.add(self.staff)
+        self.assertInvalidated(self.user)
+        self.assertClaimTrusted(self.other)
+        self.member_change(lambda: self.user.groups.remove(self.staff), self.user)
+        self.member_change(lambda: self.user.groups.clear(), self.user)
+
+    def test_reverse_add_remove_clear(self):
+        self.staff.user_set.add(self.user, self.other)
+        self.assertInvalidated(self.user, self.other)
+        self.member_change(lambda: self.staff.user_set.remove(self.user, self.other), self.user, self.other)
+        self.member_change(lambda: self.staff.user_set.clear(), self.user, self.other)
+
+    def test_group_delete(self):
+        group = Group.objects.create(name="admin-temp")
+        group.user_set.add(self.user)
+        self.forget_changes()
+        group.delete()
+        self.assertInvalidated(self.user)
+        self.assertClaimTrusted(self.other)
+
+    def test_superuser_and_active_changes(self):
+        for field, value in (("is_superuser", True), ("is_active", False)):
+            with self.subTest(field=field):
+                self.forget_changes()
+                setattr(self.user, field, value)
+                self.user.save()
+                self.assertInvalidated(self.user)
+
+    def test_unrelated_user_save_keeps_claims(self):
+        self.user.first_name = "Name"
+        self.user.save()
+        self.user.save(update_fields=["last_login"])
+        self.assertClaimTrusted(self.user)
+
+    def test_change_outlives_the_cache(self):
+        # Another worker, or a culled cache entry, has no marker for the change
+        self.user.groups.add(self.staff)
+        cache.clear()
+        self.assertInvalidated(self.user)
+
+    def test_refresh_reissues_the_current_role(self):
+        refresh = RoleRefreshToken(str(CustomTokenObtainPairSerializer.get_token(self.user)))
+        self.user.groups.add(self.staff)
+        cache.clear()
+        self.assertEqual(refresh.access_token["role"], "staff")
+
+
+class RequestTimingSwitchTests(TestCase):
+    def setUp(self):
+        SystemSettings().save()
+        cache.clear()
+
+    @override_settings(REQUEST_TIMING_CACHE_SECONDS=1)
+    def test_switch_flipped_by_another_worker_is_seen_after_the_cache_expires(self):
+        self.assertFalse(request_timing_enabled())
+        # Saved through another worker, whose signal only reaches its own cache
+        SystemSettings.objects.filter(pk=1).update(request_timing_enabled=True)
+        self.assertFalse(request_timing_enabled())
+        time.sleep(1.1)
+        self.assertTrue(request_timing_enabled())
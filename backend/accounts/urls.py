@@ -1,11 +1,10 @@
 from django.urls import path
-from rest_framework_simplejwt.views import TokenRefreshView
 
-from .views import RegisterView, CustomTokenObtainPairView, UserProfileView
+from .views import RegisterView, CustomTokenObtainPairView, CustomTokenRefreshView, UserProfileView
 
 urlpatterns = [
     path("register/", RegisterView.as_view(), name="register"),
     path("auth/login/", CustomTokenObtainPairView.as_view(), name="token_obtain_pair"),
-    path("auth/refresh/", TokenRefreshView.as_view(), name="token_refresh"),
+    path("auth/refresh/", CustomTokenRefreshView.as_view(), name="token_refresh"),
     path("users/me/", UserProfileView.as_view(), name="user-profile"),
 ]
@@ -1,8 +1,26 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+
+USER_STATE_KEY = "accounts:user-state:{}"
+REQUEST_TIMING_KEY = "accounts:request-timing"
+
+
 def get_user_role(user):
     """Derive a role string from Django Group membership.
 
     Priority: superuser → 'admin' group → 'staff' group → 'customer'.
+    The result is memoized on the user object, which lives for one request.
     """
+    role = getattr(user, "_role_cache", None)
+    if role is None:
+        role = _resolve_role(user)
+        user._role_cache = role
+    return role
+
+
+def _resolve_role(user):
     if user.is_superuser:
         return "admin"
     group_names = set(user.groups.values_list("name", flat=True))
@@ -11,3 +29,79 @@ def get_user_role(user):
     if "staff" in group_names:
         return "staff"
     return "customer"
+
+
+def invalidate_user_role(user):
+    """Forget the memoized role and stop trusting role claims issued before now."""
+    user.__dict__.pop("_role_cache", None)
+    invalidate_user_roles([user.pk])
+
+
+def invalidate_user_roles(user_ids):
+    """Stop trusting the role claims of ``user_ids`` issued before now.
+
+    The change is stored on the users' profiles, so every worker sees it
+    once its cached user state expires, see user_state.
+    """
+    from .models import UserProfile
+
+    user_ids = list(user_ids)
+    if not user_ids:
+        return
+    UserProfile.objects.bulk_create([UserProfile(user_id=user_id) for user_id in user_ids], ignore_conflicts=True)
+    UserProfile.objects.filter(user_id__in=user_ids).update(role_changed_at=timezone.now())
+    cache.delete_many([USER_STATE_KEY.format(user_id) for user_id in user_ids])
+
+
+def user_state(user_id):
+    """(is_active, role changed at as a timestamp or 0), cached for USER_ACTIVE_CACHE_SECONDS.
+
+    Read from the database on a cache miss, so a role change or
+    deactivation made through another worker applies within that time
+    whichever cache backend is configured.
+    """
+    from django.contrib.auth import get_user_model
+
+    key = USER_STATE_KEY.format(user_id)
+    state = cache.get(key)
+    if state is None:
+        row = get_user_model().objects.filter(pk=user_id).values_list("is_active", "profile__role_changed_at").first()
+        if row is None:
+            state = (False, 0)
+        else:
+            state = (row[0], row[1].timestamp() if row[1] else 0)
+        cache.set(key, state, timeout=settings.USER_ACTIVE_CACHE_SECONDS)
+    return state
+
+
+def role_claim_is_current(user_id, issued_at):
+    """True unless the user's role changed after a token was issued at ``issued_at``."""
+    return issued_at > user_state(user_id)[1]
+
+
+def user_is_active(user_id):
+    """Whether the user may still authenticate, see user_state."""
+    return user_state(user_id)[0]
+
+
+def forget_user_state(user_id):
+    cache.delete(USER_STATE_KEY.format(user_id))
+
+
+def request_timing_enabled():
+    """The SystemSettings.request_timing_enabled switch, cached for REQUEST_TIMING_CACHE_SECONDS.
+
+    The cache may be per process, so every worker re-reads the switch within
+    that time of an admin flipping it.
+    """
+    enabled = cache.get(REQUEST_TIMING_KEY)
+    if enabled is None:
+        from .models import SystemSettings
+
+        enabled = SystemSettings.objects.filter(pk=1).values_list("request_timing_enabled", flat=True).first() or False
+        cache.set(REQUEST_TIMING_KEY, enabled, timeout=settings.REQUEST_TIMING_CACHE_SECONDS)
+    return enabled
+
+
+def set_request_timing_enabled(enabled):
+    cache.set(REQUEST_TIMING_KEY, enabled, timeout=settings.REQUEST_TIMING_CACHE_SECONDS)
@@ -4,13 +4,14 @@ from rest_framework import generics, status
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from rest_framework_simplejwt.views import TokenObtainPairView
-from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 
+from .authentication import RoleJWTAuthentication
 from .models import SystemSettings
 from .serializers import (
     RegisterSerializer,
     CustomTokenObtainPairSerializer,
+    CustomTokenRefreshSerializer,
     UserSerializer,
     SystemSettingsSerializer,
 )
@@ -45,8 +46,12 @@ class CustomTokenObtainPairView(TokenObtainPairView):
     serializer_class = CustomTokenObtainPairSerializer
 
 
+class CustomTokenRefreshView(TokenRefreshView):
+    serializer_class = CustomTokenRefreshSerializer
+
+
 class UserProfileView(APIView):
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [RoleJWTAuthentication]
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
@@ -55,7 +60,7 @@ class UserProfileView(APIView):
 
 
 class SystemSettingsView(APIView):
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [RoleJWTAuthentication]
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
@@ -59,6 +59,9 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware', 
+    "shipments.middleware.MetricsMiddleware",
+    # Toggled at runtime by SystemSettings.request_timing_enabled
+    "shipments.middleware.RequestTimingMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -124,6 +127,27 @@ DATABASES = {
 }
 
 
+# Cache
+# The reference data versions must be shared between gunicorn workers, so
+# point REDIS_URL at a Redis server in multi-worker deployments (requires the
+# redis package). Falls back to a per-process cache. Role changes are stored
+# on the user's profile and only cached for USER_ACTIVE_CACHE_SECONDS.
+
+if os.environ.get("REDIS_URL"):
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": os.environ["REDIS_URL"],
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        }
+    }
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -158,23 +182,61 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 MEDIA_URL = '/media/'
 
 
+# Invoice PDFs are rendered by a process pool and cached on disk by content hash
+INVOICE_PDF_CACHE_DIR = os.environ.get("INVOICE_PDF_CACHE_DIR", str(BASE_DIR / "cache" / "invoice_pdfs"))
+PDF_RENDER_WORKERS = int(os.environ.get("PDF_RENDER_WORKERS", 2))
+PDF_RENDER_WAIT_SECONDS = 10
+
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 REST_FRAMEWORK = {
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
+    'DEFAULT_PAGINATION_CLASS': 'shipments.pagination.OptionalCursorPagination',
     'PAGE_SIZE': 10,
     'DEFAULT_FILTER_BACKENDS': ['django_filters.rest_framework.DjangoFilterBackend'],
     'DEFAULT_PERMISSION_CLASSES':(
         'rest_framework.permissions.IsAuthenticated',
     ),
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'accounts.authentication.RoleJWTAuthentication',
     )
 }
 
+# Upper bound for ?page_size= in cursor pagination mode
+PAGINATION_MAX_PAGE_SIZE = 100
+
+# How long authentication trusts a cached is_active flag and role change time
+USER_ACTIVE_CACHE_SECONDS = 60
+
+# Statements listed in each request timing log line
+REQUEST_TIMING_SLOWEST_QUERIES = 3
+# How long each worker caches the SystemSettings.request_timing_enabled switch
+REQUEST_TIMING_CACHE_SECONDS = 5
+
+# Shared secret for Prometheus scrapers, sent as "Authorization: Metrics <token>".
+# Admins can always read /api/metrics/ with their JWT. With several gunicorn
+# workers, also set PROMETHEUS_MULTIPROC_DIR (see shipments/metrics.py).
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN", "")
+
+# Live updates (/api/events/, ASGI only). The in-memory broker only reaches
+# streams served by the same process, so several workers need Redis.
+LIVE_UPDATES_REDIS_URL = os.environ.get("REDIS_URL", "")
+LIVE_UPDATES_BROKER = "shipments.live.RedisBroker" if LIVE_UPDATES_REDIS_URL else "shipments.live.InMemoryBroker"
+LIVE_UPDATES_HEARTBEAT_SECONDS = 15
+# Recent events kept per process for clients reconnecting with Last-Event-ID
+LIVE_UPDATES_REPLAY_EVENTS = 1000
+
+# Chunked document uploads (/api/documents/uploads/). Clients are told to send
+# DOCUMENT_UPLOAD_CHUNK_SIZE bytes per request; idle sessions are removed by
+# the purge_document_uploads command after DOCUMENT_UPLOAD_EXPIRY_SECONDS.
+DOCUMENT_UPLOAD_MAX_SIZE = 512 * 1024 * 1024
+DOCUMENT_UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+DOCUMENT_UPLOAD_MAX_CHUNK_SIZE = 32 * 1024 * 1024
+DOCUMENT_UPLOAD_EXPIRY_SECONDS = 24 * 60 * 60
+
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=60),  
     'REFRESH_TOKEN_LIFETIME': timedelta(days=7),  
@@ -0,0 +1,400 @@
+"""Seeded API benchmarks, run by the ``benchmark_api`` management command.
+
+The data set is inserted with bulk_create in large batches, so the
+signals are skipped and the derived tables (monthly stats, search
+entries) are rebuilt once at the end. Every endpoint is then requested
+in-process as admin, staff and customer while its latency and SQL query
+count are recorded.
+"""
+import hashlib
+import json
+import math
+import statistics
+import time
+import uuid
+from datetime import timedelta
+from functools import partial
+from itertools import islice
+
+from django.contrib.auth.models import Group, User
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from djmoney.money import Money
+from rest_framework.test import APIClient
+
+from accounts.serializers import CustomTokenObtainPairSerializer
+from .geo import grid_cell
+from .models import Customer, Document, Invoice, InvoiceItem, Parameter, Parcel, Shipment, ShipmentPosition, Step
+from .search import rebuild_search_index
+from .stats import rebuild_monthly_stats
+
+
+DEFAULT_VOLUMES = {
+    'shipments': 10_000,
+    'customers': 20_000,
+    'parcels': 1_000_000,
+    'invoices': 100_000,
+    'documents': 20_000,
+    'positions': 200_000,
+}
+
+ITEMS_PER_INVOICE = 5
+ROLES = ('admin', 'staff', 'customer')
+PORTS = ['Dar es Salaam', 'Mombasa', 'Dubai', 'Shanghai', 'Mumbai', 'Rotterdam']
+VESSELS = ['MSC Aurora', 'Maersk Kensington', 'Emirates SkyCargo', 'Ethiopian Cargo', 'CMA CGM Tage']
+PASSWORD = 'benchmark-password'
+UPLOAD_CHUNK = bytes(range(256)) * 1024
+UPLOAD_CHECKSUM = hashlib.sha256(UPLOAD_CHUNK).hexdigest()
+UPLOAD_RANGE = {'Content-Range': f'bytes 0-{len(UPLOAD_CHUNK) - 1}/{len(UPLOAD_CHUNK)}'}
+
+
+def _bulk_insert(model, objects, batch_size):
+    while batch := list(islice(objects, batch_size)):
+        model.objects.bulk_create(batch)
+
+
+def track_point(shipment, ping):
+    """Latitude and longitude of a shipment's ``ping``-th position."""
+    return -30 + shipment * 7 % 60 + ping * 0.01, 20 + shipment * 13 % 80 + ping * 0.01
+
+
+def seed(volumes, batch_size=5000, log=print):
+    """Insert a deterministic data set of the given ``volumes``.
+
+    Parcel ``k`` belongs to shipment ``k % shipments`` and customer
+    ``k % customers``; every invoice bills up to ITEMS_PER_INVOICE parcels
+    of its customer and no parcel is billed twice. Each shipment has the
+    same number of positions, a minute apart, and sits at its last one.
+    """
+    n_shipments, n_customers = volumes['shipments'], volumes['customers']
+    n_parcels, n_invoices = volumes['parcels'], volumes['invoices']
+    pings = volumes['positions'] // n_shipments
+    now = timezone.now()
+
+    def last_position(i):
+        if not pings:
+            return {}
+        latitude, longitude = track_point(i, pings - 1)
+        return {
+            'latitude': f'{latitude:.6f}', 'longitude': f'{longitude:.6f}',
+            'position_cell': grid_cell(latitude, longitude), 'position_recorded_at': now,
+        }
+
+    log(f"Seeding {n_shipments} shipments")
+    _bulk_insert(Shipment, (
+        Shipment(
+            shipment_no=f'S{i:07d}', transport='Air' if i % 3 == 0 else 'Sea', vessel=VESSELS[i % len(VESSELS)],
+            weight=1000, volume=40, origin=PORTS[i % len(PORTS)], destination=PORTS[(i + 1) % len(PORTS)],
+            status=['In-transit', 'Delivered', 'Not-boarded'][i % 3], **last_position(i),
+        )
+        for i in range(n_shipments)
+    ), batch_size)
+
+    def positions():
+        for i in range(n_shipments):
+            for ping in range(pings):
+                latitude, longitude = track_point(i, ping)
+                yield ShipmentPosition(
+                    shipment_id=f'S{i:07d}', recorded_at=now - timedelta(minutes=pings - 1 - ping),
+                    latitude=f'{latitude:.6f}', longitude=f'{longitude:.6f}', cell=grid_cell(latitude, longitude),
+                )
+
+    log(f"Seeding {pings * n_shipments} positions")
+    _bulk_insert(ShipmentPosition, positions(), batch_size)
+
+    log(f"Seeding {n_customers} customers")
+    _bulk_insert(Customer, (
+        Customer(
+            name=f'Customer {i}', email=f'customer{i}@benchmark.example', phone=f'+2557{i:08d}',
+            address=f'Plot {i}, {PORTS[i % len(PORTS)]}',
+        )
+        for i in range(n_customers)
+    ), batch_size)
+    customer_ids = list(Customer.objects.order_by('pk').values_list('pk', flat=True))
+
+    log(f"Seeding {n_parcels} parcels")
+    _bulk_insert(Parcel, (
+        Parcel(
+            parcel_no=f'P{k:08d}', shipment_id=f'S{k % n_shipments:07d}', customer_id=customer_ids[k % n_customers],
+            weight=2 + k % 50, volume=1, charge=Money(10_000 + k % 90_000, 'TZS'),
+            payment='Paid' if k % 4 == 0 else 'Unpaid', commodity_type=['Box', 'Parcel', 'Envelope'][k % 3],
+            description=f'{["Spare parts", "Textiles", "Electronics", "Frozen fish"][k % 4]} lot {k % 997}',
+            status=['In-transit', 'Delivered', 'Not-boarded'][(k % n_shipments) % 3],
+        )
+        for k in range(n_parcels)
+    ), batch_size)
+
+    log(f"Seeding {n_invoices} invoices")
+    total = Money(ITEMS_PER_INVOICE * 10_000, 'TZS')
+    _bulk_insert(Invoice, (
+        Invoice(
+            invoice_no=f'INV{j:07d}', customer_id=customer_ids[j % n_customers], due_date=now,
+            total_amount=total, final_amount=total, status=['Pending', 'Paid', 'Overdue'][j % 3],
+        )
+        for j in range(n_invoices)
+    ), batch_size)
+
+    def invoice_items():
+        for j in range(n_invoices):
+            c, round_no = j % n_customers, j // n_customers
+            for m in range(round_no * ITEMS_PER_INVOICE, (round_no + 1) * ITEMS_PER_INVOICE):
+                k = c + n_customers * m
+                if k >= n_parcels:
+                    break
+                yield InvoiceItem(invoice_id=f'INV{j:07d}', parcel_id=f'P{k:08d}', cost=Money(10_000, 'TZS'))
+
+    log("Seeding invoice items")
+    _bulk_insert(InvoiceItem, invoice_items(), batch_size)
+
+    log(f"Seeding {volumes['documents']} documents")
+    _bulk_insert(Document, (
+        Document(
+            document_no=f'D{i:07d}', shipment_id=f'S{i % n_shipments:07d}', customer_id=customer_ids[i % n_customers],
+            document_type=['Bill_of_lading', 'Packing_list', 'Customs_clearance', 'Other'][i % 4],
+            file=f'documents/benchmark_{i}.pdf',
+        )
+        for i in range(volumes['documents'])
+    ), batch_size)
+
+    Step.objects.bulk_create([Step(name=f'Step {i}', order=i) for i in range(8)])
+    Parameter.objects.bulk_create([
+        Parameter(category=category, name=f'{category} {i}', sort_order=i)
+        for category, _ in Parameter.CATEGORY_CHOICES for i in range(5)
+    ])
+
+    log("Rebuilding monthly stats and search entries")
+    rebuild_monthly_stats()
+    rebuild_search_index()
+
+    User.objects.create_superuser('bench-admin', 'admin@benchmark.example', PASSWORD)
+    staff = User.objects.create_user('bench-staff', 'staff@benchmark.example', PASSWORD)
+    staff.groups.add(Group.objects.get(name='staff'))
+    # The customer role sees the data of the customer with its email
+    User.objects.create_user('bench-customer', 'customer0@benchmark.example', PASSWORD)
+
+
+class Scenario:
+    """One request to benchmark.
+
+    ``data`` may be a callable taking the request number, for requests
+    that create objects and need unique values. ``iterations`` caps the
+    run count of expensive requests such as full exports. ``setup``, if
+    given, runs untimed before every request with the client and request
+    number, and returns the values ``path`` is formatted with.
+    """
+
+    def __init__(self, name, method, path, data=None, format=None, content_type=None, iterations=None,
+                 headers=None, setup=None):
+        self.name = name
+        self.method = method
+        self.path = path
+        self.data = data
+        self.format = format
+        self.content_type = content_type
+        self.iterations = iterations
+        self.headers = headers
+        self.setup = setup
+
+    def prepare(self, client, number):
+        return self.path.format(**self.setup(client, number)) if self.setup else self.path
+
+    def request(self, client, number, path=None):
+        path = path or self.path
+        data = self.data(number) if callable(self.data) else self.data
+        if self.content_type:
+            return client.generic(self.method, path, data, content_type=self.content_type, headers=self.headers)
+        return getattr(client, self.method.lower())(path, data, format=self.format)
+
+
+def get_scenarios():
+    """Every route of shipments/urls.py and accounts/urls.py, on customer 0's objects.
+
+    The exception is the events/ stream: it is only served by the ASGI
+    application and never ends, so the in-process WSGI client can neither
+    open nor time it.
+    """
+    customer_id = Customer.objects.order_by('pk').values_list('pk', flat=True).first()
+    step_id = Step.objects.values_list('pk', flat=True).first()
+    parameter_id = Parameter.objects.values_list('pk', flat=True).first()
+    run = f'{time.time_ns():x}'
+
+    def unique(prefix, number):
+        return f'{prefix}-{run}-{number}'
+
+    def upload_session(number):
+        return {
+            'filename': 'manifest.pdf', 'size': len(UPLOAD_CHUNK), 'checksum': UPLOAD_CHECKSUM,
+            'document': {'document_no': unique('DU', number), 'shipment': 'S0000000', 'document_type': 'Other'},
+        }
+
+    def open_upload(client, number, chunks=0):
+        """A new upload session of UPLOAD_CHUNK, with ``chunks`` (0 or 1) of it sent."""
+        response = client.post('/api/documents/uploads/', upload_session(number), format='json')
+        if response.status_code != 201:
+            # Customers may not upload; the timed request is refused the same way
+            return {'upload': uuid.UUID(int=0)}
+        path = f"/api/documents/uploads/{response.data['id']}/"
+        if chunks:
+            client.generic('PUT', path, UPLOAD_CHUNK, content_type='application/octet-stream', headers=UPLOAD_RANGE)
+        return {'upload': response.data['id']}
+
+    return [
+        Scenario('shipment-list', 'GET', '/api/shipments/'),
+        Scenario('shipment-list-filtered', 'GET', '/api/shipments/?status=Delivered&transport=Sea'),
+        Scenario('shipment-list-cursor', 'GET', '/api/shipments/?pagination=cursor'),
+        Scenario('shipment-create', 'POST', '/api/shipments/', lambda n: {
+            'shipment_no': unique('S', n), 'transport': 'Sea', 'vessel': VESSELS[0], 'weight': 10, 'volume': 1,
+            'origin': PORTS[0], 'destination': PORTS[1], 'status': 'In-transit',
+        }, format='json'),
+        Scenario('shipment-export', 'GET', '/api/shipments/export/', iterations=3),
+        Scenario('shipment-detail', 'GET', '/api/shipments/S0000000/'),
+        Scenario('shipment-customers', 'GET', '/api/shipments/S0000000/customers/'),
+        Scenario('shipment-bundle', 'GET', '/api/shipments/S0000000/bundle/', iterations=3),
+        Scenario('shipment-positions', 'GET', '/api/shipments/S0000000/positions/'),
+        Scenario('shipment-positions-cursor', 'GET', '/api/shipments/S0000000/positions/?pagination=cursor'),
+        Scenario('position-list', 'GET', '/api/positions/'),
+        Scenario('position-list-bbox', 'GET', '/api/positions/?bbox=25,-25,35,-15'),
+        Scenario('position-ingest', 'POST', '/api/positions/', lambda n: [
+            {
+                'shipment': f'S{i:07d}', 'recorded_at': (timezone.now() + timedelta(minutes=n)).isoformat(),
+                'latitude': track_point(i, n)[0], 'longitude': track_point(i, n)[1],
+            }
+            for i in range(100)
+        ], format='json'),
+        Scenario('customer-list', 'GET', '/api/customers/'),
+        Scenario('customer-create', 'POST', '/api/customers/', lambda n: {
+            'name': unique('Customer', n), 'email': f"{unique('c', n)}@benchmark.example",
+            'phone': '+255700000000', 'address': PORTS[0],
+        }, format='json'),
+        Scenario('customer-export', 'GET', '/api/customers/export/', iterations=3),
+        Scenario('customer-detail', 'GET', f'/api/customers/{customer_id}/'),
+        Scenario('customer-bundle', 'GET', f'/api/customers/{customer_id}/bundle/', iterations=3),
+        Scenario('parcel-list', 'GET', '/api/parcels/'),
+        Scenario('parcel-list-by-shipment', 'GET', '/api/parcels/?shipment=S0000000'),
+        Scenario('parcel-list-expanded', 'GET', '/api/parcels/?expand=customer_stats'),
+        Scenario('parcel-create', 'POST', '/api/parcels/', lambda n: {
+            'parcel_no': unique('P', n), 'shipment': 'S0000000', 'customer_id': customer_id,
+            'weight': 2, 'volume': 1, 'charge': '10000.00', 'commodity_type': 'Box',
+        }, format='json'),
+        Scenario('parcel-import', 'POST', '/api/parcels/import/', lambda n: ''.join(
+            json.dumps({
+                'parcel_no': unique(f'PI{i}', n), 'shipment': 'S0000000', 'customer_id': customer_id,
+                'weight': 2, 'volume': 1, 'charge': '10000.00',
+            }) + '\n'
+            for i in range(100)
+        ), content_type='application/x-ndjson'),
+        Scenario('parcel-export', 'GET', '/api/parcels/export/', iterations=3),
+        Scenario('parcel-detail', 'GET', '/api/parcels/P00000000/'),
+        Scenario('document-list', 'GET', '/api/documents/'),
+        Scenario('document-detail', 'GET', '/api/documents/D0000000/'),
+        Scenario('document-upload-create', 'POST', '/api/documents/uploads/', upload_session, format='json'),
+        Scenario(
+            'document-upload-chunk', 'PUT', '/api/documents/uploads/{upload}/', UPLOAD_CHUNK,
+            content_type='application/octet-stream', headers=UPLOAD_RANGE, setup=open_upload,
+        ),
+        Scenario('document-upload-resume', 'GET', '/api/documents/uploads/{upload}/', setup=open_upload),
+        Scenario(
+            'document-upload-commit', 'POST', '/api/documents/uploads/{upload}/commit/', {}, format='json',
+            setup=partial(open_upload, chunks=1),
+        ),
+        Scenario('invoice-list', 'GET', '/api/invoices/'),
+        Scenario('invoice-list-cursor', 'GET', '/api/invoices/?pagination=cursor'),
+        Scenario('invoice-create', 'POST', '/api/invoices/', lambda n: {
+            'invoice_no': unique('INV', n), 'customer_id': customer_id, 'due_date': timezone.now().isoformat(),
+        }, format='json'),
+        Scenario('invoice-export', 'GET', '/api/invoices/export/', iterations=3),
+        Scenario('invoice-detail', 'GET', '/api/invoices/INV0000000/'),
+        Scenario('invoice-pdf', 'GET', '/api/invoices/INV0000000/pdf/'),
+        Scenario('generate-invoice', 'GET', f'/api/customers/{customer_id}/generate-invoice/'),
+        Scenario('search', 'GET', '/api/search/?q=frozen+fish'),
+        Scenario('chart-data', 'GET', '/api/chart-data/'),
+        Scenario('step-list', 'GET', '/api/steps/'),
+        Scenario('step-active', 'GET', '/api/steps/active/'),
+        Scenario('step-detail', 'GET', f'/api/steps/{step_id}/'),
+        Scenario('parameter-list', 'GET', '/api/parameters/'),
+        Scenario('parameter-detail', 'GET', f'/api/parameters/{parameter_id}/'),
+        Scenario('user-profile', 'GET', '/api/users/me/'),
+        Scenario('login', 'POST', '/api/auth/login/', {'username': 'bench-customer', 'password': PASSWORD}, format='json'),
+        Scenario('refresh', 'POST', '/api/auth/refresh/', lambda n: {
+            'refresh': str(CustomTokenObtainPairSerializer.get_token(User.objects.get(username='bench-customer'))),
+        }, format='json'),
+        Scenario('register', 'POST', '/api/register/', lambda n: {
+            'username': unique('user', n), 'email': f"{unique('user', n)}@benchmark.example",
+            'password': PASSWORD, 'password2': PASSWORD,
+        }, format='json'),
+    ]
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+
+def measure(client, scenario, iterations):
+    """Run ``scenario`` once to warm up, then ``iterations`` timed times."""
+    timings, query_counts, status_code = [], [], None
+    for number in range(iterations + 1):
+        path = scenario.prepare(client, number)
+        # The query log is capped, so start every request with an empty one
+        connection.queries_log.clear()
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            response = scenario.request(client, number, path)
+            if response.streaming:
+                for _ in response.streaming_content:
+                    pass
+            elapsed = time.perf_counter() - started
+        if number:
+            timings.append(elapsed * 1000)
+            query_counts.append(len(queries.captured_queries))
+        status_code = response.status_code
+    return {
+        'status': status_code,
+        'p50_ms': round(percentile(timings, 50), 2),
+        'p95_ms': round(percentile(timings, 95), 2),
+        'queries': int(statistics.median(query_counts)),
+    }
+
+
+def run_benchmarks(iterations, roles=ROLES, log=print):
+    """Benchmark every scenario as every role. Returns {"<role> <scenario>": result}."""
+    users = {
+        'admin': User.objects.get(username='bench-admin'),
+        'staff': User.objects.get(username='bench-staff'),
+        'customer': User.objects.get(username='bench-customer'),
+    }
+    results = {}
+    for role in roles:
+        client = APIClient()
+        token = CustomTokenObtainPairSerializer.get_token(users[role]).access_token
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        for scenario in get_scenarios():
+            key = f'{role} {scenario.method} {scenario.name}'
+            results[key] = measure(client, scenario, min(iterations, scenario.iterations or iterations))
+            log(f"{key}: {results[key]}")
+    return results
+
+
+def compare(results, baseline, latency_threshold, query_threshold, latency_floor_ms):
+    """Describe every result that regressed against ``baseline``.
+
+    Latency regresses when p50 or p95 grows by more than
+    ``latency_threshold`` (a fraction) and by more than
+    ``latency_floor_ms``, which keeps timer noise on fast endpoints out.
+    Query counts regress when they grow by more than ``query_threshold``.
+    """
+    regressions = []
+    for key, result in results.items():
+        base = baseline.get(key)
+        if base is None:
+            continue
+        if result['status'] != base['status']:
+            regressions.append(f"{key}: status {base['status']} -> {result['status']}")
+        for metric in ('p50_ms', 'p95_ms'):
+            limit = max(base[metric] * (1 + latency_threshold), base[metric] + latency_floor_ms)
+            if result[metric] > limit:
+                regressions.append(f"{key}: {metric} {base[metric]} -> {result[metric]}")
+        if result['queries'] > base['queries'] + query_threshold:
+            regressions.append(f"{key}: queries {base['queries']} -> {result['queries']}")
+    return regressions
@@ -0,0 +1,130 @@
+"""Streamed ZIP archives of documents and invoice PDFs.
+
+The archive is written to an unseekable buffer that is drained after every
+chunk, so zipfile emits data descriptors instead of seeking back and the
+response never holds more than a chunk or two of compressed output.
+
+Headers are sent before the entries are known to be readable, so an entry
+that cannot be included is listed with its reason in a MISSING.txt at the
+end of the archive instead of silently left out.
+"""
+import logging
+import os
+import zipfile
+from collections import deque
+from functools import partial
+
+from django.conf import settings
+
+from .pdf_cache import build_invoice_payload, get_invoice_pdf
+
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+
+# Already compressed formats are stored; deflating them again only burns CPU
+STORED_EXTENSIONS = {'.pdf', '.zip', '.gz', '.jpg', '.jpeg', '.png', '.docx', '.xlsx'}
+
+
+class _Buffer:
+    """Write-only sink without tell()/seek(), drained by stream_zip."""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def stream_zip(entries, chunk_size=CHUNK_SIZE):
+    """Yield a ZIP archive of ``entries``, (name, datetime, opener) tuples.
+
+    ``opener`` returns a binary file object, which is read ``chunk_size``
+    bytes at a time. Entries whose opener raises OSError are listed in a
+    final MISSING.txt entry.
+    """
+    buffer = _Buffer()
+    missing = []
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED, compresslevel=6) as archive:
+        for name, modified, opener in entries:
+            try:
+                source = opener()
+            except OSError as e:
+                reason = e.strerror or str(e)
+                logger.warning(f"Listing {name} as missing in ZIP bundle: {reason}")
+                missing.append(f"{name}: {reason}")
+                continue
+
+            info = zipfile.ZipInfo(name, date_time=modified.timetuple()[:6])
+            if os.path.splitext(name)[1].lower() in STORED_EXTENSIONS:
+                info.compress_type = zipfile.ZIP_STORED
+            else:
+                info.compress_type = zipfile.ZIP_DEFLATED
+
+            with source, archive.open(info, 'w', force_zip64=True) as target:
+                for chunk in iter(partial(source.read, chunk_size), b''):
+                    target.write(chunk)
+                    data = buffer.drain()
+                    if data:
+                        yield data
+            yield buffer.drain()
+
+        if missing:
+            lines = ["These files could not be included in this archive:", *missing, ""]
+            archive.writestr('MISSING.txt', '\n'.join(lines))
+    yield buffer.drain()
+
+
+def document_entries(documents):
+    for document in documents.iterator():
+        if not document.file.name:
+            continue
+        name = f"documents/{document.document_no}_{os.path.basename(document.file.name)}"
+        yield name, document.issued_date, partial(document.file.storage.open, document.file.name, 'rb')
+
+
+def invoice_entries(invoices, lookahead=None):
+    """Entries for the invoice PDFs, rendered a few invoices ahead of the stream.
+
+    ``invoices`` must have their items and customer loaded, see
+    with_pdf_data. Payloads are built as the archive reaches them, and the
+    renders of the next ``lookahead`` invoices (twice the pool size by
+    default) run in the PDF pool while the current ones are streamed.
+    """
+    if lookahead is None:
+        lookahead = 2 * settings.PDF_RENDER_WORKERS
+    invoices = invoices.iterator(chunk_size=100)
+    queued = deque()
+
+    def queue_next():
+        invoice = next(invoices, None)
+        if invoice is not None:
+            payload = build_invoice_payload(invoice)
+            get_invoice_pdf(payload, timeout=0)
+            queued.append((invoice, payload))
+        return invoice is not None
+
+    while len(queued) < lookahead and queue_next():
+        pass
+    while queued:
+        invoice, payload = queued.popleft()
+        queue_next()
+        name = f"invoices/invoice_{invoice.invoice_no}.pdf"
+        yield name, invoice.issue_date, partial(_open_rendered, payload)
+
+
+def _open_rendered(payload):
+    path = get_invoice_pdf(payload)
+    if path is None:
+        raise OSError("the PDF render timed out; download the bundle again shortly")
+    return open(path, 'rb')
@@ -1,5 +1,7 @@
 import django_filters
-from .models import Invoice
+from django import forms
+from .geo import parse_bbox
+from .models import Invoice, Shipment, ShipmentPosition
 
 class InvoiceFilter(django_filters.FilterSet):
     shipment_no = django_filters.CharFilter(field_name='shipment__shipment_no', lookup_expr='icontains')
@@ -9,3 +11,41 @@ class InvoiceFilter(django_filters.FilterSet):
     class Meta:
         model = Invoice
         fields = ['invoice_no', 'shipment_no', 'customer_name', 'customer_id']
+
+
+class BoundingBoxField(forms.CharField):
+    def to_python(self, value):
+        value = super().to_python(value)
+        if not value:
+            return None
+        try:
+            return parse_bbox(value)
+        except ValueError as e:
+            raise forms.ValidationError(str(e))
+
+
+class BoundingBoxFilter(django_filters.Filter):
+    field_class = BoundingBoxField
+
+
+class BoundingBoxFilterSet(django_filters.FilterSet):
+    """Adds ``?bbox=west,south,east,north`` through the queryset's ``within``."""
+    bbox = BoundingBoxFilter(method='filter_bbox')
+
+    def filter_bbox(self, queryset, name, value):
+        return queryset.within(*value)
+
+
+class LatestPositionFilter(BoundingBoxFilterSet):
+    class Meta:
+        model = Shipment
+        fields = ['bbox', 'transport', 'status']
+
+
+class ShipmentPositionFilter(BoundingBoxFilterSet):
+    since = django_filters.IsoDateTimeFilter(field_name='recorded_at', lookup_expr='gte')
+    until = django_filters.IsoDateTimeFilter(field_name='recorded_at', lookup_expr='lte')
+
+    class Meta:
+        model = ShipmentPosition
+        fields = ['bbox', 'since', 'until']
@@ -0,0 +1,68 @@
+"""Grid index for shipment positions.
+
+The globe is cut into GRID_DEGREES square cells numbered row by row from
+the south-west corner, and each position stores its cell number in an
+indexed integer column. A bounding box then becomes one range of cell
+numbers per grid row, which any database, SQLite included, answers from
+a plain B-tree index; the exact latitude and longitude bounds are applied
+to the rows found.
+"""
+from django.db.models import Q
+
+
+GRID_DEGREES = 0.5
+GRID_ROWS = int(180 / GRID_DEGREES)
+GRID_COLUMNS = int(360 / GRID_DEGREES)
+# Taller boxes use a single range from their first to their last cell
+MAX_ROW_RANGES = 32
+
+
+def grid_row(latitude):
+    return min(int((float(latitude) + 90) // GRID_DEGREES), GRID_ROWS - 1)
+
+
+def grid_column(longitude):
+    return min(int((float(longitude) + 180) // GRID_DEGREES), GRID_COLUMNS - 1)
+
+
+def grid_cell(latitude, longitude):
+    if latitude is None or longitude is None:
+        return None
+    return grid_row(latitude) * GRID_COLUMNS + grid_column(longitude)
+
+
+def parse_bbox(value):
+    """Parse ``west,south,east,north`` in degrees. Raises ValueError."""
+    try:
+        west, south, east, north = (float(part) for part in value.split(','))
+    except ValueError:
+        raise ValueError("bbox must be four numbers: west,south,east,north.")
+    if not (-90 <= south <= north <= 90 and -180 <= west <= 180 and -180 <= east <= 180):
+        raise ValueError("bbox is outside the valid latitude and longitude ranges.")
+    return west, south, east, north
+
+
+def bbox_filter(west, south, east, north, cell_field='cell'):
+    """Q for the rows whose ``latitude`` and ``longitude`` lie inside the box.
+
+    ``cell_field`` names the indexed grid cell column. A box whose west edge
+    is east of its east edge crosses the antimeridian.
+    """
+    if west > east:
+        return bbox_filter(west, south, 180, north, cell_field) | bbox_filter(-180, south, east, north, cell_field)
+
+    first_row, last_row = grid_row(south), grid_row(north)
+    first_column, last_column = grid_column(west), grid_column(east)
+    if last_row - first_row < MAX_ROW_RANGES:
+        cells = Q()
+        for row in range(first_row, last_row + 1):
+            start = row * GRID_COLUMNS
+            cells |= Q(**{f'{cell_field}__range': (start + first_column, start + last_column)})
+    else:
+        cells = Q(**{f'{cell_field}__range': (
+            first_row * GRID_COLUMNS + first_column, last_row * GRID_COLUMNS + last_column,
+        )})
+    return cells & Q(**{
+        'latitude__range': (south, north),
+        'longitude__range': (west, east),
+    })
@@ -0,0 +1,59 @@
+"""Bulk parcel import from CSV or NDJSON manifests."""
+from django.db import transaction
+from django.utils import timezone
+
+from .ingest import ingest, reject
+from .models import Shipment, Customer, Parcel
+from .search import index_objects
+from .serializers import ParcelImportSerializer
+
+
+def import_parcels(rows, chunk_size=1000):
+    """Insert parcel rows, see shipments.ingest. Returns the report, with a 'created' count.
+
+    Each chunk resolves its shipments, customers and existing parcel numbers
+    with one query apiece.
+    """
+    return ingest(rows, _import_chunk, 'created', chunk_size)
+
+
+def _import_chunk(chunk, report):
+    rows = [row for _, row in chunk if isinstance(row, dict)]
+    shipment_ids = {str(row['shipment']) for row in rows if row.get('shipment')}
+    customer_ids = {str(row['customer_id']) for row in rows if str(row.get('customer_id', '')).isdigit()}
+    parcel_nos = {str(row['parcel_no']) for row in rows if row.get('parcel_no')}
+
+    context = {
+        'shipments': Shipment.objects.in_bulk(shipment_ids),
+        'customers': {str(pk): customer for pk, customer in Customer.objects.in_bulk(customer_ids).items()},
+    }
+    taken = set(Parcel.objects.filter(pk__in=parcel_nos).values_list('pk', flat=True))
+
+    parcels = []
+    for number, row in chunk:
+        if not isinstance(row, dict):
+            reject(report, number, row, 'parcel_no')
+            continue
+        serializer = ParcelImportSerializer(data=row, context=context)
+        if not serializer.is_valid():
+            reject(report, number, row, 'parcel_no', serializer.errors)
+            continue
+        parcel = Parcel(**serializer.validated_data)
+        if parcel.parcel_no in taken:
+            reject(report, number, row, 'parcel_no', {'parcel_no': ['parcel with this parcel no already exists.']})
+            continue
+        taken.add(parcel.parcel_no)
+        parcel.status = parcel.shipment.status
+        parcels.append(parcel)
+
+    if not parcels:
+        return
+    with transaction.atomic():
+        Parcel.objects.bulk_create(parcels)
+        # bulk_create skips the post_save signals that index the parcels
+        # and touch the parents
+        index_objects('parcel', parcels)
+        now = timezone.now()
+        Shipment.objects.filter(pk__in={parcel.shipment_id for parcel in parcels}).update(updated_at=now)
+        Customer.objects.filter(pk__in={parcel.customer_id for parcel in parcels}).update(updated_at=now)
+    report['created'] += len(parcels)
@@ -0,0 +1,61 @@
+"""Chunked bulk ingest shared by the parcel import and the position feed.
+
+Rows come from a JSON array or are read line by line from an NDJSON or CSV
+body, and are handed to the caller in numbered chunks: each chunk resolves
+what it refers to with a few queries and is stored with one bulk_create.
+The report counts the stored and rejected rows and lists the errors of
+each rejected row by its number, counted from 1.
+"""
+import csv
+import json
+from itertools import islice
+
+
+NDJSON_TYPES = ('application/x-ndjson', 'application/jsonlines')
+
+
+def iter_lines(stream):
+    """Decode a binary stream (upload or request body) line by line."""
+    for line in stream:
+        yield line.decode('utf-8-sig') if isinstance(line, bytes) else line
+
+
+def iter_csv_rows(lines):
+    for row in csv.DictReader(lines):
+        yield {key.strip(): value for key, value in row.items() if key}
+
+
+def iter_ndjson_rows(lines):
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError:
+            yield line
+
+
+def ingest(rows, ingest_chunk, counter, chunk_size=1000, counters=()):
+    """Call ``ingest_chunk(chunk, report)`` with lists of up to ``chunk_size`` (number, row) pairs.
+
+    ``ingest_chunk`` adds the rows it stores to ``report[counter]`` and
+    passes the others to reject(); ``counters`` names further counts it
+    keeps. Returns the report.
+    """
+    report = {counter: 0, **dict.fromkeys(counters, 0), 'failed': 0, 'errors': []}
+    numbered = enumerate(rows, start=1)
+    while chunk := list(islice(numbered, chunk_size)):
+        ingest_chunk(chunk, report)
+    return report
+
+
+def reject(report, number, row, key, errors=None):
+    """List row ``number`` in the report, named by its ``key`` field; no errors means it is no object."""
+    is_object = isinstance(row, dict)
+    report['failed'] += 1
+    report['errors'].append({
+        'row': number,
+        key: row.get(key) if is_object else None,
+        'errors': errors if is_object else {'non_field_errors': ['Row is not a valid JSON object.']},
+    })
@@ -0,0 +1,75 @@
+import threading
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Invoice, InvoiceItem, Parcel
+
+
+_local = threading.local()
+
+
+def bill_unbilled_parcels(invoice, batch_size=500):
+    """Add every unbilled parcel of the invoice's customer as an item.
+
+    The parcels are selected in one query and inserted with bulk_create, so
+    InvoiceItem.save() and its per-item total recalculation never run. The
+    totals are then refreshed once. Returns the number of items created.
+    """
+    with transaction.atomic():
+        parcels = Parcel.objects.filter(
+            customer_id=invoice.customer_id, invoice_items__isnull=True
+        ).only('parcel_no', 'charge', 'charge_currency')
+
+        items = [InvoiceItem(invoice=invoice, parcel=parcel, cost=parcel.charge) for parcel in parcels]
+        InvoiceItem.objects.bulk_create(items, batch_size=batch_size)
+
+        update_invoice_totals(invoice)
+    return len(items)
+
+
+def update_invoice_totals(invoice):
+    """Recompute total_amount and final_amount with a single SQL Sum."""
+    invoice.calculate_total_amount()
+    invoice.calculate_final_amount()
+    Invoice.objects.filter(pk=invoice.pk).update(
+        total_amount=invoice.total_amount,
+        final_amount=invoice.final_amount,
+        updated_at=timezone.now(),
+    )
+
+
+class _DirtyInvoices:
+    """on_commit callback that recalculates each collected invoice once."""
+
+    def __init__(self):
+        self.invoice_ids = set()
+
+    def __call__(self):
+        if getattr(_local, 'dirty', None) is self:
+            del _local.dirty
+        for invoice in Invoice.objects.filter(pk__in=self.invoice_ids):
+            update_invoice_totals(invoice)
+
+
+def mark_invoice_dirty(invoice_id):
+    """Schedule a totals recalculation for the invoice.
+
+    Inside a transaction the invoice is only marked dirty, and every dirty
+    invoice is recalculated once when the outermost transaction commits, so
+    saving n items costs one recalculation instead of n. Outside a
+    transaction the totals are recalculated immediately.
+    """
+    connection = transaction.get_connection()
+    if not connection.in_atomic_block:
+        for invoice in Invoice.objects.filter(pk=invoice_id):
+            update_invoice_totals(invoice)
+        return
+
+    # A rollback discards the registered callback, so start a new batch
+    # whenever ours is no longer pending on the connection.
+    dirty = getattr(_local, 'dirty', None)
+    if dirty is None or not any(callback is dirty for _, callback, _ in connection.run_on_commit):
+        dirty = _local.dirty = _DirtyInvoices()
+        transaction.on_commit(dirty)
+    dirty.invoice_ids.add(invoice_id)
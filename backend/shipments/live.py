@@ -0,0 +1,237 @@
+"""Live shipment updates pushed over Server-Sent Events.
+
+Changes to the status, steps or position of a shipment are published to
+a broker once their transaction commits. Every open /api/events/ stream
+holds a Subscription and forwards the events its user may see: admins and
+staff see every shipment, customers the shipments carrying their parcels.
+
+Every event gets an increasing id, and the broker keeps the last
+LIVE_UPDATES_REPLAY_EVENTS of them, so a client reconnecting with
+``Last-Event-ID`` first receives what it missed; if that is no longer
+buffered it is sent a ``resync`` event instead.
+
+InMemoryBroker fans events out within one process, which covers a single
+ASGI worker and the tests. With several workers LIVE_UPDATES_BROKER is
+RedisBroker, which relays them through Redis pub/sub (requires the redis
+package).
+"""
+import asyncio
+import json
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+from .models import Parcel
+
+
+# Shipment fields whose changes are pushed
+LIVE_FIELDS = ('status', 'steps', 'latitude', 'longitude')
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+class Subscription:
+    """The queue of one stream and the events it may receive.
+
+    ``email`` is None for admins and staff, whose streams are unfiltered.
+    ``shipments`` optionally narrows the stream to some shipment numbers.
+    """
+
+    def __init__(self, loop, email=None, shipments=None, maxsize=100):
+        self.loop = loop
+        self.email = email
+        self.shipments = shipments
+        self.queue = asyncio.Queue(maxsize)
+
+    def wants(self, event):
+        if self.shipments and event['shipment_no'] not in self.shipments:
+            return False
+        return self.email is None or self.email in event['customers']
+
+    def deliver(self, events):
+        # Runs on the stream's event loop. A client too slow to keep up is
+        # told to reload instead of holding an ever longer backlog.
+        if self.queue.full():
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            events = [{'type': 'resync'}]
+        self.queue.put_nowait(events)
+
+
+class InMemoryBroker:
+    """Fans events out to the subscriptions of this process."""
+
+    def __init__(self):
+        self.subscriptions = set()
+        self.lock = threading.Lock()
+        self.recent = deque(maxlen=settings.LIVE_UPDATES_REPLAY_EVENTS)
+        self.last_id = 0
+
+    def subscribe(self, subscription, last_event_id=None):
+        """Add ``subscription`` and return the events it missed after ``last_event_id``."""
+        with self.lock:
+            self.subscriptions.add(subscription)
+            if last_event_id is None or last_event_id == self.last_id:
+                return []
+            if last_event_id > self.last_id or not self.recent or self.recent[0]['id'] > last_event_id + 1:
+                # Gone from the buffer, or an id from before a restart
+                return [{'type': 'resync'}]
+            return [event for event in self.recent if event['id'] > last_event_id and subscription.wants(event)]
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            self.subscriptions.discard(subscription)
+
+    def publish(self, events):
+        with self.lock:
+            for event in events:
+                self.last_id += 1
+                event['id'] = self.last_id
+        self.dispatch(events)
+
+    def dispatch(self, events):
+        with self.lock:
+            self.recent.extend(events)
+            self.last_id = max(self.last_id, events[-1]['id'])
+            subscriptions = list(self.subscriptions)
+        for subscription in subscriptions:
+            wanted = [event for event in events if subscription.wants(event)]
+            if not wanted:
+                continue
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.deliver, wanted)
+            except RuntimeError:
+                # The stream's loop is closed
+                self.unsubscribe(subscription)
+
+
+class RedisBroker(InMemoryBroker):
+    """Publishes through a Redis channel that a listener thread relays to this process.
+
+    Event ids come from a Redis counter so they are shared by all workers.
+    """
+    channel = 'shipments:live'
+    counter = 'shipments:live:id'
+
+    def __init__(self):
+        import redis
+
+        super().__init__()
+        self.redis = redis.Redis.from_url(settings.LIVE_UPDATES_REDIS_URL)
+        self.listener = None
+
+    def subscribe(self, subscription, last_event_id=None):
+        with self.lock:
+            if self.listener is None:
+                self.listener = threading.Thread(target=self.listen, name='live-updates', daemon=True)
+                self.listener.start()
+        return super().subscribe(subscription, last_event_id)
+
+    def publish(self, events):
+        last_id = self.redis.incrby(self.counter, len(events))
+        for number, event in enumerate(events, last_id - len(events) + 1):
+            event['id'] = number
+        self.redis.publish(self.channel, json.dumps(events, cls=DjangoJSONEncoder))
+
+    def listen(self):
+        pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(self.channel)
+        for message in pubsub.listen():
+            self.dispatch(json.loads(message['data']))
+
+
+def get_broker():
+    global _broker
+    with _broker_lock:
+        if _broker is None:
+            _broker = import_string(settings.LIVE_UPDATES_BROKER)()
+        return _broker
+
+
+def _customer_emails(shipment_nos):
+    emails = {shipment_no: [] for shipment_no in shipment_nos}
+    rows = Parcel.objects.filter(shipment_id__in=shipment_nos).values_list('shipment_id', 'customer__email').distinct()
+    for shipment_no, email in rows:
+        emails[shipment_no].append(email)
+    return emails
+
+
+def _coordinate(value):
+    return None if value is None else str(value)
+
+
+def _publish_on_commit(events):
+    if events:
+        transaction.on_commit(lambda: get_broker().publish(events))
+
+
+def publish_shipments(shipments):
+    """Push the live fields of ``shipments`` once the transaction commits."""
+    emails = _customer_emails([shipment.pk for shipment in shipments])
+    _publish_on_commit([
+        {
+            'type': 'shipment',
+            'shipment_no': shipment.pk,
+            'status': shipment.status,
+            'steps': shipment.steps,
+            'latitude': _coordinate(shipment.latitude),
+            'longitude': _coordinate(shipment.longitude),
+            'customers': emails[shipment.pk],
+        }
+        for shipment in shipments
+    ])
+
+
+def publish_positions(positions):
+    """Push new ShipmentPosition pings once the transaction commits."""
+    emails = _customer_emails({position.shipment_id for position in positions})
+    _publish_on_commit([
+        {
+            'type': 'position',
+            'shipment_no': position.shipment_id,
+            'recorded_at': position.recorded_at.isoformat(),
+            'latitude': _coordinate(position.latitude),
+            'longitude': _coordinate(position.longitude),
+            'customers': emails[position.shipment_id],
+        }
+        for position in positions
+    ])
+
+
+def format_event(event):
+    data = {key: value for key, value in event.items() if key not in ('id', 'customers')}
+    line = f"id: {event['id']}\n" if 'id' in event else ''
+    return f"{line}event: {event['type']}\ndata: {json.dumps(data, cls=DjangoJSONEncoder)}\n\n"
+
+
+async def event_stream(subscription, expires_at, last_event_id=None):
+    """Server-Sent Events for ``subscription`` until ``expires_at`` (a timestamp).
+
+    The events missed since ``last_event_id`` are sent first. Comment lines
+    are sent every LIVE_UPDATES_HEARTBEAT_SECONDS so proxies keep the
+    connection open; the client reconnects after the stream ends.
+    """
+    broker = get_broker()
+    missed = broker.subscribe(subscription, last_event_id)
+    try:
+        yield 'retry: 5000\n\n'
+        for event in missed:
+            yield format_event(event)
+        while (remaining := expires_at - time.time()) > 0:
+            try:
+                events = await asyncio.wait_for(
+                    subscription.queue.get(), timeout=min(settings.LIVE_UPDATES_HEARTBEAT_SECONDS, remaining),
+                )
+            except asyncio.TimeoutError:
+                yield ': keep-alive\n\n'
+                continue
+            for event in events:
+                yield format_event(event)
+    finally:
+        broker.unsubscribe(subscription)
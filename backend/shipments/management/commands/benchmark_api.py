@@ -0,0 +1,88 @@
+import json
+import logging
+import os
+import tempfile
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+
+from shipments.benchmarks import DEFAULT_VOLUMES, ROLES, compare, run_benchmarks, seed
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a throwaway test database, benchmark every API endpoint as admin, staff and "
+        "customer, and compare p50/p95 latency and query counts against a JSON baseline."
+    )
+
+    def add_arguments(self, parser):
+        for name, default in DEFAULT_VOLUMES.items():
+            parser.add_argument(f'--{name}', type=int, default=default, help=f"Rows to seed (default {default}).")
+        parser.add_argument('--iterations', type=int, default=20, help="Timed requests per endpoint and role.")
+        parser.add_argument('--role', action='append', choices=ROLES, help="Only benchmark these roles.")
+        parser.add_argument(
+            '--baseline', default=os.path.join(settings.BASE_DIR, 'benchmarks', 'api_baseline.json'),
+            help="Baseline JSON file.",
+        )
+        parser.add_argument('--update-baseline', action='store_true', help="Write the results as the new baseline.")
+        parser.add_argument(
+            '--latency-threshold', type=float, default=0.25,
+            help="Allowed relative p50/p95 growth before failing (default 0.25).",
+        )
+        parser.add_argument(
+            '--latency-floor', type=float, default=5.0,
+            help="Latency growth in ms that is always tolerated (default 5).",
+        )
+        parser.add_argument('--query-threshold', type=int, default=0, help="Allowed extra queries per request.")
+
+    def handle(self, *args, **options):
+        volumes = {name: options[name] for name in DEFAULT_VOLUMES}
+        baseline = None
+        if os.path.exists(options['baseline']) and not options['update_baseline']:
+            with open(options['baseline']) as f:
+                baseline = json.load(f)
+            if baseline['volumes'] != volumes:
+                raise CommandError(
+                    f"The baseline was recorded with volumes {baseline['volumes']}; "
+                    f"rerun with those or pass --update-baseline."
+                )
+
+        log = self.stdout.write if options['verbosity'] > 1 else (lambda message: None)
+        results = self.run(volumes, options['iterations'], options['role'] or ROLES, log)
+        self.stdout.write(json.dumps(results, indent=2))
+
+        if baseline is None:
+            os.makedirs(os.path.dirname(options['baseline']), exist_ok=True)
+            with open(options['baseline'], 'w') as f:
+                json.dump({'volumes': volumes, 'iterations': options['iterations'], 'results': results}, f, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Wrote baseline {options['baseline']}."))
+            return
+
+        regressions = compare(
+            results, baseline['results'],
+            options['latency_threshold'], options['query_threshold'], options['latency_floor'],
+        )
+        if regressions:
+            raise CommandError("Benchmark regressions:\n" + "\n".join(regressions))
+        self.stdout.write(self.style.SUCCESS(f"No regressions against {options['baseline']}."))
+
+    def run(self, volumes, iterations, roles, log):
+        setup_test_environment()
+        old_name = connection.settings_dict['NAME']
+        # Seeding and the requests that create objects must not touch real data
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        logging.disable(logging.WARNING)
+        try:
+            with tempfile.TemporaryDirectory() as scratch, override_settings(
+                CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+                INVOICE_PDF_CACHE_DIR=os.path.join(scratch, 'invoices'),
+                MEDIA_ROOT=os.path.join(scratch, 'media'),
+            ):
+                seed(volumes, log=log)
+                return run_benchmarks(iterations, roles, log=log)
+        finally:
+            logging.disable(logging.NOTSET)
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
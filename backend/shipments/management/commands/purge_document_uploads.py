@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from shipments.uploads import purge_expired_uploads
+
+
+class Command(BaseCommand):
+    help = "Delete chunked document uploads left idle for DOCUMENT_UPLOAD_EXPIRY_SECONDS, with their chunks."
+
+    def handle(self, *args, **options):
+        count = purge_expired_uploads()
+        self.stdout.write(self.style.SUCCESS(f"Purged {count} document uploads."))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from shipments.search import rebuild_search_index
+
+
+class Command(BaseCommand):
+    help = "Rebuild the search entries of all shipments, parcels and customers."
+
+    def handle(self, *args, **options):
+        count = rebuild_search_index()
+        self.stdout.write(self.style.SUCCESS(f"Indexed {count} search entries."))
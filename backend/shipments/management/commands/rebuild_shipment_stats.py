@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from shipments.stats import rebuild_monthly_stats
+
+
+class Command(BaseCommand):
+    help = "Rebuild the ShipmentMonthlyStats rollup from the shipments table."
+
+    def handle(self, *args, **options):
+        count = rebuild_monthly_stats()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {count} monthly stats rows."))
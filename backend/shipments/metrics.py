@@ -0,0 +1,67 @@
+"""Prometheus metrics for the API, served at /api/metrics/.
+
+Samples are kept by prometheus_client. When PROMETHEUS_MULTIPROC_DIR points
+at an empty directory shared by the gunicorn workers (set it in the
+environment before gunicorn starts and empty it on every restart), each
+worker writes its samples to memory-mapped files there and the endpoint
+adds them up, so a scrape sees the whole server whichever worker answers.
+Only counters and histograms are used, so dead workers need no cleanup.
+"""
+import os
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST as CONTENT_TYPE, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest, multiprocess,
+)
+
+
+REQUEST_LABELS = ('view', 'method', 'role')
+
+REQUEST_LATENCY = Histogram(
+    'api_request_duration_seconds', 'Time until the response of an API request is ready.',
+    REQUEST_LABELS, buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+REQUEST_QUERIES = Histogram(
+    'api_request_queries', 'SQL statements run by an API request.',
+    REQUEST_LABELS, buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100, 200),
+)
+RESPONSES = Counter(
+    'api_responses', 'API responses by status class; 4xx and 5xx make up the error rate.',
+    REQUEST_LABELS + ('status',),
+)
+PAGE_SIZE = Histogram(
+    'api_page_size', 'Rows on each page of a paginated list.',
+    ('view', 'pagination'), buckets=(0, 1, 5, 10, 25, 50, 100),
+)
+PDF_RENDER = Histogram(
+    'invoice_pdf_render_seconds', 'Time from queueing an invoice PDF render until the file is written.',
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+CACHE_LOOKUPS = Counter('cache_lookups', 'Cache lookups by cache and result.', ('cache', 'result'))
+
+
+def view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unmatched'
+    return match.url_name or 'unnamed'
+
+
+def record_cache_lookup(cache, hit):
+    CACHE_LOOKUPS.labels(cache, 'hit' if hit else 'miss').inc()
+
+
+def status_class(status_code):
+    return f'{status_code // 100}xx'
+
+
+def get_registry():
+    if 'PROMETHEUS_MULTIPROC_DIR' not in os.environ:
+        return REGISTRY
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+
+def render_metrics():
+    """The current samples of every worker in the Prometheus text format."""
+    return generate_latest(get_registry())
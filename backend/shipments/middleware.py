@@ -0,0 +1,218 @@
+"""Per-request SQL and timing instrumentation.
+
+MetricsMiddleware feeds the Prometheus request metrics of every request,
+see shipments.metrics.
+
+While SystemSettings.request_timing_enabled is on, RequestTimingMiddleware
+records the query count, DB time, view time and render time of each
+request, answers with a ``Server-Timing`` header and logs one JSON line
+with the slowest statements. View time is the time the DRF handler of a
+BaseUserView spends outside SQL, which is mostly serialization; the views
+report it through current_timings(). Streaming responses are measured until their
+content is exhausted; their header only covers the work done before the
+first byte.
+"""
+import heapq
+import json
+import logging
+import time
+from contextlib import ExitStack
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+
+from accounts.utils import get_user_role, request_timing_enabled
+from . import metrics
+
+
+logger = logging.getLogger(__name__)
+
+_current = ContextVar('request_timings', default=None)
+
+
+class RequestTimings:
+    """execute_wrapper that times every statement of one request."""
+
+    def __init__(self, slowest_count):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.view_time = 0.0
+        self.render_time = 0.0
+        self.slowest_count = slowest_count
+        self.slowest = []
+        self.handler_started = None
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.queries += 1
+            self.db_time += elapsed
+            # Min-heap of (duration, sequence, sql) keeps the slowest statements
+            entry = (elapsed, self.queries, sql)
+            if len(self.slowest) < self.slowest_count:
+                heapq.heappush(self.slowest, entry)
+            else:
+                heapq.heappushpop(self.slowest, entry)
+
+    def start_handler(self):
+        self.handler_started = (time.perf_counter(), self.db_time)
+
+    def finish_handler(self):
+        if self.handler_started is not None:
+            started, db_time = self.handler_started
+            self.view_time += time.perf_counter() - started - (self.db_time - db_time)
+            self.handler_started = None
+
+    def wrap_connections(self, stack):
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(self))
+
+    def server_timing(self):
+        total = time.perf_counter() - self.started
+        return ', '.join([
+            f'db;dur={self.db_time * 1000:.1f};desc="{self.queries} queries"',
+            f'view;dur={self.view_time * 1000:.1f};desc="outside SQL"',
+            f'render;dur={self.render_time * 1000:.1f}',
+            f'total;dur={total * 1000:.1f}',
+        ])
+
+    def log(self, request, response, streamed=False):
+        logger.info(json.dumps({
+            'event': 'request_timing',
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'streamed': streamed,
+            'total_ms': round((time.perf_counter() - self.started) * 1000, 1),
+            'db_ms': round(self.db_time * 1000, 1),
+            'queries': self.queries,
+            'view_ms': round(self.view_time * 1000, 1),
+            'render_ms': round(self.render_time * 1000, 1),
+            'slowest': [
+                {'ms': round(elapsed * 1000, 1), 'sql': sql[:500]}
+                for elapsed, _, sql in sorted(self.slowest, reverse=True)
+            ],
+        }))
+
+
+class QueryCounter:
+    """execute_wrapper that only counts statements."""
+
+    def __init__(self):
+        self.queries = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.queries += 1
+        return execute(sql, params, many, context)
+
+
+def current_timings():
+    """The RequestTimings of the current request, or None while timing is off."""
+    return _current.get()
+
+
+class RequestTimingMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.slowest_count = getattr(settings, 'REQUEST_TIMING_SLOWEST_QUERIES', 3)
+
+    def __call__(self, request):
+        if not request_timing_enabled():
+            return self.get_response(request)
+
+        timings = RequestTimings(self.slowest_count)
+        token = _current.set(timings)
+        stack = ExitStack()
+        try:
+            timings.wrap_connections(stack)
+            response = self.get_response(request)
+            response['Server-Timing'] = timings.server_timing()
+        except BaseException:
+            stack.close()
+            raise
+        finally:
+            _current.reset(token)
+
+        if response.streaming and not response.is_async:
+            response.streaming_content = MeasuredStream(
+                response.streaming_content, lambda: self.finish(request, response, timings, stack, streamed=True)
+            )
+        else:
+            self.finish(request, response, timings, stack)
+        return response
+
+    def process_template_response(self, request, response):
+        timings = _current.get()
+        if timings is not None:
+            started = time.perf_counter()
+
+            def rendered(response):
+                timings.render_time += time.perf_counter() - started
+            response.add_post_render_callback(rendered)
+        return response
+
+    def finish(self, request, response, timings, stack, streamed=False):
+        stack.close()
+        timings.log(request, response, streamed=streamed)
+
+
+class MeasuredStream:
+    """Streaming content that keeps the timings open until the body is sent.
+
+    ``on_close`` runs once, when the content is exhausted or the response
+    is closed, whichever comes first.
+    """
+
+    def __init__(self, content, on_close):
+        self.content = content
+        self.on_close = on_close
+        self.closed = False
+
+    def __iter__(self):
+        try:
+            yield from self.content
+        finally:
+            self.close()
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.on_close()
+
+
+class MetricsMiddleware:
+    """Records latency, query count and status of each request per view, method and role.
+
+    Latency is measured until the response is returned, so streaming
+    responses only count the time to their first byte.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        counter = QueryCounter()
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(counter))
+            response = self.get_response(request)
+        elapsed = time.perf_counter() - started
+
+        labels = (metrics.view_name(request), request.method, self.role(request))
+        metrics.REQUEST_LATENCY.labels(*labels).observe(elapsed)
+        metrics.REQUEST_QUERIES.labels(*labels).observe(counter.queries)
+        metrics.RESPONSES.labels(*labels, metrics.status_class(response.status_code)).inc()
+        return response
+
+    def role(self, request):
+        # DRF copies the user it authenticated onto the Django request
+        user = getattr(request, 'user', None)
+        if user is None or not user.is_authenticated:
+            return 'anonymous'
+        return get_user_role(user)
@@ -0,0 +1,79 @@
+# Generated by Django 5.1.7 on 2026-10-17 03:18
+
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import Count, DateField, F, Min, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Least, TruncMonth
+
+
+def backfill_created_at(apps, schema_editor):
+    """Date existing shipments by their earliest document or invoice.
+
+    Shipments had no timestamp before this migration. Those without
+    documents or invoiced parcels keep the migration time as created_at.
+    """
+    Shipment = apps.get_model('shipments', 'Shipment')
+    Document = apps.get_model('shipments', 'Document')
+    InvoiceItem = apps.get_model('shipments', 'InvoiceItem')
+
+    first_document = Subquery(
+        Document.objects.filter(shipment=OuterRef('pk')).order_by()
+        .values('shipment').annotate(first=Min('issued_date')).values('first')
+    )
+    first_invoice = Subquery(
+        InvoiceItem.objects.filter(parcel__shipment=OuterRef('pk')).order_by()
+        .values('parcel__shipment').annotate(first=Min('invoice__issue_date')).values('first')
+    )
+    # Least() is NULL if either side is, so each side falls back to the other
+    Shipment.objects.update(created_at=Coalesce(
+        Least(Coalesce(first_document, first_invoice), Coalesce(first_invoice, first_document)),
+        F('created_at'),
+    ))
+
+
+def build_monthly_stats(apps, schema_editor):
+    Shipment = apps.get_model('shipments', 'Shipment')
+    ShipmentMonthlyStats = apps.get_model('shipments', 'ShipmentMonthlyStats')
+
+    rows = (
+        Shipment.objects.order_by()
+        .annotate(month=TruncMonth('created_at', output_field=DateField()))
+        .values('month', 'transport', 'vessel')
+        .annotate(shipment_count=Count('pk'))
+    )
+    ShipmentMonthlyStats.objects.bulk_create(
+        [ShipmentMonthlyStats(**row) for row in rows], batch_size=500
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shipments', '0002_create_groups'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='shipment',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.CreateModel(
+            name='ShipmentMonthlyStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField()),
+                ('transport', models.CharField(max_length=100)),
+                ('vessel', models.CharField(max_length=250)),
+                ('shipment_count', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name_plural': 'Shipment monthly stats',
+                'ordering': ['month', 'transport', 'vessel'],
+                'unique_together': {('month', 'transport', 'vessel')},
+            },
+        ),
+        migrations.RunPython(backfill_created_at, migrations.RunPython.noop),
+        migrations.RunPython(build_monthly_stats, migrations.RunPython.noop),
+    ]
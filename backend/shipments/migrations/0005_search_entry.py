@@ -0,0 +1,90 @@
+# Generated by Django 5.1.7 on 2026-10-17 03:27
+
+from itertools import islice
+
+from django.db import migrations, models
+
+
+SQLITE_INDEX = [
+    "CREATE VIRTUAL TABLE shipments_searchentry_fts USING fts5("
+    "body, content='shipments_searchentry', content_rowid='id', "
+    "prefix='1 2 3', tokenize='unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER shipments_searchentry_ai AFTER INSERT ON shipments_searchentry BEGIN "
+    "INSERT INTO shipments_searchentry_fts(rowid, body) VALUES (new.id, new.body); END",
+    "CREATE TRIGGER shipments_searchentry_ad AFTER DELETE ON shipments_searchentry BEGIN "
+    "INSERT INTO shipments_searchentry_fts(shipments_searchentry_fts, rowid, body) VALUES ('delete', old.id, old.body); END",
+    "CREATE TRIGGER shipments_searchentry_au AFTER UPDATE ON shipments_searchentry BEGIN "
+    "INSERT INTO shipments_searchentry_fts(shipments_searchentry_fts, rowid, body) VALUES ('delete', old.id, old.body); "
+    "INSERT INTO shipments_searchentry_fts(rowid, body) VALUES (new.id, new.body); END",
+]
+
+SQLITE_DROP = [
+    "DROP TRIGGER IF EXISTS shipments_searchentry_au",
+    "DROP TRIGGER IF EXISTS shipments_searchentry_ad",
+    "DROP TRIGGER IF EXISTS shipments_searchentry_ai",
+    "DROP TABLE IF EXISTS shipments_searchentry_fts",
+]
+
+POSTGRES_INDEX = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX shipments_searchentry_body_trgm ON shipments_searchentry USING gin (body gin_trgm_ops)",
+    "CREATE INDEX shipments_searchentry_body_tsv ON shipments_searchentry USING gin (to_tsvector('simple', body))",
+]
+
+POSTGRES_DROP = [
+    "DROP INDEX IF EXISTS shipments_searchentry_body_tsv",
+    "DROP INDEX IF EXISTS shipments_searchentry_body_trgm",
+]
+
+SEARCH_FIELDS = {
+    'shipment': ('Shipment', ('shipment_no', 'vessel', 'origin', 'destination')),
+    'parcel': ('Parcel', ('parcel_no', 'description')),
+    'customer': ('Customer', ('name', 'email', 'phone')),
+}
+
+
+def run_for_vendor(statements):
+    def run(apps, schema_editor):
+        for statement in statements.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(statement)
+    return run
+
+
+def build_search_entries(apps, schema_editor):
+    SearchEntry = apps.get_model('shipments', 'SearchEntry')
+    for kind, (model_name, fields) in SEARCH_FIELDS.items():
+        model = apps.get_model('shipments', model_name)
+        rows = model.objects.order_by().values_list('pk', *fields).iterator(chunk_size=2000)
+        while batch := list(islice(rows, 2000)):
+            SearchEntry.objects.bulk_create([
+                SearchEntry(kind=kind, object_id=str(pk), body=' '.join(str(value) for value in values if value))
+                for pk, *values in batch
+            ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shipments', '0004_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('shipment', 'Shipment'), ('parcel', 'Parcel'), ('customer', 'Customer')], max_length=20)),
+                ('object_id', models.CharField(max_length=100)),
+                ('body', models.TextField()),
+            ],
+            options={
+                'verbose_name_plural': 'Search entries',
+                'unique_together': {('kind', 'object_id')},
+            },
+        ),
+        migrations.RunPython(
+            run_for_vendor({'sqlite': SQLITE_INDEX, 'postgresql': POSTGRES_INDEX}),
+            run_for_vendor({'sqlite': SQLITE_DROP, 'postgresql': POSTGRES_DROP}),
+        ),
+        migrations.RunPython(build_search_entries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 5.1.7 on 2026-10-17 03:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+from shipments.geo import grid_cell
+
+
+def fill_position_cells(apps, schema_editor):
+    Shipment = apps.get_model('shipments', 'Shipment')
+    shipments = list(
+        Shipment.objects.filter(latitude__isnull=False, longitude__isnull=False).only('pk', 'latitude', 'longitude')
+    )
+    for shipment in shipments:
+        shipment.position_cell = grid_cell(shipment.latitude, shipment.longitude)
+    Shipment.objects.bulk_update(shipments, ['position_cell'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shipments', '0006_query_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShipmentPosition',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('recorded_at', models.DateTimeField()),
+                ('latitude', models.DecimalField(decimal_places=6, max_digits=9)),
+                ('longitude', models.DecimalField(decimal_places=6, max_digits=9)),
+                ('cell', models.PositiveIntegerField(editable=False)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='shipment',
+            name='position_cell',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='shipment',
+            name='position_recorded_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='shipment',
+            index=models.Index(fields=['position_cell'], name='shipment_position_cell_idx'),
+        ),
+        migrations.AddField(
+            model_name='shipmentposition',
+            name='shipment',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='positions', to='shipments.shipment'),
+        ),
+        migrations.AddIndex(
+            model_name='shipmentposition',
+            index=models.Index(fields=['cell', 'recorded_at'], name='position_cell_time_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='shipmentposition',
+            constraint=models.UniqueConstraint(fields=('shipment', 'recorded_at'), name='position_shipment_time_uniq'),
+        ),
+        migrations.RunPython(fill_position_cells, migrations.RunPython.noop),
+    ]
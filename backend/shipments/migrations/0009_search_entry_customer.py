@@ -0,0 +1,34 @@
+# Generated by Django 5.1.7 on 2026-10-17 03:57
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import BigIntegerField, OuterRef, Subquery
+from django.db.models.functions import Cast
+
+
+def fill_entry_customers(apps, schema_editor):
+    SearchEntry = apps.get_model('shipments', 'SearchEntry')
+    Parcel = apps.get_model('shipments', 'Parcel')
+    Customer = apps.get_model('shipments', 'Customer')
+    SearchEntry.objects.filter(kind='parcel').update(
+        customer=Subquery(Parcel.objects.filter(pk=OuterRef('object_id')).values('customer_id')[:1])
+    )
+    SearchEntry.objects.filter(kind='customer').update(
+        customer=Subquery(Customer.objects.filter(pk=Cast(OuterRef('object_id'), BigIntegerField())).values('pk')[:1])
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shipments', '0008_document_upload'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='searchentry',
+            name='customer',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='shipments.customer'),
+        ),
+        migrations.RunPython(fill_entry_customers, migrations.RunPython.noop),
+    ]
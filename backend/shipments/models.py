@@ -1,8 +1,47 @@
-from django.db import models
+import uuid
+
+from django.conf import settings
+from django.db import models, transaction
+from django.db.models import Count, FloatField, IntegerField, OuterRef, Prefetch, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
 from djmoney.models.fields import MoneyField
 from djmoney.money import Money
 from django.utils.timezone import now
 
+from .geo import bbox_filter, grid_cell
+
+
+class CustomerQuerySet(models.QuerySet):
+    def with_stats(self, shipment_no=None):
+        """Annotate the aggregates read by CustomerSerializer.
+
+        Each value is a correlated subquery so the joins used for filtering
+        cannot inflate the counts, and shipment numbers come from a single
+        prefetch of the customers' parcels.
+        """
+        def parcel_subquery(expression):
+            parcels = Parcel.objects.filter(customer=OuterRef('pk')).order_by()
+            return parcels.values('customer').annotate(value=expression).values('value')
+
+        paid_invoices = Invoice.objects.filter(
+            customer=OuterRef('pk'), status='Paid'
+        ).order_by().values('customer').annotate(value=Count('pk')).values('value')
+
+        shipment_parcels = Parcel.objects.only('parcel_no', 'customer', 'shipment')
+        if shipment_no:
+            shipment_parcels = shipment_parcels.filter(shipment_id=shipment_no)
+
+        return self.annotate(
+            total_invoices_paid=Coalesce(Subquery(paid_invoices, output_field=IntegerField()), Value(0)),
+            total_parcels=Coalesce(Subquery(parcel_subquery(Count('pk')), output_field=IntegerField()), Value(0)),
+            total_parcel_weight=Coalesce(Subquery(parcel_subquery(Sum('weight')), output_field=FloatField()), Value(0.0)),
+            total_shipments=Coalesce(
+                Subquery(parcel_subquery(Count('shipment', distinct=True)), output_field=IntegerField()), Value(0)
+            ),
+        ).prefetch_related(
+            Prefetch('parcels', queryset=shipment_parcels, to_attr='shipment_parcels')
+        )
+
 
 class Customer(models.Model):
     STATUS = [
@@ -14,11 +53,43 @@ class Customer(models.Model):
     phone = models.CharField(max_length=20)
     address = models.TextField()
     status = models.CharField(max_length=20, choices=STATUS, default='Active')
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = CustomerQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Every customer-role request filters on the user's email
+            models.Index(fields=['email'], name='customer_email_idx'),
+        ]
 
     def __str__(self):
         return self.name
     
         
+class ShipmentQuerySet(models.QuerySet):
+    def with_counts(self):
+        """Annotate ``num_parcels`` and ``num_customers`` for ShipmentSerializer.
+
+        Subqueries keep the counts independent of any parcel joins added by
+        role filtering, which would otherwise restrict what gets counted.
+        """
+        def parcel_subquery(expression):
+            parcels = Parcel.objects.filter(shipment=OuterRef('pk')).order_by()
+            return parcels.values('shipment').annotate(value=expression).values('value')
+
+        return self.annotate(
+            num_parcels=Coalesce(Subquery(parcel_subquery(Count('pk', distinct=True)), output_field=IntegerField()), Value(0)),
+            num_customers=Coalesce(
+                Subquery(parcel_subquery(Count('customer', distinct=True)), output_field=IntegerField()), Value(0)
+            ),
+        )
+
+    def within(self, west, south, east, north):
+        """Shipments whose latest position lies inside the bounding box."""
+        return self.filter(bbox_filter(west, south, east, north, cell_field='position_cell'))
+
+
 class Shipment(models.Model):
     STATUS_CHOICES = [
         ('In-transit', 'In-transit'),
@@ -67,6 +138,24 @@ class Shipment(models.Model):
 
     latitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
     longitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
+    # Time of the ShipmentPosition copied into latitude/longitude, and its grid cell
+    position_recorded_at = models.DateTimeField(null=True, blank=True, editable=False)
+    position_cell = models.PositiveIntegerField(null=True, blank=True, editable=False)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = ShipmentQuerySet.as_manager()
+
+    class Meta:
+        # The list filters are equality matches paged in shipment_no order
+        indexes = [
+            models.Index(fields=['status', 'shipment_no'], name='shipment_status_idx'),
+            models.Index(fields=['transport', 'shipment_no'], name='shipment_transport_idx'),
+            models.Index(fields=['origin', 'shipment_no'], name='shipment_origin_idx'),
+            models.Index(fields=['destination', 'shipment_no'], name='shipment_destination_idx'),
+            models.Index(fields=['position_cell'], name='shipment_position_cell_idx'),
+        ]
 
     def customers(self):
         # Get all customers who have parcels in this shipment
@@ -87,6 +176,121 @@ class Shipment(models.Model):
     def __str__(self):
         return self.shipment_no
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # None if the status was deferred, so save() syncs the parcels anyway
+        instance._loaded_status = instance.__dict__.get('status')
+        return instance
+
+    def save(self, *args, **kwargs):
+        self.position_cell = grid_cell(self.latitude, self.longitude)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'latitude', 'longitude'} & set(update_fields):
+            kwargs['update_fields'] = {*update_fields, 'position_cell'}
+
+        adding = self._state.adding
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+            # Parcels mirror the shipment status; sync them in one UPDATE when
+            # it changed. A new shipment has no parcels yet.
+            update_fields = kwargs.get('update_fields')
+            saves_status = update_fields is None or 'status' in update_fields
+            if saves_status and not adding and self.status != getattr(self, '_loaded_status', None):
+                self.parcels.exclude(status=self.status).update(status=self.status, updated_at=now())
+        if saves_status:
+            self._loaded_status = self.status
+
+
+class ShipmentPositionQuerySet(models.QuerySet):
+    def within(self, west, south, east, north):
+        return self.filter(bbox_filter(west, south, east, north))
+
+
+class ShipmentPosition(models.Model):
+    """One GPS ping of a shipment.
+
+    Pings are inserted in bulk by shipments.positions.ingest_positions, which
+    also copies the newest one onto the shipment. ``cell`` is the grid cell
+    of the position, see shipments.geo.
+    """
+    shipment = models.ForeignKey(Shipment, on_delete=models.CASCADE, related_name='positions', db_index=False)
+    recorded_at = models.DateTimeField()
+    latitude = models.DecimalField(max_digits=9, decimal_places=6)
+    longitude = models.DecimalField(max_digits=9, decimal_places=6)
+    cell = models.PositiveIntegerField(editable=False)
+
+    objects = ShipmentPositionQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            # Also the index for a shipment's track; retried pings are ignored
+            models.UniqueConstraint(fields=['shipment', 'recorded_at'], name='position_shipment_time_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['cell', 'recorded_at'], name='position_cell_time_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.shipment_id} at {self.recorded_at:%Y-%m-%d %H:%M:%S}"
+
+    def save(self, *args, **kwargs):
+        self.cell = grid_cell(self.latitude, self.longitude)
+        super().save(*args, **kwargs)
+
+
+class ShipmentMonthlyStats(models.Model):
+    """Shipment counts per creation month, transport and vessel.
+
+    Kept up to date by the signals in shipments.signals and rebuilt with the
+    ``rebuild_shipment_stats`` management command.
+    """
+    month = models.DateField()
+    transport = models.CharField(max_length=100)
+    vessel = models.CharField(max_length=250)
+    shipment_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ['month', 'transport', 'vessel']
+        unique_together = [('month', 'transport', 'vessel')]
+        verbose_name_plural = 'Shipment monthly stats'
+
+    def __str__(self):
+        return f"{self.month:%Y-%m} {self.transport} {self.vessel}: {self.shipment_count}"
+
+
+class SearchEntry(models.Model):
+    """Searchable text of one shipment, parcel or customer.
+
+    Kept in sync by the signals in shipments.signals and indexed with the
+    database's full-text search, see shipments.search. ``customer`` owns
+    parcel and customer entries; shipments belong to their parcels' customers.
+    """
+    KINDS = [
+        ('shipment', 'Shipment'),
+        ('parcel', 'Parcel'),
+        ('customer', 'Customer'),
+    ]
+
+    kind = models.CharField(max_length=20, choices=KINDS)
+    object_id = models.CharField(max_length=100)
+    body = models.TextField()
+    customer = models.ForeignKey(
+        'Customer',
+        on_delete=models.CASCADE,
+        related_name='+',
+        null=True,
+        blank=True
+    )
+
+    class Meta:
+        unique_together = [('kind', 'object_id')]
+        verbose_name_plural = 'Search entries'
+
+    def __str__(self):
+        return f"{self.kind} {self.object_id}"
+
 
 class Parcel(models.Model):
     WEIGHT_UNITS = [
@@ -132,6 +336,12 @@ class Parcel(models.Model):
     commodity_type = models.CharField(max_length=255, choices=COMMODITY_TYPE, default='parcel')
     description = models.TextField(blank=True, null=True)
     status = models.CharField(max_length=50, default='Pending')
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['customer', 'payment'], name='parcel_customer_payment_idx'),
+        ]
 
     def formatted_weight(self):
         return f"{self.weight} {self.weight_unit}"
@@ -143,7 +353,10 @@ class Parcel(models.Model):
         return self.parcel_no
     
     def save(self, *args, **kwargs):
-        if self.shipment:
+        # Shipment.save() keeps existing parcels in sync, so the status is only
+        # copied from a shipment the caller already loaded, as the API and
+        # admin forms and the parcel import do; without one it is left as given
+        if Parcel.shipment.is_cached(self) and self.shipment is not None:
             self.status = self.shipment.status
         super().save(*args, **kwargs)
 
@@ -184,11 +397,42 @@ class Document(models.Model):
     file = models.FileField(upload_to='documents/')
     issued_date = models.DateTimeField(default=now, editable=False)
     description = models.TextField(blank=True, null=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['shipment', 'document_type'], name='document_shipment_type_idx'),
+            # Keyset pagination order of the document list
+            models.Index(fields=['-issued_date', 'document_no'], name='document_issued_idx'),
+        ]
 
     def __str__(self):
         return f"{self.get_document_type_display()} - {self.document_no}"
 
 
+class DocumentUpload(models.Model):
+    """A resumable upload of a Document's file, in chunks.
+
+    Each chunk is stored as its own object in the file storage and listed
+    in ``parts`` as ``[offset, size, name]``; ``metadata`` holds the
+    Document fields to create on commit. See shipments.uploads.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='document_uploads')
+    filename = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField()
+    # Hex SHA-256 of the whole file, declared by the client
+    checksum = models.CharField(max_length=64)
+    metadata = models.JSONField(default=dict)
+    parts = models.JSONField(default=list)
+    offset = models.PositiveBigIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.filename} ({self.offset}/{self.size})"
+
+
 class Invoice(models.Model):
     invoice_no = models.CharField(max_length=100, primary_key=True)
     customer = models.ForeignKey(
@@ -206,30 +450,34 @@ class Invoice(models.Model):
         choices=[('Pending', 'Pending'), ('Paid', 'Paid'), ('Overdue', 'Overdue')],
         default='Pending'
     )
-    
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['customer', 'status', 'issue_date'], name='invoice_customer_status_idx'),
+            # Default ordering and keyset pagination order of the invoice list
+            models.Index(fields=['-issue_date', 'invoice_no'], name='invoice_issued_idx'),
+        ]
+
     def calculate_total_amount(self):
         """Sum up all invoice item costs."""
-        items_total = sum(item.cost for item in self.items.all())
-        self.total_amount = items_total
+        items_total = self.items.aggregate(total=Sum('cost'))['total'] or 0
+        self.total_amount = Money(items_total, self.total_amount.currency)
 
     def calculate_final_amount(self):
         """Automatically calculate the final amount after tax."""
         self.final_amount = self.total_amount + self.tax
 
     def save(self, *args, **kwargs):
-        # Save invoice first
-        super().save(*args, **kwargs)
+        with transaction.atomic():
+            # Save invoice first
+            super().save(*args, **kwargs)
 
-        # Automatically add all unbilled parcels of this customer to this invoice
-        from .models import InvoiceItem
-        parcels = self.customer.parcels.filter(invoice_items__isnull=True)
-        for parcel in parcels:
-            InvoiceItem.objects.get_or_create(invoice=self, parcel=parcel, defaults={'cost': parcel.charge})
-
-        # Recalculate totals after adding items
-        self.calculate_total_amount()
-        self.calculate_final_amount()
-        super().save(update_fields=['total_amount', 'final_amount'])
+            # Partial saves (e.g. refreshed totals) must not trigger billing again
+            if kwargs.get('update_fields') is None:
+                # Automatically add all unbilled parcels of this customer to this invoice
+                from .invoicing import bill_unbilled_parcels
+                bill_unbilled_parcels(self)
 
     def __str__(self):
         return f"{self.invoice_no} - {self.customer.name}"
@@ -253,14 +501,18 @@ class InvoiceItem(models.Model):
         if not self.cost:
             self.cost = self.parcel.charge or 0
         super().save(*args, **kwargs)
-        
-        if self.invoice:
-            self.invoice.calculate_total_amount()
-            self.invoice.calculate_final_amount()
-            self.invoice.save(update_fields=['total_amount', 'final_amount'])
-        
-        
-        
+
+        if self.invoice_id:
+            from .invoicing import mark_invoice_dirty
+            mark_invoice_dirty(self.invoice_id)
+
+    def delete(self, *args, **kwargs):
+        invoice_id = self.invoice_id
+        result = super().delete(*args, **kwargs)
+        from .invoicing import mark_invoice_dirty
+        mark_invoice_dirty(invoice_id)
+        return result
+
     def __str__(self):
         return f"Item for {self.invoice.invoice_no} - Parcel {self.parcel.parcel_no}"
 
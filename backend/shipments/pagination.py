@@ -0,0 +1,60 @@
+from django.conf import settings
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+from . import metrics
+
+
+class KeysetPagination(CursorPagination):
+    """Cursor pagination over the view's ``cursor_ordering``.
+
+    Pages are fetched with a WHERE on the ordering key instead of an OFFSET,
+    and no COUNT(*) is run, so every page costs the same.
+    """
+    page_size_query_param = 'page_size'
+    max_page_size = getattr(settings, 'PAGINATION_MAX_PAGE_SIZE', 100)
+
+    def get_ordering(self, request, queryset, view):
+        return tuple(view.cursor_ordering)
+
+
+class OptionalCursorPagination(PageNumberPagination):
+    """Page-number pagination with opt-in keyset pagination.
+
+    Views that declare ``cursor_ordering`` switch to KeysetPagination when
+    the request has ``?pagination=cursor`` or a ``?cursor=`` token. The
+    response then carries opaque ``next``/``previous`` cursors and no count.
+    """
+    mode_query_param = 'pagination'
+    keyset_class = KeysetPagination
+
+    keyset = None
+
+    def use_keyset(self, request, view):
+        if not getattr(view, 'cursor_ordering', None):
+            return False
+        return (
+            request.query_params.get(self.mode_query_param) == 'cursor'
+            or self.keyset_class.cursor_query_param in request.query_params
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.use_keyset(request, view):
+            self.keyset = self.keyset_class()
+            page = self.keyset.paginate_queryset(queryset, request, view)
+        else:
+            self.keyset = None
+            page = super().paginate_queryset(queryset, request, view)
+        if page is not None:
+            mode = 'cursor' if self.keyset is not None else 'page'
+            metrics.PAGE_SIZE.labels(metrics.view_name(request), mode).observe(len(page))
+        return page
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+    def to_html(self):
+        if self.keyset is not None:
+            return self.keyset.to_html()
+        return super().to_html()
@@ -0,0 +1,174 @@
+"""Invoice PDF drawing.
+
+This module only depends on ReportLab so it can run inside the render
+worker processes started by shipments.pdf_cache without setting up Django.
+Fonts are registered once per process, and the page header of each
+document is drawn once as a form that every page reuses.
+"""
+import os
+import tempfile
+import zlib
+
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.units import mm
+from reportlab.pdfbase import pdfdoc, pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+
+
+PAGE_WIDTH, PAGE_HEIGHT = A4
+MARGIN = 18 * mm
+HEADER_HEIGHT = 62 * mm
+FOOTER_HEIGHT = 14 * mm
+ROW_HEIGHT = 6 * mm
+TOTALS_HEIGHT = 4 * ROW_HEIGHT
+
+# (title, x offset, width, right aligned)
+COLUMNS = [
+    ("Parcel No", 0, 38 * mm, False),
+    ("Commodity", 40 * mm, 26 * mm, False),
+    ("Description", 68 * mm, 70 * mm, False),
+    ("Cost", 140 * mm, 34 * mm, True),
+]
+
+_fonts = None
+
+
+def get_fonts():
+    """Return the (regular, bold) font names, registering INVOICE_PDF_FONT once."""
+    global _fonts
+    if _fonts is None:
+        regular, bold = "Helvetica", "Helvetica-Bold"
+        font_path = os.environ.get("INVOICE_PDF_FONT")
+        bold_path = os.environ.get("INVOICE_PDF_FONT_BOLD", font_path)
+        if font_path:
+            pdfmetrics.registerFont(TTFont("InvoiceSans", font_path))
+            pdfmetrics.registerFont(TTFont("InvoiceSans-Bold", bold_path))
+            regular, bold = "InvoiceSans", "InvoiceSans-Bold"
+        _fonts = (regular, bold)
+    return _fonts
+
+
+def fit(text, font, size, width):
+    """Clip ``text`` with an ellipsis so it fits in ``width`` points."""
+    text = str(text or "")
+    if pdfmetrics.stringWidth(text, font, size) <= width:
+        return text
+    while text and pdfmetrics.stringWidth(text + "...", font, size) > width:
+        text = text[:-1]
+    return text + "..."
+
+
+def draw_cells(p, y, values, font, size):
+    p.setFont(font, size)
+    for value, (_, x, width, right) in zip(values, COLUMNS):
+        text = fit(value, font, size, width)
+        if right:
+            p.drawRightString(MARGIN + x + width, y, text)
+        else:
+            p.drawString(MARGIN + x, y, text)
+
+
+def compress_finished_page(p):
+    """Deflate the page just closed by showPage() instead of keeping its text.
+
+    ReportLab holds every page's drawing operators as text until save() and
+    only compresses them then; compressing each page as it is finished keeps
+    a render's memory at the size of the compressed output.
+    """
+    page = p._doc.Pages.pages[-1]
+    page.Contents = pdfdoc.PDFStream(
+        pdfdoc.PDFDictionary({"Filter": pdfdoc.PDFArray([pdfdoc.PDFName("FlateDecode")])}),
+        zlib.compress(page.stream.encode("utf8")),
+    )
+    page.stream = None
+
+
+def define_header(p, payload, fonts):
+    regular, bold = fonts
+    invoice, customer = payload["invoice"], payload["customer"]
+    top = PAGE_HEIGHT - MARGIN
+
+    p.beginForm("page_header")
+    p.setFont(bold, 18)
+    p.drawString(MARGIN, top - 8 * mm, "Invoice")
+    p.setFont(regular, 10)
+    p.drawRightString(PAGE_WIDTH - MARGIN, top - 6 * mm, f"Invoice No: {invoice['invoice_no']}")
+    p.drawRightString(PAGE_WIDTH - MARGIN, top - 11 * mm, f"Issued: {invoice['issue_date']}")
+    p.drawRightString(PAGE_WIDTH - MARGIN, top - 16 * mm, f"Due: {invoice['due_date']}")
+    p.drawRightString(PAGE_WIDTH - MARGIN, top - 21 * mm, f"Status: {invoice['status']}")
+
+    p.setFont(bold, 11)
+    p.drawString(MARGIN, top - 20 * mm, "Bill to")
+    p.setFont(regular, 10)
+    for line, text in enumerate([customer["name"], customer["email"], customer["phone"], customer["address"]]):
+        p.drawString(MARGIN, top - (26 + 5 * line) * mm, fit(text, regular, 10, 100 * mm))
+
+    y = PAGE_HEIGHT - MARGIN - HEADER_HEIGHT + ROW_HEIGHT
+    draw_cells(p, y, [title for title, *_ in COLUMNS], bold, 10)
+    p.line(MARGIN, y - 2 * mm, PAGE_WIDTH - MARGIN, y - 2 * mm)
+    p.endForm()
+
+
+def start_page(p, payload, fonts, page_number):
+    p.doForm("page_header")
+    p.setFont(fonts[0], 8)
+    p.drawString(MARGIN, MARGIN, f"Invoice {payload['invoice']['invoice_no']}")
+    p.drawRightString(PAGE_WIDTH - MARGIN, MARGIN, f"Page {page_number}")
+    return PAGE_HEIGHT - MARGIN - HEADER_HEIGHT
+
+
+def render_invoice_pdf(payload, path):
+    """Draw the invoice described by ``payload`` and atomically write it to ``path``.
+
+    Items are laid out page by page; a new page starts whenever the next
+    row, or the totals block after the last row, would run into the footer.
+    """
+    fonts = get_fonts()
+    regular, bold = fonts
+    invoice = payload["invoice"]
+    currency = invoice["currency"]
+    bottom = MARGIN + FOOTER_HEIGHT
+
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".pdf.tmp")
+    os.close(fd)
+    try:
+        p = canvas.Canvas(tmp_path, pagesize=A4, pageCompression=1)
+        p.setPageCallBack(lambda page_number: compress_finished_page(p))
+        p.setTitle(f"Invoice {invoice['invoice_no']}")
+        define_header(p, payload, fonts)
+
+        page_number = 1
+        y = start_page(p, payload, fonts, page_number)
+        for parcel_no, commodity_type, description, cost in payload["items"]:
+            if y - ROW_HEIGHT < bottom:
+                p.showPage()
+                page_number += 1
+                y = start_page(p, payload, fonts, page_number)
+            y -= ROW_HEIGHT
+            draw_cells(p, y, [parcel_no, commodity_type, description, f"{currency} {cost}"], regular, 9)
+
+        if y - TOTALS_HEIGHT < bottom:
+            p.showPage()
+            page_number += 1
+            y = start_page(p, payload, fonts, page_number)
+
+        y -= ROW_HEIGHT
+        p.line(MARGIN, y + 4 * mm, PAGE_WIDTH - MARGIN, y + 4 * mm)
+        for label, amount, font in [
+            ("Subtotal", invoice["total_amount"], regular),
+            ("Tax", invoice["tax"], regular),
+            ("Total", invoice["final_amount"], bold),
+        ]:
+            p.setFont(font, 10)
+            p.drawRightString(PAGE_WIDTH - MARGIN - 40 * mm, y, label)
+            p.drawRightString(PAGE_WIDTH - MARGIN, y, f"{currency} {amount}")
+            y -= ROW_HEIGHT
+
+        p.showPage()
+        p.save()
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    return path
@@ -0,0 +1,140 @@
+"""Content-addressed cache of rendered invoice PDFs.
+
+PDFs are stored under the SHA-256 of the data they are drawn from, so a
+repeat download is served straight from disk and any change to the invoice
+produces a new file. Each invoice has its own directory, and the older
+versions in it are deleted once a new one is rendered, so the cache holds
+one PDF per invoice. Missing PDFs are rendered by a process pool instead
+of the request worker; concurrent requests for the same content share one
+render.
+"""
+import hashlib
+import json
+import multiprocessing
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+from . import metrics
+from .pdf import render_invoice_pdf
+
+
+_executor = None
+_pending = {}
+_lock = threading.RLock()
+
+
+def content_hash(payload):
+    encoded = json.dumps(payload, sort_keys=True, cls=DjangoJSONEncoder).encode()
+    return hashlib.sha256(encoded).hexdigest()
+
+
+def invoice_dir(invoice_no):
+    key = hashlib.sha1(str(invoice_no).encode()).hexdigest()
+    return os.path.join(settings.INVOICE_PDF_CACHE_DIR, key[:2], key)
+
+
+def cache_path(invoice_no, digest):
+    return os.path.join(invoice_dir(invoice_no), f"{digest}.pdf")
+
+
+def delete_older_versions(path):
+    """Remove the invoice's other cached PDFs once ``path`` has been rendered."""
+    directory, current = os.path.split(path)
+    for entry in os.scandir(directory):
+        if entry.name != current and entry.name.endswith('.pdf'):
+            try:
+                os.unlink(entry.path)
+            except FileNotFoundError:
+                pass
+
+
+def delete_invoice_pdfs(invoice_no):
+    shutil.rmtree(invoice_dir(invoice_no), ignore_errors=True)
+
+
+def get_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            # spawn: forking a threaded gunicorn worker is not safe
+            _executor = ProcessPoolExecutor(
+                max_workers=settings.PDF_RENDER_WORKERS,
+                mp_context=multiprocessing.get_context('spawn'),
+            )
+        return _executor
+
+
+def _forget(digest, queued):
+    def callback(future):
+        with _lock:
+            _pending.pop(digest, None)
+        if not future.cancelled() and future.exception() is None:
+            metrics.PDF_RENDER.observe(time.perf_counter() - queued)
+            delete_older_versions(future.result())
+    return callback
+
+
+def build_invoice_payload(invoice):
+    """Plain data for render_invoice_pdf.
+
+    Expects ``items`` (with their parcels) and ``customer`` to be loaded,
+    see with_pdf_data.
+    """
+    customer = invoice.customer
+    return {
+        'invoice': {
+            'invoice_no': invoice.invoice_no,
+            'issue_date': f"{invoice.issue_date:%Y-%m-%d}",
+            'due_date': f"{invoice.due_date:%Y-%m-%d}",
+            'status': invoice.status,
+            'currency': str(invoice.final_amount.currency),
+            'total_amount': str(invoice.total_amount.amount),
+            'tax': str(invoice.tax.amount),
+            'final_amount': str(invoice.final_amount.amount),
+        },
+        'customer': {
+            'name': customer.name,
+            'email': customer.email,
+            'phone': customer.phone,
+            'address': customer.address,
+        },
+        'items': [
+            [item.parcel.parcel_no, item.parcel.commodity_type, item.parcel.description or '', str(item.cost.amount)]
+            for item in invoice.items.all()
+        ],
+    }
+
+
+def get_invoice_pdf(payload, timeout=None):
+    """Return the path of the PDF for ``payload``, or None if it is still rendering.
+
+    Waits up to ``timeout`` seconds (PDF_RENDER_WAIT_SECONDS by default)
+    for a render to finish; the render carries on in the pool either way.
+    """
+    digest = content_hash(payload)
+    path = cache_path(payload['invoice']['invoice_no'], digest)
+    if os.path.exists(path):
+        metrics.record_cache_lookup('invoice_pdf', True)
+        return path
+    metrics.record_cache_lookup('invoice_pdf', False)
+
+    executor = get_executor()
+    with _lock:
+        future = _pending.get(digest)
+        if future is None:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            future = _pending[digest] = executor.submit(render_invoice_pdf, payload, path)
+            future.add_done_callback(_forget(digest, time.perf_counter()))
+
+    if timeout is None:
+        timeout = settings.PDF_RENDER_WAIT_SECONDS
+    try:
+        return future.result(timeout=timeout)
+    except TimeoutError:
+        return None
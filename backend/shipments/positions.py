@@ -0,0 +1,111 @@
+"""Bulk ingest of tracker GPS pings."""
+from django.db import connection, transaction
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+
+from .geo import grid_cell
+from .ingest import ingest, reject
+from .live import publish_positions
+from .models import Shipment, ShipmentPosition
+from .serializers import PositionIngestSerializer
+
+
+def ingest_positions(rows, chunk_size=1000):
+    """Insert position rows, see shipments.ingest. Returns the report, with 'accepted' and 'duplicates' counts.
+
+    Each chunk loads its shipments with one query, counts pings already
+    stored (or repeated within the chunk) as duplicates, and moves every
+    shipment whose newest ping is newer than its current position.
+    """
+    return ingest(rows, _ingest_chunk, 'accepted', chunk_size, counters=('duplicates',))
+
+
+def _ingest_chunk(chunk, report):
+    shipment_ids = {str(row['shipment']) for _, row in chunk if isinstance(row, dict) and row.get('shipment')}
+    # One serializer validates every row, so its fields are only built once
+    serializer = PositionIngestSerializer(context={'shipments': Shipment.objects.only('pk').in_bulk(shipment_ids)})
+
+    positions = []
+    for number, row in chunk:
+        if not isinstance(row, dict):
+            reject(report, number, row, 'shipment')
+            continue
+        try:
+            position = ShipmentPosition(**serializer.run_validation(row))
+        except ValidationError as e:
+            reject(report, number, row, 'shipment', e.detail)
+            continue
+        position.cell = grid_cell(position.latitude, position.longitude)
+        positions.append(position)
+
+    if not positions:
+        return
+
+    with transaction.atomic():
+        positions = _drop_duplicates(positions, report)
+        if not positions:
+            return
+        newest = {}
+        for position in positions:
+            current = newest.get(position.shipment_id)
+            if current is None or position.recorded_at > current.recorded_at:
+                newest[position.shipment_id] = position
+        # ignore_conflicts still covers pings stored by a concurrent batch
+        ShipmentPosition.objects.bulk_create(positions, ignore_conflicts=True)
+        if moved := _move_shipments(newest):
+            publish_positions(moved)
+    report['accepted'] += len(positions)
+
+
+def _drop_duplicates(positions, report):
+    """The positions not yet stored, each (shipment, recorded_at) once; counts the others as duplicates."""
+    stored = set(ShipmentPosition.objects.filter(
+        shipment_id__in={position.shipment_id for position in positions},
+        recorded_at__in={position.recorded_at for position in positions},
+    ).values_list('shipment_id', 'recorded_at'))
+    new = []
+    for position in positions:
+        key = (position.shipment_id, position.recorded_at)
+        if key not in stored:
+            stored.add(key)
+            new.append(position)
+    report['duplicates'] += len(positions) - len(new)
+    return new
+
+
+def _move_shipments(newest):
+    """Copy each shipment's newest ping onto it unless it already has a later one.
+
+    One parameterized UPDATE per shipment, sent with executemany: the
+    recorded_at comparison in its WHERE keeps concurrent batches from moving
+    a shipment backwards, and it skips Shipment.save and its signals, which
+    positions do not concern. Returns the pings that moved their shipment.
+    """
+    current = dict(Shipment.objects.filter(pk__in=newest).values_list('pk', 'position_recorded_at'))
+    newest = {
+        shipment_no: position for shipment_no, position in newest.items()
+        if current.get(shipment_no) is None or current[shipment_no] < position.recorded_at
+    }
+    if not newest:
+        return []
+    ops = connection.ops
+    qn = ops.quote_name
+    table = Shipment._meta.db_table
+    sql = (
+        f"UPDATE {qn(table)} SET {qn('latitude')} = %s, {qn('longitude')} = %s, {qn('position_cell')} = %s, "
+        f"{qn('position_recorded_at')} = %s, {qn('updated_at')} = %s "
+        f"WHERE {qn('shipment_no')} = %s "
+        f"AND ({qn('position_recorded_at')} IS NULL OR {qn('position_recorded_at')} < %s)"
+    )
+    now = ops.adapt_datetimefield_value(timezone.now())
+    params = []
+    for shipment_no, position in newest.items():
+        recorded_at = ops.adapt_datetimefield_value(position.recorded_at)
+        params.append((
+            ops.adapt_decimalfield_value(position.latitude, 9, 6),
+            ops.adapt_decimalfield_value(position.longitude, 9, 6),
+            position.cell, recorded_at, now, shipment_no, recorded_at,
+        ))
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, params)
+    return list(newest.values())
@@ -0,0 +1,54 @@
+"""Versioned cache for Step and Parameter reference data.
+
+Each category has a version token in the shared Django cache, replaced by
+``bump_version`` once a transaction changing its rows commits. Serialized list payloads are kept
+in process memory per (category, request variant) together with the version
+they were built from, so a worker only rebuilds a payload after the version
+moves, and every worker sees the change through the shared cache.
+"""
+import hashlib
+import threading
+import uuid
+
+from django.core.cache import cache
+from django.db import transaction
+
+
+VERSION_KEY = "refdata:{}:version"
+MAX_LOCAL_ENTRIES = 256
+
+_payloads = {}
+_lock = threading.Lock()
+
+
+def get_version(category):
+    version = cache.get(VERSION_KEY.format(category))
+    if version is None:
+        cache.add(VERSION_KEY.format(category), uuid.uuid4().hex, timeout=None)
+        version = cache.get(VERSION_KEY.format(category))
+    return version
+
+
+def bump_version(category):
+    # Moving the version before the commit would let a concurrent reader cache
+    # the old rows under the new version, and a rollback would still move it
+    transaction.on_commit(lambda: cache.set(VERSION_KEY.format(category), uuid.uuid4().hex, timeout=None))
+
+
+def make_etag(category, version, variant):
+    digest = hashlib.sha1(f"{category}:{version}:{variant}".encode()).hexdigest()
+    return f'"{digest[:32]}"'
+
+
+def get_payload(category, version, variant):
+    entry = _payloads.get((category, variant))
+    if entry is not None and entry[0] == version:
+        return entry[1]
+    return None
+
+
+def store_payload(category, version, variant, payload):
+    with _lock:
+        if len(_payloads) >= MAX_LOCAL_ENTRIES:
+            _payloads.clear()
+        _payloads[(category, variant)] = (version, payload)
@@ -0,0 +1,168 @@
+"""Full-text search over shipments, parcels and customers.
+
+Each object has one SearchEntry row holding its searchable text. The text
+is indexed by the database: an FTS5 table on SQLite and trigram plus
+tsvector GIN indexes on PostgreSQL, both created by migration 0005. Other
+databases fall back to LIKE scans.
+"""
+import re
+from itertools import islice
+
+from django.db import connection, transaction
+from django.db.models import Exists, OuterRef, Q
+
+from .models import Customer, Parcel, SearchEntry, Shipment
+
+
+SEARCH_FIELDS = {
+    'shipment': (Shipment, ('shipment_no', 'vessel', 'origin', 'destination')),
+    'parcel': (Parcel, ('parcel_no', 'description')),
+    'customer': (Customer, ('name', 'email', 'phone')),
+}
+
+KIND_BY_MODEL = {model: kind for kind, (model, _) in SEARCH_FIELDS.items()}
+
+# Field holding the customer that owns an entry. Shipments have none: they
+# belong to the customers of their parcels, which the search checks itself.
+OWNER_FIELDS = {'shipment': None, 'parcel': 'customer_id', 'customer': 'pk'}
+
+FTS_TABLE = 'shipments_searchentry_fts'
+
+
+def search_body(values):
+    return ' '.join(str(value) for value in values if value)
+
+
+def search_terms(query):
+    return re.findall(r'\w+', query.lower())
+
+
+def index_objects(kind, objects, batch_size=500):
+    """Insert or refresh the search entries of ``objects`` in bulk."""
+    _, fields = SEARCH_FIELDS[kind]
+    owner = OWNER_FIELDS[kind]
+    entries = [
+        SearchEntry(
+            kind=kind,
+            object_id=str(obj.pk),
+            body=search_body(getattr(obj, field) for field in fields),
+            customer_id=getattr(obj, owner) if owner else None,
+        )
+        for obj in objects
+    ]
+    SearchEntry.objects.bulk_create(
+        entries, batch_size=batch_size,
+        update_conflicts=True, unique_fields=['kind', 'object_id'], update_fields=['body', 'customer'],
+    )
+
+
+def index_object(instance):
+    index_objects(KIND_BY_MODEL[type(instance)], [instance])
+
+
+def unindex_object(instance):
+    SearchEntry.objects.filter(kind=KIND_BY_MODEL[type(instance)], object_id=str(instance.pk)).delete()
+
+
+def rebuild_search_index(chunk_size=2000):
+    """Recreate every search entry from the source tables. Returns the entry count."""
+    count = 0
+    with transaction.atomic():
+        SearchEntry.objects.all().delete()
+        for kind, (model, fields) in SEARCH_FIELDS.items():
+            owner = OWNER_FIELDS[kind]
+            rows = model.objects.order_by().values_list('pk', owner or 'pk', *fields).iterator(chunk_size=chunk_size)
+            while batch := list(islice(rows, chunk_size)):
+                count += len(SearchEntry.objects.bulk_create([
+                    SearchEntry(kind=kind, object_id=str(pk), body=search_body(values), customer_id=owned_by if owner else None)
+                    for pk, owned_by, *values in batch
+                ]))
+    return count
+
+
+def owner_condition(customer_ids):
+    """SQL and params restricting the entries aliased ``e`` to those ``customer_ids`` own."""
+    qn = connection.ops.quote_name
+    parcel = Parcel._meta
+    placeholders = ', '.join(['%s'] * len(customer_ids))
+    sql = (
+        f"(e.customer_id IN ({placeholders}) OR (e.kind = 'shipment' AND EXISTS ("
+        f"SELECT 1 FROM {qn(parcel.db_table)} p WHERE p.{qn(parcel.get_field('shipment').column)} = e.object_id "
+        f"AND p.{qn(parcel.get_field('customer').column)} IN ({placeholders}))))"
+    )
+    return sql, [*customer_ids, *customer_ids]
+
+
+class SQLiteSearchBackend:
+    """FTS5 MATCH with every term as a prefix query, newest entries first.
+
+    Walking the index in rowid order lets LIMIT stop the scan early; bm25
+    ranking would have to score every match of a broad query first.
+    """
+
+    def search(self, terms, kinds, limit, customer_ids=None):
+        match = ' '.join(f'"{term}"*' for term in terms)
+        placeholders = ', '.join(['%s'] * len(kinds))
+        owned, owner_params = owner_condition(customer_ids) if customer_ids is not None else ('1', [])
+        sql = (
+            f"SELECT e.kind, e.object_id FROM {FTS_TABLE} f "
+            f"JOIN shipments_searchentry e ON e.id = f.rowid "
+            f"WHERE f.body MATCH %s AND e.kind IN ({placeholders}) AND {owned} "
+            f"ORDER BY f.rowid DESC LIMIT %s"
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [match, *kinds, *owner_params, limit])
+            return cursor.fetchall()
+
+
+class PostgresSearchBackend:
+    """Prefix tsquery on the tsvector index, or fuzzy matches on the trigram index."""
+
+    def search(self, terms, kinds, limit, customer_ids=None):
+        tsquery = ' & '.join(f'{term}:*' for term in terms)
+        text = ' '.join(terms)
+        owned, owner_params = owner_condition(customer_ids) if customer_ids is not None else ('TRUE', [])
+        sql = (
+            "SELECT e.kind, e.object_id FROM shipments_searchentry e "
+            "WHERE (to_tsvector('simple', e.body) @@ to_tsquery('simple', %s) OR %s <%% e.body) "
+            f"AND e.kind = ANY(%s) AND {owned} "
+            "ORDER BY word_similarity(%s, e.body) DESC LIMIT %s"
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [tsquery, text, list(kinds), *owner_params, text, limit])
+            return cursor.fetchall()
+
+
+class LikeSearchBackend:
+    """Unindexed fallback for databases without a text index."""
+
+    def search(self, terms, kinds, limit, customer_ids=None):
+        entries = SearchEntry.objects.filter(kind__in=kinds)
+        for term in terms:
+            entries = entries.filter(body__icontains=term)
+        if customer_ids is not None:
+            owned = Parcel.objects.filter(shipment_id=OuterRef('object_id'), customer_id__in=customer_ids)
+            entries = entries.filter(Q(customer_id__in=customer_ids) | Q(Exists(owned), kind='shipment'))
+        return list(entries.values_list('kind', 'object_id')[:limit])
+
+
+SEARCH_BACKENDS = {
+    'sqlite': SQLiteSearchBackend,
+    'postgresql': PostgresSearchBackend,
+}
+
+
+def get_search_backend():
+    return SEARCH_BACKENDS.get(connection.vendor, LikeSearchBackend)()
+
+
+def search(query, kinds=None, limit=20, customer_ids=None):
+    """Return up to ``limit`` (kind, object_id) pairs matching every word of ``query``.
+
+    With ``customer_ids`` only entries those customers own are matched, so
+    the limit applies to what a customer may see.
+    """
+    terms = search_terms(query)
+    if not terms or customer_ids == []:
+        return []
+    return get_search_backend().search(terms, list(kinds or SEARCH_FIELDS), limit, customer_ids)
@@ -1,8 +1,24 @@
 from rest_framework import serializers
 from decimal import Decimal
+from django.conf import settings
 from django.db.models import Sum
+from django.utils.text import get_valid_filename
 
-from .models import Shipment, Customer, Parcel, Document, Invoice, InvoiceItem, Step, Parameter
+from .models import Shipment, ShipmentPosition, Customer, Parcel, Document, DocumentUpload, Invoice, InvoiceItem, Step, Parameter
+
+
+def get_expansions(request):
+    """Return the names passed in ``?expand=a,b`` as a set."""
+    if request is None:
+        return set()
+    value = request.query_params.get('expand', '')
+    return {name.strip() for name in value.split(',') if name.strip()}
+
+
+class CustomerSummarySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Customer
+        fields = ['id', 'name', 'email']
 
 
 class CustomerSerializer(serializers.ModelSerializer):
@@ -19,19 +35,31 @@ class CustomerSerializer(serializers.ModelSerializer):
                   'total_shipments', 'shipment_nos']
         
     def get_total_invoices_paid(self, obj):
+        if hasattr(obj, 'total_invoices_paid'):
+            return obj.total_invoices_paid
         return obj.invoices.filter(status='Paid').count()
     
     def get_total_parcels(self, obj):
+        if hasattr(obj, 'total_parcels'):
+            return obj.total_parcels
         return obj.parcels.count()
     
     def get_total_parcel_weight(self, obj):
+        if hasattr(obj, 'total_parcel_weight'):
+            return obj.total_parcel_weight
         total_weight = obj.parcels.aggregate(total=Sum('weight'))['total']
         return total_weight or 0
     
     def get_total_shipments(self, obj):
+        if hasattr(obj, 'total_shipments'):
+            return obj.total_shipments
         return Shipment.objects.filter(parcels__customer=obj).distinct().count()
     
     def get_shipment_nos(self, obj):
+        # Populated by Customer.objects.with_stats(), already narrowed by ?shipment_no=
+        if hasattr(obj, 'shipment_parcels'):
+            return sorted({parcel.shipment_id for parcel in obj.shipment_parcels})
+
         request = self.context.get('request')
         shipment_no = request.query_params.get('shipment_no') if request else None
 
@@ -50,18 +78,22 @@ class ShipmentSerializer(serializers.ModelSerializer):
         model = Shipment
         fields = ['shipment_no', 'transport', 'vessel', 'origin', 'destination',
             'weight', 'weight_unit', 'volume', 'volume_unit', 'steps', 'status',
-            'latitude', 'longitude',
+            'latitude', 'longitude', 'created_at',
             'customer_count', 'parcel_count']
         
     def get_customer_count(self, obj):
-            return Customer.objects.filter(parcels__shipment=obj).distinct().count()
+        if hasattr(obj, 'num_customers'):
+            return obj.num_customers
+        return obj.customer_count()
 
     def get_parcel_count(self, obj):
-        return obj.parcels.count()
+        if hasattr(obj, 'num_parcels'):
+            return obj.num_parcels
+        return obj.parcel_count()
 
         
 class ParcelSerializer(serializers.ModelSerializer):
-    customer = CustomerSerializer(read_only=True)
+    customer = CustomerSummarySerializer(read_only=True)
     customer_id = serializers.PrimaryKeyRelatedField(
         queryset=Customer.objects.all(), source='customer', write_only=True
     )
@@ -76,6 +108,13 @@ class ParcelSerializer(serializers.ModelSerializer):
             'volume', 'volume_unit', 'charge', 'payment','commodity_type', 'description', 
             'shipment_vessel', 'customer_name', 'shipment_status'
         ]
+
+    def get_fields(self):
+        fields = super().get_fields()
+        # The full customer aggregates are opt-in via ?expand=customer_stats
+        if 'customer_stats' in get_expansions(self.context.get('request')):
+            fields['customer'] = CustomerSerializer(read_only=True)
+        return fields
       
         def to_representation(self, instance):
             representation = super().to_representation(instance)
@@ -83,12 +122,126 @@ class ParcelSerializer(serializers.ModelSerializer):
             return representation
         
         
+class PreloadedRelatedField(serializers.Field):
+    """Resolves a primary key against objects preloaded into the serializer context."""
+    default_error_messages = {
+        'does_not_exist': 'Invalid pk "{pk_value}" - object does not exist.',
+    }
+
+    def __init__(self, context_key, **kwargs):
+        self.context_key = context_key
+        super().__init__(**kwargs)
+
+    def to_internal_value(self, data):
+        obj = self.context[self.context_key].get(str(data))
+        if obj is None:
+            self.fail('does_not_exist', pk_value=data)
+        return obj
+
+    def to_representation(self, value):
+        return value.pk
+
+
+class ParcelImportSerializer(ParcelSerializer):
+    """ParcelSerializer rules for bulk import rows.
+
+    Shipments and customers come from the chunk preloaded by
+    shipments.imports, and parcel number uniqueness is checked there too, so
+    validating a row runs no queries.
+    """
+    shipment = PreloadedRelatedField('shipments')
+    customer_id = PreloadedRelatedField('customers', source='customer', write_only=True)
+
+    class Meta(ParcelSerializer.Meta):
+        extra_kwargs = {'parcel_no': {'validators': []}}
+
+
+class CoordinateField(serializers.DecimalField):
+    """Degrees, rounded to the six decimal places stored instead of rejected."""
+
+    def __init__(self, **kwargs):
+        super().__init__(max_digits=9, decimal_places=6, **kwargs)
+
+    def validate_precision(self, value):
+        return self.quantize(value)
+
+
+class ShipmentPositionSerializer(serializers.ModelSerializer):
+    latitude = CoordinateField(min_value=-90, max_value=90)
+    longitude = CoordinateField(min_value=-180, max_value=180)
+
+    class Meta:
+        model = ShipmentPosition
+        fields = ['shipment', 'recorded_at', 'latitude', 'longitude']
+
+
+class PositionIngestSerializer(ShipmentPositionSerializer):
+    """Validates one ping of a tracker batch against the shipments preloaded
+    by shipments.positions, without queries."""
+    shipment = PreloadedRelatedField('shipments')
+
+    class Meta(ShipmentPositionSerializer.Meta):
+        # Duplicate pings are skipped by the insert
+        validators = []
+
+
+class LatestPositionSerializer(serializers.ModelSerializer):
+    recorded_at = serializers.DateTimeField(source='position_recorded_at', read_only=True)
+
+    class Meta:
+        model = Shipment
+        fields = ['shipment_no', 'transport', 'vessel', 'status', 'latitude', 'longitude', 'recorded_at']
+
+
 class DocumentSerializer(serializers.ModelSerializer):
     class Meta:
         model = Document
         fields = '__all__'
 
 
+class DocumentMetadataSerializer(serializers.ModelSerializer):
+    """The fields of a Document uploaded in chunks; the file comes from the upload."""
+    class Meta:
+        model = Document
+        exclude = ['file']
+
+
+class DocumentUploadSerializer(serializers.ModelSerializer):
+    document = serializers.JSONField(source='metadata', write_only=True)
+    chunk_size = serializers.SerializerMethodField()
+
+    class Meta:
+        model = DocumentUpload
+        fields = ['id', 'filename', 'size', 'checksum', 'document', 'offset', 'chunk_size', 'created_at', 'updated_at']
+        read_only_fields = ['offset']
+        extra_kwargs = {'size': {'min_value': 1}}
+
+    def get_chunk_size(self, obj):
+        return settings.DOCUMENT_UPLOAD_CHUNK_SIZE
+
+    def validate_filename(self, value):
+        filename = get_valid_filename(value.replace('\\', '/').rsplit('/', 1)[-1])
+        if filename in ('', '.', '..'):
+            raise serializers.ValidationError("Invalid file name.")
+        return filename
+
+    def validate_size(self, value):
+        if value > settings.DOCUMENT_UPLOAD_MAX_SIZE:
+            raise serializers.ValidationError(f"Files may not exceed {settings.DOCUMENT_UPLOAD_MAX_SIZE} bytes.")
+        return value
+
+    def validate_checksum(self, value):
+        value = value.lower()
+        if len(value) != 64 or any(c not in '0123456789abcdef' for c in value):
+            raise serializers.ValidationError("Expected the hex SHA-256 of the file.")
+        return value
+
+    def validate_document(self, value):
+        # Checked now so a bad document_no fails before any byte is sent, and again on commit
+        DocumentMetadataSerializer(data=value).is_valid(raise_exception=True)
+        return value
+
+
 class InvoiceItemSerializer(serializers.ModelSerializer):
     parcel_no = serializers.CharField(source='parcel.parcel_no', read_only=True)
     commodity_type = serializers.CharField(source='parcel.commodity_type', read_only=True)
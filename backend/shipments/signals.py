@@ -0,0 +1,115 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .live import LIVE_FIELDS, publish_shipments
+from .models import Shipment, Customer, Parcel, Invoice, Step, Parameter
+from .pdf_cache import delete_invoice_pdfs
+from .reference_cache import bump_version
+from .search import index_object, unindex_object
+from .stats import adjust_monthly_stats, stats_key
+
+
+@receiver(pre_save, sender=Shipment)
+def remember_previous_state(sender, instance, raw=False, **kwargs):
+    previous = None
+    if not raw and not instance._state.adding:
+        previous = Shipment.objects.filter(pk=instance.pk).values_list(
+            'created_at', 'transport', 'vessel', *LIVE_FIELDS
+        ).first()
+    instance._previous_stats_key = stats_key(*previous[:3]) if previous else None
+    instance._previous_live_state = previous[3:] if previous else None
+
+
+@receiver(post_save, sender=Shipment)
+def publish_live_update(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    state = tuple(getattr(instance, field) for field in LIVE_FIELDS)
+    if state != getattr(instance, '_previous_live_state', None):
+        publish_shipments([instance])
+
+
+@receiver(post_save, sender=Shipment)
+def update_stats_on_save(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    key = stats_key(instance.created_at, instance.transport, instance.vessel)
+    previous = getattr(instance, '_previous_stats_key', None)
+    if previous == key:
+        return
+    if previous is not None:
+        adjust_monthly_stats(previous, -1)
+    adjust_monthly_stats(key, 1)
+
+
+@receiver(post_delete, sender=Shipment)
+def update_stats_on_delete(sender, instance, **kwargs):
+    adjust_monthly_stats(stats_key(instance.created_at, instance.transport, instance.vessel), -1)
+
+
+@receiver(post_save, sender=Step)
+@receiver(post_delete, sender=Step)
+def invalidate_step_cache(sender, **kwargs):
+    bump_version('steps')
+
+
+@receiver(post_save, sender=Parameter)
+@receiver(post_delete, sender=Parameter)
+def invalidate_parameter_cache(sender, **kwargs):
+    bump_version('parameters')
+
+
+# Detail representations include counts and totals from related rows, so
+# changes to those rows move the parent's updated_at (the conditional GET
+# validator) as well.
+@receiver(pre_save, sender=Parcel)
+def remember_previous_parents(sender, instance, raw=False, update_fields=None, **kwargs):
+    previous = None
+    moved = update_fields is None or {'shipment', 'customer'} & set(update_fields)
+    if not raw and not instance._state.adding and moved:
+        previous = Parcel.objects.filter(pk=instance.pk).values_list('shipment_id', 'customer_id').first()
+    instance._previous_parents = previous
+
+
+@receiver(post_save, sender=Parcel)
+@receiver(post_delete, sender=Parcel)
+def touch_parcel_parents(sender, instance, **kwargs):
+    # A parcel moved to another shipment or customer changes both parents
+    shipment_ids, customer_ids = {instance.shipment_id}, {instance.customer_id}
+    previous = getattr(instance, '_previous_parents', None)
+    if previous:
+        shipment_ids.add(previous[0])
+        customer_ids.add(previous[1])
+    customer_ids.discard(None)
+
+    now = timezone.now()
+    Shipment.objects.filter(pk__in=shipment_ids).update(updated_at=now)
+    if customer_ids:
+        Customer.objects.filter(pk__in=customer_ids).update(updated_at=now)
+
+
+@receiver(post_save, sender=Invoice)
+@receiver(post_delete, sender=Invoice)
+def touch_invoice_customer(sender, instance, **kwargs):
+    Customer.objects.filter(pk=instance.customer_id).update(updated_at=timezone.now())
+
+
+@receiver(post_delete, sender=Invoice)
+def delete_cached_invoice_pdfs(sender, instance, **kwargs):
+    delete_invoice_pdfs(instance.invoice_no)
+
+
+@receiver(post_save, sender=Shipment)
+@receiver(post_save, sender=Parcel)
+@receiver(post_save, sender=Customer)
+def update_search_entry(sender, instance, raw=False, **kwargs):
+    if not raw:
+        index_object(instance)
+
+
+@receiver(post_delete, sender=Shipment)
+@receiver(post_delete, sender=Parcel)
+@receiver(post_delete, sender=Customer)
+def delete_search_entry(sender, instance, **kwargs):
+    unindex_object(instance)
@@ -0,0 +1,49 @@
+from django.db import IntegrityError, transaction
+from django.db.models import Count, DateField, F
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from .models import Shipment, ShipmentMonthlyStats
+
+
+def stats_key(created_at, transport, vessel):
+    """Rollup key of a shipment: (first day of its creation month, transport, vessel)."""
+    month = timezone.localtime(created_at).date().replace(day=1)
+    return month, transport, vessel
+
+
+def adjust_monthly_stats(key, delta):
+    """Add ``delta`` to the shipment count of one rollup row."""
+    month, transport, vessel = key
+    rows = ShipmentMonthlyStats.objects.filter(month=month, transport=transport, vessel=vessel)
+    if delta < 0:
+        rows.update(shipment_count=F('shipment_count') + delta)
+        rows.filter(shipment_count__lte=0).delete()
+        return
+
+    if rows.update(shipment_count=F('shipment_count') + delta):
+        return
+    try:
+        with transaction.atomic():
+            ShipmentMonthlyStats.objects.create(
+                month=month, transport=transport, vessel=vessel, shipment_count=delta
+            )
+    except IntegrityError:
+        # Another worker created the row first
+        rows.update(shipment_count=F('shipment_count') + delta)
+
+
+def rebuild_monthly_stats():
+    """Recompute the whole rollup from the shipments table. Returns the row count."""
+    rows = (
+        Shipment.objects.order_by()
+        .annotate(month=TruncMonth('created_at', output_field=DateField()))
+        .values('month', 'transport', 'vessel')
+        .annotate(shipment_count=Count('pk'))
+    )
+    with transaction.atomic():
+        ShipmentMonthlyStats.objects.all().delete()
+        stats = ShipmentMonthlyStats.objects.bulk_create(
+            [ShipmentMonthlyStats(**row) for row in rows], batch_size=500
+        )
+    return len(stats)
@@ -1,3 +1,1104 @@
-from django.test import TestCase
+import asyncio
+import base64
+import hashlib
+import io
+import json
+import os
+import re
+import shutil
+import tempfile
+import zipfile
+from contextlib import asynccontextmanager
+from unittest import skipUnless
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import Group, User
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.db import connection, transaction
+from django.test import AsyncClient, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from djmoney.money import Money
+from rest_framework.test import APIClient
+
+from accounts.authentication import ClaimsUser
+from accounts.models import UserProfile
+from accounts.serializers import CustomTokenObtainPairSerializer
+from accounts.utils import set_request_timing_enabled
+from . import live
+from .models import Customer, Document, DocumentUpload, Invoice, InvoiceItem, Parameter, Parcel, Shipment, ShipmentMonthlyStats, ShipmentPosition, Step
+from .pdf import render_invoice_pdf
+from .pdf_cache import cache_path, delete_older_versions
+from .positions import ingest_positions
+from .reference_cache import get_version
+from .stats import rebuild_monthly_stats
+
+
+# Tables that grow with the business. Small reference tables (steps,
+# parameters, groups, the monthly stats rollup) may be scanned.
+LARGE_TABLES = (
+    'shipments_shipment', 'shipments_parcel', 'shipments_customer',
+    'shipments_invoice', 'shipments_invoiceitem', 'shipments_document',
+    'shipments_searchentry', 'shipments_shipmentposition',
+)
+
+FULL_SCAN = re.compile(r'^SCAN (%s)\b(?! VIRTUAL TABLE INDEX)' % '|'.join(LARGE_TABLES))
+SORT = re.compile(r'TEMP B-TREE FOR .*ORDER BY')
+
+# Filtered, role-scoped and detail requests must reach their rows through
+# an index: no query may scan a large table.
+ADMIN_FILTERED_URLS = [
+    '/api/shipments/?status=Delivered',
+    '/api/shipments/?transport=Air',
+    '/api/shipments/?origin=Dar',
+    '/api/shipments/?destination=Dubai',
+    '/api/shipments/?status=Delivered&pagination=cursor',
+    '/api/shipments/S1/',
+    '/api/customers/1/',
+    '/api/parcels/?customer=1',
+    '/api/parcels/?shipment=S1',
+    '/api/parcels/P1/',
+    '/api/documents/?shipment__shipment_no=S1&document_type=Other',
+    '/api/documents/D1/',
+    '/api/invoices/?customer_id=1',
+    '/api/invoices/INV1/',
+    '/api/search/?q=dubai',
+    '/api/positions/?bbox=38,-8,41,-5',
+    '/api/positions/?bbox=170,-10,-170,10',
+    '/api/shipments/S1/positions/?since=2026-01-01T00:00:00Z',
+    '/api/shipments/S1/positions/?bbox=38,-8,41,-5',
+]
+
+CUSTOMER_URLS = [
+    '/api/shipments/',
+    '/api/shipments/?status=Delivered',
+    '/api/customers/',
+    '/api/customers/1/',
+    '/api/parcels/',
+    '/api/parcels/P4/',
+    '/api/documents/',
+    '/api/invoices/',
+    '/api/invoices/?pagination=cursor',
+    '/api/invoices/INV1/',
+    '/api/positions/?bbox=38,-8,41,-5',
+    '/api/shipments/S1/positions/',
+    '/api/search/?q=parcel',
+    '/api/search/?q=dubai&type=shipment',
+]
+
+# Unfiltered keyset pages walk the table or an index in cursor order and
+# stop at the page size, so no query may sort the rows it reads.
+KEYSET_URLS = [
+    '/api/shipments/?pagination=cursor',
+    '/api/customers/?pagination=cursor',
+    '/api/parcels/?pagination=cursor',
+    '/api/documents/?pagination=cursor',
+    '/api/invoices/?pagination=cursor',
+    '/api/positions/?pagination=cursor',
+    '/api/shipments/S1/positions/?pagination=cursor',
+]
+
+
+@skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN output is SQLite specific')
+class QueryPlanTests(TestCase):
+    """Runs EXPLAIN on every query of the hot API paths."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        cls.customer_user = User.objects.create_user('customer', 'customer1@example.com', 'password')
+
+        ports = [('Dar', 'Dubai'), ('Mombasa', 'Shanghai'), ('Dubai', 'Dar')]
+        shipments = [
+            Shipment.objects.create(
+                shipment_no=f'S{i}', transport='Sea' if i % 2 else 'Air', vessel=f'Vessel {i % 3}',
+                weight=100, volume=10, origin=ports[i % 3][0], destination=ports[i % 3][1],
+                status='Delivered' if i % 2 else 'In-transit',
+            )
+            for i in range(1, 7)
+        ]
+        customers = [
+            Customer.objects.create(
+                name=f'Customer {i}', email=f'customer{i}@example.com', phone=f'07000000{i}', address='Dar es Salaam'
+            )
+            for i in range(1, 5)
+        ]
+        for i in range(1, 25):
+            Parcel.objects.create(
+                parcel_no=f'P{i}', shipment=shipments[i % 6], customer=customers[i % 4],
+                weight=2, volume=1, charge=Money(10000, 'TZS'), description=f'Parcel {i}',
+            )
+        for customer in customers:
+            Invoice.objects.create(invoice_no=f'INV{customer.pk}', customer=customer, due_date=timezone.now())
+        for i, shipment in enumerate(shipments, start=1):
+            Document.objects.create(
+                document_no=f'D{i}', shipment=shipment, customer=customers[i % 4],
+                document_type='Other', file='documents/manifest.pdf',
+            )
+        ingest_positions(
+            {
+                'shipment': shipment.pk, 'recorded_at': f'2026-01-01T{hour:02d}:00:00Z',
+                'latitude': -6.8 + i + hour / 100, 'longitude': 39.3 + i * 20,
+            }
+            for i, shipment in enumerate(shipments) for hour in range(6)
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def login(self, user):
+        token = CustomTokenObtainPairSerializer.get_token(user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    def query_plans(self, url):
+        """Yield (sql, plan lines) for every SELECT run by a GET of ``url``."""
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, url)
+
+        for query in queries.captured_queries:
+            sql = query['sql']
+            if not sql.startswith('SELECT'):
+                continue
+            with connection.cursor() as cursor:
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+                yield sql, [row[-1] for row in cursor.fetchall()]
+
+    def assertNoFullScans(self, urls):
+        for url in urls:
+            for sql, plan in self.query_plans(url):
+                with self.subTest(url=url, sql=sql):
+                    scans = [line for line in plan if FULL_SCAN.match(line)]
+                    self.assertEqual(scans, [], f'{url} scans a large table:\n{sql}\n{plan}')
+
+    def test_admin_filtered_queries_use_indexes(self):
+        self.login(self.admin)
+        self.assertNoFullScans(ADMIN_FILTERED_URLS)
+
+    def test_customer_queries_use_indexes(self):
+        self.login(self.customer_user)
+        self.assertNoFullScans(CUSTOMER_URLS)
+
+    def test_keyset_pages_need_no_sort(self):
+        self.login(self.admin)
+        for url in KEYSET_URLS:
+            for sql, plan in self.query_plans(url):
+                with self.subTest(url=url, sql=sql):
+                    sorts = [line for line in plan if SORT.search(line)]
+                    self.assertEqual(sorts, [], f'{url} sorts its rows:\n{sql}\n{plan}')
+
+
+class APITestCase(TestCase):
+    def setUp(self):
+        # Forget role changes made by the fixtures, so tokens issued within
+        # the same second are trusted and reads get a claims-only user
+        UserProfile.objects.update(role_changed_at=None)
+        cache.clear()
+        self.client = APIClient()
+
+    def login(self, user):
+        token = CustomTokenObtainPairSerializer.get_token(user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+
+
+@override_settings(DOCUMENT_UPLOAD_MAX_CHUNK_SIZE=1000)
+class DocumentUploadTests(APITestCase):
+    """The chunked upload protocol: open, send chunks, resume, commit."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        media_root = tempfile.mkdtemp()
+        cls.addClassCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        cls.enterClassContext(override_settings(MEDIA_ROOT=media_root))
+
+    @classmethod
+    def setUpTestData(cls):
+        staff = Group.objects.get(name='staff')
+        cls.staff = User.objects.create_user('staff', 'staff@example.com', 'password')
+        cls.staff.groups.add(staff)
+        cls.other_staff = User.objects.create_user('other', 'other@example.com', 'password')
+        cls.other_staff.groups.add(staff)
+        Shipment.objects.create(
+            shipment_no='S1', transport='Sea', vessel='Vessel', weight=100, volume=10,
+            origin='Dar', destination='Dubai', status='In-transit',
+        )
+
+    def setUp(self):
+        super().setUp()
+        self.login(self.staff)
+        self.data = os.urandom(2500)
+
+    def open_upload(self, checksum=None):
+        response = self.client.post('/api/documents/uploads/', {
+            'filename': 'bill.pdf', 'size': len(self.data),
+            'checksum': checksum or hashlib.sha256(self.data).hexdigest(),
+            'document': {'document_no': 'D1', 'shipment': 'S1', 'document_type': 'Bill_of_lading'},
+        }, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        return f"/api/documents/uploads/{response.data['id']}/"
+
+    def send(self, url, start, end, method='PATCH', digest=None):
+        chunk = self.data[start:end]
+        digest = digest or hashlib.sha256(chunk).digest()
+        return self.client.generic(
+            method, url, chunk, content_type='application/octet-stream',
+            HTTP_CONTENT_RANGE=f'bytes {start}-{end - 1}/{len(self.data)}',
+            HTTP_CONTENT_DIGEST=f'sha-256=:{base64.b64encode(digest).decode()}:',
+        )
+
+    def test_upload_resume_and_commit(self):
+        url = self.open_upload()
+        self.assertEqual(self.send(url, 0, 1000).data['offset'], 1000)
+        self.assertEqual(self.send(url, 1000, 2000, method='PUT').data['offset'], 2000)
+
+        # The resume GET is a read, authenticated from the token claims alone
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['offset'], 2000)
+
+        self.assertEqual(self.send(url, 2000, 2500).status_code, 200)
+        response = self.client.post(f'{url}commit/', {'description': 'Scanned'}, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+
+        document = Document.objects.get(pk='D1')
+        self.assertEqual(document.description, 'Scanned')
+        with document.file.open('rb') as f:
+            self.assertEqual(f.read(), self.data)
+        self.assertFalse(DocumentUpload.objects.exists())
+
+    def test_chunk_at_wrong_offset_is_rejected(self):
+        url = self.open_upload()
+        self.send(url, 0, 1000)
+        for start, end in [(0, 1000), (2000, 2500)]:
+            response = self.send(url, start, end)
+            self.assertEqual(response.status_code, 409)
+            self.assertEqual(response.data['offset'], 1000)
+
+    def test_chunk_digest_mismatch_is_rejected(self):
+        url = self.open_upload()
+        response = self.send(url, 0, 1000, digest=b'0' * 32)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['offset'], 0)
+
+    def test_file_checksum_mismatch_discards_upload(self):
+        url = self.open_upload(checksum='0' * 64)
+        for start in range(0, 2500, 1000):
+            self.send(url, start, min(start + 1000, 2500))
+        response = self.client.post(f'{url}commit/', format='json')
+        self.assertEqual(response.status_code, 422)
+        self.assertFalse(Document.objects.exists())
+        self.assertFalse(DocumentUpload.objects.exists())
+
+    def test_uploads_belong_to_their_creator(self):
+        url = self.open_upload()
+        self.login(self.other_staff)
+        self.assertEqual(self.client.get(url).status_code, 404)
+        self.assertEqual(self.send(url, 0, 1000).status_code, 404)
+        self.assertEqual(self.client.post(f'{url}commit/', format='json').status_code, 404)
+
+
+class SearchTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer_user = User.objects.create_user('customer', 'owner@example.com', 'password')
+        owner = Customer.objects.create(name='Owner', email='owner@example.com', phone='0700000001', address='Dar')
+        other = Customer.objects.create(name='Other', email='other@example.com', phone='0700000002', address='Dar')
+        mine, theirs = (
+            Shipment.objects.create(
+                shipment_no=shipment_no, transport='Sea', vessel='Vessel', weight=100, volume=10,
+                origin='Dar', destination='Dubai', status='In-transit',
+            )
+            for shipment_no in ('SHIP1', 'SHIP2')
+        )
+        Parcel.objects.create(parcel_no='P100', shipment=mine, customer=owner, weight=2, volume=1, charge=Money(10, 'TZS'))
+        # Newer matches of other customers rank first and would fill the limit
+        for i in range(101, 131):
+            Parcel.objects.create(parcel_no=f'P{i}', shipment=theirs, customer=other, weight=2, volume=1, charge=Money(10, 'TZS'))
+
+    def search(self, query):
+        response = self.client.get('/api/search/', {'q': query, 'limit': 5})
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_customer_finds_own_parcel_beyond_other_matches(self):
+        self.login(self.customer_user)
+        results = self.search('P10')
+        self.assertEqual([parcel['parcel_no'] for parcel in results['parcels']], ['P100'])
+
+    def test_customer_sees_only_own_shipments_and_profile(self):
+        self.login(self.customer_user)
+        results = self.search('dar')
+        self.assertEqual([shipment['shipment_no'] for shipment in results['shipments']], ['SHIP1'])
+        results = self.search('example.com')
+        self.assertEqual([customer['email'] for customer in results['customers']], ['owner@example.com'])
+
+    def test_customer_without_profile_finds_nothing(self):
+        self.login(User.objects.create_user('nobody', 'nobody@example.com', 'password'))
+        results = self.search('P10')
+        self.assertEqual((results['shipments'], results['parcels'], results['customers']), ([], [], []))
+
+    def test_limit_is_clamped(self):
+        self.login(User.objects.create_superuser('admin', 'admin@example.com', 'password'))
+        for limit, count in (('-1', 1), ('0', 1), ('1000', 31)):
+            with self.subTest(limit=limit):
+                response = self.client.get('/api/search/', {'q': 'P1', 'type': 'parcel', 'limit': limit})
+                self.assertEqual(len(response.data['parcels']), count)
+
+
+class RoleReadTests(APITestCase):
+    """Every GET endpoint works with the claims-only user that reads authenticate."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # The invoice PDF and bundle endpoints render into the PDF cache
+        cache_dir = tempfile.mkdtemp()
+        cls.addClassCleanup(shutil.rmtree, cache_dir, ignore_errors=True)
+        cls.enterClassContext(override_settings(INVOICE_PDF_CACHE_DIR=cache_dir))
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        cls.staff = User.objects.create_user('staff', 'staff@example.com', 'password')
+        cls.staff.groups.add(Group.objects.get(name='staff'))
+        cls.customer_user = User.objects.create_user('customer', 'customer@example.com', 'password')
+
+        shipment = Shipment.objects.create(
+            shipment_no='S1', transport='Sea', vessel='Vessel', weight=100, volume=10,
+            origin='Dar', destination='Dubai', status='In-transit',
+        )
+        cls.customer = Customer.objects.create(
+            name='Customer', email='customer@example.com', phone='0700000001', address='Dar',
+        )
+        Parcel.objects.create(parcel_no='P1', shipment=shipment, customer=cls.customer, weight=2, volume=1, charge=Money(10, 'TZS'))
+        Document.objects.create(
+            document_no='D1', shipment=shipment, customer=cls.customer, document_type='Other', file='documents/manifest.pdf',
+        )
+        Invoice.objects.create(invoice_no='INV1', customer=cls.customer, due_date=timezone.now())
+        Step.objects.create(name='Loaded')
+        Parameter.objects.create(category='vessel', name='Vessel')
+        ingest_positions([{'shipment': 'S1', 'recorded_at': '2026-01-01T00:00:00Z', 'latitude': -6.8, 'longitude': 39.3}])
+        cls.upload = DocumentUpload.objects.create(created_by=cls.staff, filename='bill.pdf', size=10, checksum='0' * 64)
+
+    def urls(self):
+        customer = self.customer.pk
+        return {
+            '/api/shipments/': 200,
+            '/api/shipments/export/': 200,
+            '/api/shipments/S1/': 200,
+            '/api/shipments/S1/customers/': 200,
+            '/api/shipments/S1/positions/': 200,
+            '/api/shipments/S1/bundle/': 200,
+            '/api/positions/': 200,
+            '/api/customers/': 200,
+            '/api/customers/export/': 200,
+            f'/api/customers/{customer}/': 200,
+            '/api/parcels/': 200,
+            '/api/parcels/export/': 200,
+            '/api/parcels/P1/': 200,
+            '/api/documents/': 200,
+            '/api/documents/D1/': 200,
+            f'/api/documents/uploads/{self.upload.pk}/': 200,
+            '/api/invoices/': 200,
+            '/api/invoices/export/': 200,
+            '/api/invoices/INV1/': 200,
+            '/api/search/?q=dar': 200,
+            '/api/metrics/': 200,
+            '/api/chart-data/': 200,
+            '/api/steps/': 200,
+            '/api/steps/active/': 200,
+            '/api/parameters/': 200,
+        }
+
+    def assertReads(self, user, **expected):
+        self.login(user)
+        for url, status_code in self.urls().items():
+            status_code = expected.get(url, status_code)
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                if response.streaming:
+                    b''.join(response.streaming_content)
+                self.assertEqual(response.status_code, status_code, url)
+                self.assertIsInstance(response.wsgi_request.user, ClaimsUser)
+
+    def test_admin_reads(self):
+        self.assertReads(self.admin)
+
+    def test_staff_reads(self):
+        # IsSelfOrAdmin keeps customer details to admins and the customer
+        self.assertReads(self.staff, **{'/api/metrics/': 403, f'/api/customers/{self.customer.pk}/': 403})
+
+    def test_customer_reads(self):
+        # Object permissions only let customers open objects with their own customer or email
+        self.assertReads(self.customer_user, **{
+            '/api/metrics/': 403,
+            f'/api/documents/uploads/{self.upload.pk}/': 403,
+            '/api/shipments/S1/': 403,
+            '/api/shipments/S1/bundle/': 403,
+        })
+
+
+class MonthlyStatsTests(APITestCase):
+    """The ShipmentMonthlyStats rollup kept by signals, and the chart data read from it."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+
+    def create(self, shipment_no, transport, vessel):
+        return Shipment.objects.create(
+            shipment_no=shipment_no, transport=transport, vessel=vessel, weight=100, volume=10,
+            origin='Dar', destination='Dubai', status='Not-boarded',
+        )
+
+    def counts(self):
+        return {
+            (row.transport, row.vessel): row.shipment_count
+            for row in ShipmentMonthlyStats.objects.filter(month=timezone.localdate().replace(day=1))
+        }
+
+    def test_signals_keep_the_rollup_current(self):
+        self.create('S1', 'Sea', 'Vessel')
+        second = self.create('S2', 'Sea', 'Vessel')
+        plane = self.create('A1', 'Air', 'Plane')
+        self.assertEqual(self.counts(), {('Sea', 'Vessel'): 2, ('Air', 'Plane'): 1})
+
+        second.vessel = 'Ferry'
+        second.save()
+        self.assertEqual(self.counts(), {('Sea', 'Vessel'): 1, ('Sea', 'Ferry'): 1, ('Air', 'Plane'): 1})
+
+        second.transport, second.vessel = 'Air', 'Plane'
+        second.save()
+        second.status = 'In-transit'
+        second.save()
+        self.assertEqual(self.counts(), {('Sea', 'Vessel'): 1, ('Air', 'Plane'): 2})
+
+        plane.delete()
+        second.delete()
+        self.assertEqual(self.counts(), {('Sea', 'Vessel'): 1})
+
+        rollup = self.counts()
+        rebuild_monthly_stats()
+        self.assertEqual(self.counts(), rollup)
+
+    def test_chart_data_reads_the_rollup(self):
+        for shipment_no, transport, vessel in (('S1', 'Sea', 'Vessel'), ('S2', 'Sea', 'Vessel'), ('A1', 'Air', 'Plane')):
+            self.create(shipment_no, transport, vessel)
+        self.login(self.admin)
+
+        response = self.client.get('/api/chart-data/')
+        self.assertEqual(response.status_code, 200)
+        month = timezone.localdate().replace(day=1)
+        self.assertEqual(
+            [{key: row[key] for key in ('name', 'air', 'sea')} for row in response.data['revenueData']],
+            [{'name': f'{month:%Y-%m}', 'air': 1, 'sea': 2}],
+        )
+        self.assertEqual(response.data['airVehicleData'], [{'vessel': 'Plane', 'value': 1}])
+        # Marine vessels are the 'Sea' transport choice
+        self.assertEqual(response.data['marineVehicleData'], [{'vessel': 'Vessel', 'value': 2}])
+
+        ShipmentMonthlyStats.objects.filter(transport='Sea').update(shipment_count=5)
+        response = self.client.get('/api/chart-data/')
+        self.assertEqual(response.data['marineVehicleData'], [{'vessel': 'Vessel', 'value': 5}])
+
+
+class ListQueryCountTests(APITestCase):
+    """List pages cost the same number of queries whatever rows they hold."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        cls.customer_user = User.objects.create_user('customer', 'customer1@example.com', 'password')
+        cls.shipment = Shipment.objects.create(
+            shipment_no='S1', transport='Sea', vessel='Vessel', weight=100, volume=10,
+            origin='Dar', destination='Dubai', status='In-transit',
+        )
+        cls.customers = [
+            Customer.objects.create(name=f'Customer {i}', email=f'customer{i}@example.com', phone=f'07000000{i}', address='Dar')
+            for i in range(1, 4)
+        ]
+
+    def add_invoices(self, count):
+        for _ in range(count):
+            number = Invoice.objects.count() + 1
+            customer = self.customers[number % 2]
+            invoice = Invoice.objects.create(invoice_no=f'INV{number}', customer=customer, due_date=timezone.now())
+            for j in range(2):
+                parcel = Parcel.objects.create(
+                    parcel_no=f'P{number}-{j}', shipment=self.shipment, customer=customer,
+                    weight=2, volume=1, charge=Money(10, 'TZS'),
+                )
+                InvoiceItem.objects.create(invoice=invoice, parcel=parcel, cost=Money(10, 'TZS'))
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries.captured_queries)
+
+    def assertConstantQueries(self, url, add_rows):
+        add_rows(2)
+        self.client.get(url)  # fill the per-user caches
+        small = self.count_queries(url)
+        add_rows(6)
+        self.assertEqual(self.count_queries(url), small, url)
+
+    def test_invoice_list_admin(self):
+        self.login(self.admin)
+        self.assertConstantQueries('/api/invoices/', self.add_invoices)
+
+    def test_invoice_list_customer(self):
+        self.login(self.customer_user)
+        self.assertConstantQueries('/api/invoices/', self.add_invoices)
+        self.assertConstantQueries('/api/invoices/?pagination=cursor', self.add_invoices)
+
+    def add_parcels(self, count, shipment=None):
+        for _ in range(count):
+            number = Parcel.objects.count() + 1
+            Parcel.objects.create(
+                parcel_no=f'X{number}', shipment=shipment or self.shipment, customer=self.customers[number % 3],
+                weight=2, volume=1, charge=Money(10, 'TZS'),
+            )
+
+    def add_customers(self, count):
+        for _ in range(count):
+            number = Customer.objects.count() + 1
+            customer = Customer.objects.create(name=f'Customer {number}', email=f'customer{number}@example.com', phone=f'08{number}', address='Dar')
+            Parcel.objects.create(
+                parcel_no=f'C{number}', shipment=self.shipment, customer=customer, weight=2, volume=1, charge=Money(10, 'TZS'),
+            )
+
+    def add_shipments(self, count):
+        for _ in range(count):
+            shipment = Shipment.objects.create(
+                shipment_no=f'S{Shipment.objects.count() + 1}', transport='Sea', vessel='Vessel', weight=100, volume=10,
+                origin='Dar', destination='Dubai', status='In-transit',
+            )
+            self.add_parcels(3, shipment)
+
+    def test_customer_list(self):
+        self.login(self.admin)
+        self.assertConstantQueries('/api/customers/', self.add_customers)
+
+    def test_shipment_list_counts(self):
+        self.login(self.admin)
+        self.assertConstantQueries('/api/shipments/', self.add_shipments)
+        counts = {row['shipment_no']: (row['customer_count'], row['parcel_count']) for row in self.client.get('/api/shipments/').data['results']}
+        self.assertEqual(counts['S2'], (3, 3))
+
+    def test_parcel_list(self):
+        self.login(self.admin)
+        self.assertConstantQueries('/api/parcels/', self.add_parcels)
+        self.assertConstantQueries('/api/parcels/?expand=customer_stats', self.add_parcels)
+
+
+class ReferenceCacheTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        cls.step = Step.objects.create(name='Loaded')
+        cls.parameter = Parameter.objects.create(category='vessel', name='Vessel')
+
+    def get_etag(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response['ETag']
+
+    def test_etag_is_stable_until_an_edit(self):
+        self.login(self.admin)
+        for url, detail, data in (
+            ('/api/steps/', f'/api/steps/{self.step.pk}/', {'name': 'Boarded'}),
+            ('/api/parameters/', f'/api/parameters/{self.parameter.pk}/', {'name': 'Ferry'}),
+        ):
+            etag = self.get_etag(url)
+            self.assertEqual(self.get_etag(url), etag)
+
+            with self.captureOnCommitCallbacks(execute=True):
+                self.assertEqual(self.client.patch(detail, data, format='json').status_code, 200)
+            self.assertNotEqual(self.get_etag(url), etag, url)
+
+    def test_matching_if_none_match_gets_304_without_queries(self):
+        self.login(self.admin)
+        etag = self.get_etag('/api/steps/')
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/steps/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+        response = self.client.get('/api/steps/', HTTP_IF_NONE_MATCH='"stale"')
+        self.assertEqual(response.status_code, 200)
+
+    def test_version_moves_on_commit_only(self):
+        version = get_version('steps')
+        with self.captureOnCommitCallbacks(execute=True):
+            step = Step.objects.create(name='Loaded')
+            self.assertEqual(get_version('steps'), version)
+        self.assertNotEqual(get_version('steps'), version)
+
+        version = get_version('steps')
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    step.delete()
+                    raise RuntimeError
+            except RuntimeError:
+                pass
+        self.assertEqual(get_version('steps'), version)
+
+
+class ConditionalGetTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        cls.shipments = [
+            Shipment.objects.create(
+                shipment_no=f'S{i}', transport='Sea', vessel='Vessel', weight=100, volume=10,
+                origin='Dar', destination='Dubai', status='In-transit',
+            )
+            for i in (1, 2)
+        ]
+        cls.customers = [
+            Customer.objects.create(name=f'Customer {i}', email=f'customer{i}@example.com', phone=f'07000000{i}', address='Dar')
+            for i in (1, 2)
+        ]
+        cls.parcel = Parcel.objects.create(
+            parcel_no='P1', shipment=cls.shipments[0], customer=cls.customers[0], weight=2, volume=1, charge=Money(10, 'TZS'),
+        )
+
+    def etag(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response['ETag']
+
+    def test_moving_a_parcel_changes_both_parents(self):
+        self.login(self.admin)
+        urls = ['/api/shipments/S1/', '/api/shipments/S2/', f'/api/customers/{self.customers[0].pk}/', f'/api/customers/{self.customers[1].pk}/']
+        etags = {url: self.etag(url) for url in urls}
+
+        self.parcel.shipment, self.parcel.customer = self.shipments[1], self.customers[1]
+        self.parcel.save()
+
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etags[url]).status_code, 200)
+
+
+class BundleTests(APITestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        media_root = tempfile.mkdtemp()
+        cls.addClassCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        cls.enterClassContext(override_settings(MEDIA_ROOT=media_root))
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        shipment = Shipment.objects.create(
+            shipment_no='S1', transport='Sea', vessel='Vessel', weight=100, volume=10,
+            origin='Dar', destination='Dubai', status='In-transit',
+        )
+        Document.objects.create(document_no='D1', shipment=shipment, document_type='Other', file='documents/gone.pdf')
+
+    def test_missing_files_are_listed_in_the_archive(self):
+        document = Document(document_no='D2', shipment_id='S1', document_type='Other')
+        document.file.save('manifest.txt', ContentFile(b'manifest'))
+        self.login(self.admin)
+
+        response = self.client.get('/api/shipments/S1/bundle/')
+        self.assertEqual(response.status_code, 200)
+        with zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content))) as archive:
+            self.assertEqual(archive.read('documents/D2_manifest.txt'), b'manifest')
+            self.assertIn('documents/D1_gone.pdf', archive.read('MISSING.txt').decode())
+
+
+class PdfCacheTests(TestCase):
+    def setUp(self):
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir, ignore_errors=True)
+        self.enterContext(override_settings(INVOICE_PDF_CACHE_DIR=cache_dir))
+
+    def cached(self, invoice_no, digest):
+        path = cache_path(invoice_no, digest)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        open(path, 'wb').close()
+        return path
+
+    def test_new_version_replaces_older_ones(self):
+        old, other = self.cached('INV1', 'a' * 64), self.cached('INV2', 'a' * 64)
+        new = self.cached('INV1', 'b' * 64)
+        delete_older_versions(new)
+        self.assertFalse(os.path.exists(old))
+        self.assertTrue(os.path.exists(new))
+        self.assertTrue(os.path.exists(other))
+
+    def test_deleted_invoice_drops_its_pdfs(self):
+        customer = Customer.objects.create(name='Customer', email='customer@example.com', phone='1', address='Dar')
+        invoice = Invoice.objects.create(invoice_no='INV1', customer=customer, due_date=timezone.now())
+        path = self.cached(invoice.invoice_no, 'a' * 64)
+        invoice.delete()
+        self.assertFalse(os.path.exists(os.path.dirname(path)))
+
+    def test_render_compresses_every_page(self):
+        payload = {
+            'invoice': {
+                'invoice_no': 'INV1', 'issue_date': '2026-01-01', 'due_date': '2026-02-01', 'status': 'Unpaid',
+                'currency': 'TZS', 'total_amount': '100', 'tax': '18', 'final_amount': '118',
+            },
+            'customer': {'name': 'Customer', 'email': 'customer@example.com', 'phone': '1', 'address': 'Dar'},
+            'items': [[f'P{i}', 'General', f'Parcel {i}', '1.00'] for i in range(100)],
+        }
+        path = self.cached('INV1', 'a' * 64)
+        with open(render_invoice_pdf(payload, path), 'rb') as f:
+            data = f.read()
+        self.assertIn(b'/Count 4', data)
+        self.assertEqual(len(re.findall(rb'<<\s*/Filter \[ /FlateDecode \] /Length \d+\s*>>\s*stream', data)), 4)
+        self.assertTrue(data.endswith(b'%%EOF\n'))
+
+
+@override_settings(LIVE_UPDATES_BROKER='shipments.live.InMemoryBroker')
+class LiveUpdateTests(TestCase):
+    """The /api/events/ stream, served with the in-memory broker."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        cls.customer_user = User.objects.create_user('customer', 'customer@example.com', 'password')
+        customer = Customer.objects.create(name='Customer', email='customer@example.com', phone='1', address='Dar')
+        for shipment_no in ('S1', 'S2'):
+            Shipment.objects.create(
+                shipment_no=shipment_no, transport='Sea', vessel='Vessel', weight=100, volume=10,
+                origin='Dar', destination='Dubai', status='Not-boarded',
+            )
+        Parcel.objects.create(
+            parcel_no='P1', shipment_id='S1', customer=customer, weight=2, volume=1, charge=Money(10000, 'TZS'),
+        )
+
+    def setUp(self):
+        cache.clear()
+        live._broker = None
+        self.addCleanup(setattr, live, '_broker', None)
+        self.client = AsyncClient()
+
+    @asynccontextmanager
+    async def open_stream(self, user, path='/api/events/', **headers):
+        token = await sync_to_async(CustomTokenObtainPairSerializer.get_token)(user)
+        response = await self.client.get(path, headers={'Authorization': f'Bearer {token.access_token}', **headers})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        stream = response.streaming_content
+        try:
+            self.assertEqual(await anext(stream), b'retry: 5000\n\n')
+            yield stream
+        finally:
+            await stream.aclose()
+
+    async def next_event(self, stream):
+        chunk = await asyncio.wait_for(anext(stream), timeout=5)
+        return chunk.decode()
+
+    @sync_to_async
+    def set_status(self, shipment_no, status):
+        with self.captureOnCommitCallbacks(execute=True):
+            shipment = Shipment.objects.get(pk=shipment_no)
+            shipment.status = status
+            shipment.save()
+
+    async def test_shipment_event_format(self):
+        async with self.open_stream(self.admin) as stream:
+            await self.set_status('S1', 'In-transit')
+            lines = (await self.next_event(stream)).split('\n')
+            self.assertEqual(lines[:2], ['id: 1', 'event: shipment'])
+            data = json.loads(lines[2].removeprefix('data: '))
+            self.assertEqual(data['shipment_no'], 'S1')
+            self.assertEqual(data['status'], 'In-transit')
+            self.assertNotIn('customers', data)
+            self.assertEqual(lines[3:], ['', ''])
+
+    async def test_customer_only_receives_own_shipments(self):
+        async with self.open_stream(self.customer_user) as stream:
+            await self.set_status('S2', 'In-transit')
+            await self.set_status('S1', 'In-transit')
+            self.assertIn('"shipment_no": "S1"', await self.next_event(stream))
+
+    async def test_shipment_filter(self):
+        async with self.open_stream(self.admin, '/api/events/?shipment=S2') as stream:
+            await self.set_status('S1', 'In-transit')
+            await self.set_status('S2', 'In-transit')
+            self.assertIn('"shipment_no": "S2"', await self.next_event(stream))
+
+    async def test_last_event_id_replays_missed_events(self):
+        for status in ('In-transit', 'Delivered'):
+            await self.set_status('S2', status)
+            await self.set_status('S1', status)
+        async with self.open_stream(self.customer_user, **{'Last-Event-ID': '2'}) as stream:
+            event = await self.next_event(stream)
+            self.assertTrue(event.startswith('id: 4\n'))
+            self.assertIn('"status": "Delivered"', event)
+
+    async def test_unknown_last_event_id_asks_for_resync(self):
+        await self.set_status('S1', 'In-transit')
+        async with self.open_stream(self.admin, **{'Last-Event-ID': '99'}) as stream:
+            self.assertEqual(await self.next_event(stream), 'event: resync\ndata: {"type": "resync"}\n\n')
+
+    async def test_disconnect_unsubscribes(self):
+        async with self.open_stream(self.admin) as stream:
+            broker = live.get_broker()
+            self.assertEqual(len(broker.subscriptions), 1)
+            # The ASGI handler cancels the response when the client disconnects
+            waiting = asyncio.create_task(anext(stream))
+            await asyncio.sleep(0.1)
+            waiting.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await waiting
+            self.assertEqual(broker.subscriptions, set())
+
+    @override_settings(LIVE_UPDATES_REPLAY_EVENTS=2)
+    def test_replay_is_bounded(self):
+        broker = live.InMemoryBroker()
+        broker.publish([{'type': 'shipment', 'shipment_no': 'S1', 'customers': []} for _ in range(4)])
+        subscription = live.Subscription(None)
+        self.assertEqual([event['id'] for event in broker.subscribe(subscription, 2)], [3, 4])
+        self.assertEqual(broker.subscribe(subscription, 1), [{'type': 'resync'}])
+
+
+class RequestTimingTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        Shipment.objects.create(
+            shipment_no='S1', transport='Sea', vessel='Vessel', weight=100, volume=10,
+            origin='Dar', destination='Dubai', status='In-transit',
+        )
+
+    def test_server_timing_reports_view_time(self):
+        set_request_timing_enabled(True)
+        self.login(self.admin)
+        with self.assertLogs('shipments.middleware') as logs:
+            response = self.client.get('/api/shipments/')
+        self.assertRegex(response['Server-Timing'], r'^db;dur=[\d.]+;desc="\d+ queries", view;dur=[\d.]+;')
+        line = json.loads(logs.records[0].getMessage())
+        self.assertGreater(line['view_ms'], 0)
+        self.assertGreater(line['render_ms'], 0)
+
+
+class ParcelStatusTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.shipment = Shipment.objects.create(
+            shipment_no='S1', transport='Sea', vessel='Vessel', weight=100, volume=10,
+            origin='Dar', destination='Dubai', status='In-transit',
+        )
+
+    def test_status_comes_from_the_loaded_shipment(self):
+        parcel = Parcel.objects.create(
+            parcel_no='P1', shipment=self.shipment, weight=2, volume=1, charge=Money(10000, 'TZS'),
+        )
+        self.assertEqual(parcel.status, 'In-transit')
+
+        self.shipment.status = 'Delivered'
+        self.shipment.save()
+        parcel = Parcel.objects.get(pk='P1')
+        self.assertEqual(parcel.status, 'Delivered')
+        parcel.description = 'Spare parts'
+        with CaptureQueriesContext(connection) as queries:
+            parcel.save()
+        self.assertFalse([
+            query['sql'] for query in queries.captured_queries
+            if query['sql'].startswith('SELECT') and 'FROM "shipments_shipment"' in query['sql']
+        ])
+
+    def test_unchanged_status_skips_the_parcel_sync(self):
+        def parcel_updates(queries):
+            return [query for query in queries.captured_queries if query['sql'].startswith('UPDATE "shipments_parcel"')]
+
+        with CaptureQueriesContext(connection) as queries:
+            shipment = Shipment.objects.create(
+                shipment_no='S2', transport='Sea', vessel='Vessel', weight=100, volume=10,
+                origin='Dar', destination='Dubai', status='Not-boarded',
+            )
+        self.assertEqual(parcel_updates(queries), [])
+        Parcel.objects.create(parcel_no='P2', shipment=shipment, weight=2, volume=1, charge=Money(10000, 'TZS'))
+
+        shipment = Shipment.objects.get(pk='S2')
+        shipment.destination = 'Mombasa'
+        with CaptureQueriesContext(connection) as queries:
+            shipment.save()
+        self.assertEqual(parcel_updates(queries), [])
+
+        shipment.status = 'In-transit'
+        with CaptureQueriesContext(connection) as queries:
+            shipment.save()
+            shipment.save()
+        self.assertEqual(len(parcel_updates(queries)), 1)
+        self.assertEqual(Parcel.objects.get(pk='P2').status, 'In-transit')
+
+
+class InvoicingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.shipment = Shipment.objects.create(
+            shipment_no='S1', transport='Sea', vessel='Vessel', weight=100, volume=10,
+            origin='Dar', destination='Dubai', status='In-transit',
+        )
+
+    def customer_with_parcels(self, name, count):
+        customer = Customer.objects.create(name=name, email=f'{name}@example.com', phone=name, address='Dar')
+        for i in range(count):
+            Parcel.objects.create(
+                parcel_no=f'{name}-{i}', shipment=self.shipment, customer=customer,
+                weight=2, volume=1, charge=Money(1000, 'TZS'),
+            )
+        return customer
+
+    def test_billing_query_count_does_not_grow_with_parcels(self):
+        invoices = [
+            Invoice(invoice_no=f'INV{count}', customer=self.customer_with_parcels(f'c{count}', count), due_date=timezone.now(), tax=Money(500, 'TZS'))
+            for count in (5, 10)
+        ]
+        with CaptureQueriesContext(connection) as queries:
+            invoices[0].save()
+        with self.assertNumQueries(len(queries)):
+            invoices[1].save()
+
+        for invoice, count in zip(invoices, (5, 10)):
+            invoice.refresh_from_db()
+            self.assertEqual(invoice.items.count(), count)
+            self.assertEqual(invoice.total_amount, Money(1000 * count, 'TZS'))
+            self.assertEqual(invoice.final_amount, Money(1000 * count + 500, 'TZS'))
+
+
+class DirtyInvoiceTests(TestCase):
+    """Item saves recalculate the invoice totals once, when the transaction commits."""
+
+    @classmethod
+    def setUpTestData(cls):
+        shipment = Shipment.objects.create(
+            shipment_no='S1', transport='Sea', vessel='Vessel', weight=100, volume=10,
+            origin='Dar', destination='Dubai', status='In-transit',
+        )
+        customer = Customer.objects.create(name='Customer', email='customer@example.com', phone='1', address='Dar')
+        cls.invoice = Invoice.objects.create(invoice_no='INV1', customer=customer, due_date=timezone.now())
+        cls.parcels = [
+            Parcel.objects.create(
+                parcel_no=f'P{i}', shipment=shipment, customer=customer, weight=2, volume=1, charge=Money(1000, 'TZS'),
+            )
+            for i in range(3)
+        ]
+
+    def add_items(self):
+        for parcel in self.parcels:
+            InvoiceItem(invoice=self.invoice, parcel=parcel).save()
+
+    def total(self):
+        return Invoice.objects.get(pk='INV1').total_amount
+
+    def test_one_recalculation_per_transaction(self):
+        with CaptureQueriesContext(connection) as queries:
+            with self.captureOnCommitCallbacks(execute=True) as callbacks:
+                with transaction.atomic():
+                    self.add_items()
+        self.assertEqual(len(callbacks), 1)
+        updates = [query for query in queries.captured_queries if query['sql'].startswith('UPDATE "shipments_invoice"')]
+        self.assertEqual(len(updates), 1)
+        self.assertEqual(self.total(), Money(3000, 'TZS'))
+
+    def test_rolled_back_items_leave_totals_untouched(self):
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            try:
+                with transaction.atomic():
+                    self.add_items()
+                    raise RuntimeError
+            except RuntimeError:
+                pass
+        self.assertEqual(callbacks, [])
+        self.assertEqual(self.total(), Money(0, 'TZS'))
+
+        # The discarded batch is not reused by the next transaction
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            InvoiceItem(invoice=self.invoice, parcel=self.parcels[0]).save()
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(self.total(), Money(1000, 'TZS'))
+
+
+class DirtyInvoiceAutocommitTests(TransactionTestCase):
+    """Outside a transaction the totals are recalculated right away."""
+
+    def test_delete_outside_a_transaction(self):
+        shipment = Shipment.objects.create(
+            shipment_no='S1', transport='Sea', vessel='Vessel', weight=100, volume=10,
+            origin='Dar', destination='Dubai', status='In-transit',
+        )
+        customer = Customer.objects.create(name='Customer', email='customer@example.com', phone='1', address='Dar')
+        for i in range(2):
+            Parcel.objects.create(
+                parcel_no=f'P{i}', shipment=shipment, customer=customer, weight=2, volume=1, charge=Money(1000, 'TZS'),
+            )
+        invoice = Invoice.objects.create(invoice_no='INV1', customer=customer, due_date=timezone.now())
+        self.assertEqual(Invoice.objects.get(pk='INV1').total_amount, Money(2000, 'TZS'))
+
+        invoice.items.first().delete()
+        self.assertEqual(Invoice.objects.get(pk='INV1').total_amount, Money(1000, 'TZS'))
+
+
+class BulkIngestTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        cls.customer = Customer.objects.create(name='Customer', email='customer@example.com', phone='1', address='Dar')
+        Shipment.objects.create(
+            shipment_no='S1', transport='Sea', vessel='Vessel', weight=100, volume=10,
+            origin='Dar', destination='Dubai', status='In-transit',
+        )
+
+    def setUp(self):
+        super().setUp()
+        self.login(self.admin)
+
+    def post_ndjson(self, url, *rows):
+        body = ''.join((row if isinstance(row, str) else json.dumps(row)) + '\n' for row in rows)
+        return self.client.generic('POST', url, body, content_type='application/x-ndjson')
+
+    def test_parcel_import_reports_rows_by_number(self):
+        parcel = {'parcel_no': 'P1', 'shipment': 'S1', 'customer_id': self.customer.pk, 'weight': 2, 'volume': 1, 'charge': '10.00'}
+        response = self.post_ndjson('/api/parcels/import/', parcel, 'not json', {**parcel, 'shipment': 'S9'}, parcel)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['created'], 1)
+        self.assertEqual([(error['row'], error['parcel_no']) for error in response.data['errors']], [(2, None), (3, 'P1'), (4, 'P1')])
+        self.assertEqual(Parcel.objects.get().status, 'In-transit')
+
+    def test_parcel_import_accepts_json_arrays(self):
+        parcel = {'parcel_no': 'P1', 'shipment': 'S1', 'customer_id': self.customer.pk, 'weight': 2, 'volume': 1, 'charge': '10.00'}
+        response = self.client.post('/api/parcels/import/', [parcel, {**parcel, 'parcel_no': 'P2'}], format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['created'], 2)
+        self.assertEqual(response.data['errors'], [])
+
+        response = self.client.post('/api/parcels/import/', parcel, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_position_ingest_reports_rows_by_number(self):
+        ping = {'shipment': 'S1', 'recorded_at': '2026-01-01T00:00:00Z', 'latitude': -6.8, 'longitude': 39.3}
+        response = self.post_ndjson('/api/positions/', [ping], ping, {**ping, 'latitude': 200})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['accepted'], 1)
+        self.assertEqual([(error['row'], error['shipment']) for error in response.data['errors']], [(1, None), (3, 'S1')])
+        self.assertEqual(response.data['duplicates'], 0)
+
+    def test_position_ingest_counts_duplicates_and_publishes_moves_only(self):
+        ping = {'shipment': 'S1', 'recorded_at': '2026-01-01T01:00:00Z', 'latitude': -6.8, 'longitude': 39.3}
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.client.post('/api/positions/', [ping, ping], format='json')
+        self.assertEqual((response.data['accepted'], response.data['duplicates']), (1, 1))
+        self.assertEqual(len(callbacks), 1)
+
+        # A retried ping and an older one: nothing moves, so nothing is published
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.client.post('/api/positions/', [ping, {**ping, 'recorded_at': '2026-01-01T00:00:00Z'}], format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual((response.data['accepted'], response.data['duplicates']), (1, 1))
+        self.assertEqual(callbacks, [])
+        self.assertEqual(ShipmentPosition.objects.count(), 2)
+        self.assertEqual(Shipment.objects.get().position_recorded_at.hour, 1)
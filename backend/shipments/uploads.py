@@ -0,0 +1,192 @@
+"""Chunked, resumable document uploads.
+
+A client opens a DocumentUpload with the file's size, SHA-256 and the
+Document fields, then PUTs the bytes in order with ``Content-Range``
+headers. Every chunk is streamed from the request straight into its own
+object of the default file storage, so nothing is buffered in memory and
+any storage backend works; a ``Content-Digest: sha-256=:...:`` header, if
+sent, is checked before the chunk is accepted. After a dropped connection
+the client reads the session's offset and resumes from there. The commit
+streams the parts into the Document's file while verifying the declared
+checksum, then removes them.
+"""
+import base64
+import hashlib
+import re
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Document, DocumentUpload
+
+
+CONTENT_RANGE = re.compile(r'^bytes (\d+)-(\d+)/(\d+)$')
+CONTENT_DIGEST = re.compile(r'(?:^|,)\s*sha-256=:([A-Za-z0-9+/=]+):')
+READ_SIZE = 64 * 1024
+
+
+class ChunkError(Exception):
+    """A rejected chunk or commit, with the HTTP status to answer."""
+
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class HashingReader:
+    """Reads exactly ``length`` bytes from ``stream`` and hashes them on the way."""
+
+    def __init__(self, stream, length):
+        self.stream = stream
+        self.size = self.remaining = length
+        self.sha256 = hashlib.sha256()
+
+    def read(self, size=-1):
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        if not size:
+            return b''
+        data = self.stream.read(size)
+        if not data:
+            raise ChunkError("The request body ended before Content-Length bytes were received.")
+        self.remaining -= len(data)
+        self.sha256.update(data)
+        return data
+
+
+class PartsReader:
+    """Reads the stored parts of an upload back to back, hashing them."""
+
+    def __init__(self, names, size):
+        self.names = iter(names)
+        self.size = size
+        self.current = None
+        self.sha256 = hashlib.sha256()
+
+    def read(self, size=-1):
+        size = READ_SIZE if size is None or size < 0 else size
+        while True:
+            if self.current is None:
+                name = next(self.names, None)
+                if name is None:
+                    return b''
+                self.current = default_storage.open(name, 'rb')
+            data = self.current.read(size)
+            if data:
+                self.sha256.update(data)
+                return data
+            self.current.close()
+            self.current = None
+
+    def close(self):
+        if self.current is not None:
+            self.current.close()
+
+
+def parse_content_range(header, size):
+    """Return (start, length) from ``bytes start-end/size``. Raises ChunkError."""
+    match = CONTENT_RANGE.match(header or '')
+    if match is None:
+        raise ChunkError("Content-Range must be 'bytes <start>-<end>/<size>'.")
+    start, end, total = (int(value) for value in match.groups())
+    if total != size or start > end or end >= size:
+        raise ChunkError(f"Content-Range does not fit an upload of {size} bytes.", 416)
+    length = end - start + 1
+    if length > settings.DOCUMENT_UPLOAD_MAX_CHUNK_SIZE:
+        raise ChunkError(f"Chunks may not exceed {settings.DOCUMENT_UPLOAD_MAX_CHUNK_SIZE} bytes.", 413)
+    return start, length
+
+
+def parse_content_digest(header):
+    """The SHA-256 digest of a ``Content-Digest`` header, or None."""
+    match = CONTENT_DIGEST.search(header or '')
+    return base64.b64decode(match.group(1)) if match else None
+
+
+def part_name(upload, start):
+    return f'uploads/{upload.pk}/{start:012d}.part'
+
+
+def write_chunk(upload, start, length, stream, digest=None):
+    """Store ``length`` bytes of ``stream`` as the part at ``start`` and advance the upload.
+
+    The part is written before the session is locked, so a chunk racing
+    another one for the same offset is deleted again with a 409.
+    """
+    if start != upload.offset:
+        raise ChunkError(f"Expected a chunk at offset {upload.offset}.", 409)
+
+    reader = HashingReader(stream, length)
+    name = default_storage.get_available_name(part_name(upload, start))
+    try:
+        name = default_storage.save(name, File(reader))
+    except Exception:
+        # A short body or a dropped connection leaves a partial part behind
+        if default_storage.exists(name):
+            default_storage.delete(name)
+        raise
+    if digest is not None and reader.sha256.digest() != digest:
+        default_storage.delete(name)
+        raise ChunkError("The chunk does not match its Content-Digest.")
+
+    with transaction.atomic():
+        current = DocumentUpload.objects.select_for_update().get(pk=upload.pk)
+        if current.offset != start:
+            default_storage.delete(name)
+            raise ChunkError(f"Expected a chunk at offset {current.offset}.", 409)
+        current.parts.append([start, length, name])
+        current.offset = start + length
+        current.save(update_fields=['parts', 'offset', 'updated_at'])
+    return current
+
+
+def delete_parts(upload):
+    for _, _, name in upload.parts:
+        default_storage.delete(name)
+
+
+def commit_upload(upload, serializer):
+    """Assemble the parts into the Document's file and save ``serializer``.
+
+    ``serializer`` is a validated DocumentMetadataSerializer. A checksum
+    mismatch discards the upload, since some chunk was corrupted.
+    """
+    if upload.offset != upload.size:
+        raise ChunkError(f"Only {upload.offset} of {upload.size} bytes were uploaded.", 409)
+
+    field = Document._meta.get_field('file')
+    reader = PartsReader((name for _, _, name in upload.parts), upload.size)
+    try:
+        name = field.storage.save(field.generate_filename(None, upload.filename), File(reader))
+    finally:
+        reader.close()
+    if reader.sha256.hexdigest() != upload.checksum:
+        field.storage.delete(name)
+        delete_parts(upload)
+        upload.delete()
+        raise ChunkError("The uploaded file does not match its checksum; start a new upload.", 422)
+
+    try:
+        with transaction.atomic():
+            document = serializer.save(file=name)
+            upload.delete()
+    except Exception:
+        field.storage.delete(name)
+        raise
+    delete_parts(upload)
+    return document
+
+
+def purge_expired_uploads():
+    """Delete uploads idle for DOCUMENT_UPLOAD_EXPIRY_SECONDS and their parts. Returns the count."""
+    cutoff = timezone.now() - timedelta(seconds=settings.DOCUMENT_UPLOAD_EXPIRY_SECONDS)
+    count = 0
+    for upload in DocumentUpload.objects.filter(updated_at__lt=cutoff).iterator():
+        delete_parts(upload)
+        upload.delete()
+        count += 1
+    return count
@@ -1,13 +1,16 @@
 from django.urls import path
 from .views import (
-    ShipmentListCreateView, ShipmentDetailView,
-    CustomerListCreateView, CustomerDetailView,
-    ParcelListCreateView, ParcelDetailView,
+    ShipmentListCreateView, ShipmentDetailView, ShipmentExportView,
+    CustomerListCreateView, CustomerDetailView, CustomerExportView,
+    ParcelListCreateView, ParcelDetailView, ParcelImportView, ParcelExportView,
     DocumentListCreateView, DocumentDetailView,
-    InvoiceListCreateView, InvoiceDetailView,
+    DocumentUploadCreateView, DocumentUploadDetailView, DocumentUploadCommitView,
+    InvoiceListCreateView, InvoiceDetailView, InvoiceExportView,
     ChartDataView,
-    GenerateInvoicePDF,
-    ShipmentCustomersView,
+    GenerateInvoicePDF, InvoicePDFView,
+    ShipmentCustomersView, ShipmentBundleView, CustomerBundleView,
+    PositionListView, ShipmentPositionListView, ShipmentEventsView,
+    SearchView, MetricsView,
     StepListCreateView, StepDetailView, ActiveStepListView,
     ParameterListCreateView, ParameterDetailView,
 )
@@ -15,20 +18,36 @@ from .views import (
 
 urlpatterns = [
     path('shipments/', ShipmentListCreateView.as_view(), name='shipment-list-create'),
+    path('shipments/export/', ShipmentExportView.as_view(), name='shipment-export'),
     path('shipments/<str:pk>/', ShipmentDetailView.as_view(), name='shipment-detail'),
     path('shipments/<str:pk>/customers/', ShipmentCustomersView.as_view(), name='shipment-customers'),
+    path('shipments/<str:pk>/bundle/', ShipmentBundleView.as_view(), name='shipment-bundle'),
+    path('shipments/<str:pk>/positions/', ShipmentPositionListView.as_view(), name='shipment-positions'),
+    path('positions/', PositionListView.as_view(), name='position-list'),
+    path('events/', ShipmentEventsView.as_view(), name='shipment-events'),
 
     path('customers/', CustomerListCreateView.as_view(), name='customer-list'),
+    path('customers/export/', CustomerExportView.as_view(), name='customer-export'),
     path('customers/<int:pk>/', CustomerDetailView.as_view(), name='customer-detail'),
+    path('customers/<int:pk>/bundle/', CustomerBundleView.as_view(), name='customer-bundle'),
 
     path('parcels/', ParcelListCreateView.as_view(), name='parcel-list-create'),
+    path('parcels/import/', ParcelImportView.as_view(), name='parcel-import'),
+    path('parcels/export/', ParcelExportView.as_view(), name='parcel-export'),
     path('parcels/<str:pk>/', ParcelDetailView.as_view(), name='parcel-detail'),
 
     path('documents/', DocumentListCreateView.as_view(), name='document-list-create'),
+    path('documents/uploads/', DocumentUploadCreateView.as_view(), name='document-upload-create'),
+    path('documents/uploads/<uuid:pk>/', DocumentUploadDetailView.as_view(), name='document-upload-detail'),
+    path('documents/uploads/<uuid:pk>/commit/', DocumentUploadCommitView.as_view(), name='document-upload-commit'),
     path('documents/<str:pk>/', DocumentDetailView.as_view(), name='document-detail'),
 
     path('invoices/', InvoiceListCreateView.as_view(), name='invoice-list-create'),
+    path('invoices/export/', InvoiceExportView.as_view(), name='invoice-export'),
     path('invoices/<str:pk>/', InvoiceDetailView.as_view(), name='invoice-detail'),
+    path('invoices/<str:pk>/pdf/', InvoicePDFView.as_view(), name='invoice-pdf'),
+    path('search/', SearchView.as_view(), name='search'),
+    path('metrics/', MetricsView.as_view(), name='metrics'),
     path('chart-data/', ChartDataView.as_view(), name='chart-data'),
     path('customers/<int:customer_id>/generate-invoice/', GenerateInvoicePDF.as_view(), name='generate-invoice'),
 
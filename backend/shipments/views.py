@@ -1,29 +1,46 @@
-from django.db.models import Count, Q
-from django.db.models.functions import TruncMonth
-from django.http import FileResponse
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.db.models import Exists, Prefetch, Q, Sum
+from django.db.models.functions import Coalesce
+from django.http import FileResponse, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_etags, quote_etag
+from django.views import View
 
 from rest_framework import generics, status
+from rest_framework.exceptions import APIException
+from rest_framework.parsers import JSONParser, MultiPartParser
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from rest_framework_simplejwt.authentication import JWTAuthentication
+from accounts.authentication import EventStreamJWTAuthentication, StatelessReadJWTAuthentication
 from django_filters.rest_framework import DjangoFilterBackend
 
-from .models import Shipment, Customer, Parcel, Document, Invoice, Step, Parameter
+from .models import Shipment, ShipmentMonthlyStats, ShipmentPosition, Customer, Parcel, Document, DocumentUpload, Invoice, InvoiceItem, Step, Parameter
 from .serializers import (
     ShipmentSerializer, CustomerSerializer, ParcelSerializer,
-    DocumentSerializer, InvoiceSerializer,
+    DocumentSerializer, DocumentMetadataSerializer, DocumentUploadSerializer, InvoiceSerializer,
     StepSerializer, ParameterSerializer,
+    CustomerSummarySerializer, LatestPositionSerializer, ShipmentPositionSerializer, get_expansions,
 )
-from .filters import InvoiceFilter
-from accounts.permissions import RoleBasedAccessPermission, IsSelfOrAdmin
+from .filters import InvoiceFilter, LatestPositionFilter, ShipmentPositionFilter
+from .exports import EXPORT_FORMATS, IgnoreClientContentNegotiation, stream_export
+from .imports import import_parcels
+from .ingest import NDJSON_TYPES, iter_csv_rows, iter_lines, iter_ndjson_rows
+from .positions import ingest_positions
+from .pdf_cache import build_invoice_payload, get_invoice_pdf
+from .bundles import document_entries, invoice_entries, stream_zip
+from .search import search
+from .middleware import current_timings
+from . import live, uploads, metrics, reference_cache
+from accounts.permissions import HasMetricsToken, IsAdmin, IsAdminOrStaff, RoleBasedAccessPermission, IsSelfOrAdmin
 from accounts.utils import get_user_role
 
-import io
+import asyncio
+import hashlib
+import itertools
+import json
 import logging
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import letter
-from reportlab.lib.units import inch
 
 
 logger = logging.getLogger(__name__)
@@ -50,8 +67,9 @@ class RoleBasedQuerysetMixin:
             return qs
 
         if role == 'customer':
-            filter_kwargs = {self.customer_field: user}
-            return qs.filter(**filter_kwargs)
+            filter_kwargs = {self.customer_field: user.email}
+            # The customer lookup can span parcels, so drop duplicate rows
+            return qs.filter(**filter_kwargs).distinct()
 
         return self.model.objects.none()
 
@@ -69,7 +87,140 @@ class RoleBasedQuerysetMixin:
 
 
 class BaseUserView:
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [StatelessReadJWTAuthentication]
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        timings = current_timings()
+        if timings is not None:
+            timings.start_handler()
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        # The handler has serialized its data by now; rendering comes later
+        timings = current_timings()
+        if timings is not None:
+            timings.finish_handler()
+        return super().finalize_response(request, response, *args, **kwargs)
+
+
+class ReferenceDataCacheMixin:
+    """Serves list responses from the versioned reference data cache.
+
+    Responses carry a strong ETag derived from the category version and the
+    request variant, and a matching If-None-Match gets a 304 without
+    touching the database.
+    """
+    reference_category = None
+
+    def list(self, request, *args, **kwargs):
+        category = self.reference_category
+        version = reference_cache.get_version(category)
+        variant = f"{request.accepted_renderer.format}:{request.get_full_path()}"
+        etag = reference_cache.make_etag(category, version, variant)
+        headers = {'ETag': etag, 'Cache-Control': 'private, no-cache'}
+
+        if etag in parse_etags(request.headers.get('If-None-Match', '')):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+        payload = reference_cache.get_payload(category, version, variant)
+        metrics.record_cache_lookup('reference_data', payload is not None)
+        if payload is None:
+            payload = super().list(request, *args, **kwargs).data
+            reference_cache.store_payload(category, version, variant, payload)
+        return Response(payload, headers=headers)
+
+
+class ConditionalRetrieveMixin:
+    """Answers detail GETs with 304 when the object has not changed.
+
+    The validator is the newest ``updated_at`` of the object and of the
+    related objects named in ``last_modified_relations``, which must be
+    loaded by get_queryset. It is sent as both Last-Modified and a weak ETag.
+    """
+    last_modified_relations = ()
+
+    def get_last_modified(self, instance):
+        timestamps = [instance.updated_at]
+        for relation in self.last_modified_relations:
+            related = getattr(instance, relation, None)
+            if related is not None:
+                timestamps.append(related.updated_at)
+        return max(timestamps)
+
+    def retrieve(self, request, *args, **kwargs):
+        instance = self.get_object()
+        last_modified = self.get_last_modified(instance)
+        validator = f"{instance._meta.label_lower}:{instance.pk}:{last_modified.timestamp()}:{request.get_full_path()}"
+        etag = 'W/' + quote_etag(hashlib.sha1(validator.encode()).hexdigest())
+
+        response = get_conditional_response(request, etag=etag, last_modified=int(last_modified.timestamp()))
+        if response is None:
+            response = Response(self.get_serializer(instance).data)
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified.timestamp())
+        response['Cache-Control'] = 'private, no-cache'
+        return response
+
+
+class ParcelQuerysetMixin:
+    """Joins each parcel's shipment and customer into the parcel query.
+
+    With ``?expand=customer_stats`` the customers are prefetched with their
+    aggregates instead, so the nested CustomerSerializer stays query-free.
+    """
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if 'customer_stats' in get_expansions(self.request):
+            customers = Customer.objects.with_stats(shipment_no=self.request.query_params.get('shipment_no'))
+            return queryset.select_related('shipment').prefetch_related(Prefetch('customer', queryset=customers))
+        return queryset.select_related('shipment', 'customer')
+
+
+class InvoiceQuerysetMixin:
+    """Prefetches each invoice's customer with its aggregates and its items with their parcels.
+
+    InvoiceSerializer nests both, so a page of invoices costs a fixed number
+    of queries whatever its size.
+    """
+    def get_queryset(self):
+        customers = Customer.objects.with_stats(shipment_no=self.request.query_params.get('shipment_no'))
+        items = InvoiceItem.objects.select_related('parcel')
+        return super().get_queryset().prefetch_related(
+            Prefetch('customer', queryset=customers), Prefetch('items', queryset=items),
+        )
+
+
+class ExportMixin:
+    """Streams the filtered, role-scoped queryset as CSV or NDJSON.
+
+    Mixed into a list view, it reuses that view's get_queryset and filter
+    backends. Rows are read as tuples of ``export_fields`` with
+    QuerySet.iterator(), so memory stays flat for any number of rows.
+    """
+    export_fields = ()
+    export_chunk_size = 2000
+    http_method_names = ['get', 'head', 'options']
+    content_negotiation_class = IgnoreClientContentNegotiation
+
+    def get(self, request, *args, **kwargs):
+        export_format = request.query_params.get('output', 'csv')
+        if export_format not in EXPORT_FORMATS:
+            return Response(
+                {"detail": f"output must be one of: {', '.join(EXPORT_FORMATS)}."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        queryset = self.filter_queryset(self.get_queryset()).prefetch_related(None).order_by('pk')
+        rows = queryset.values_list(*self.export_fields).iterator(chunk_size=self.export_chunk_size)
+        columns = [field.replace('__', '_') for field in self.export_fields]
+
+        response = StreamingHttpResponse(
+            stream_export(export_format, columns, rows), content_type=EXPORT_FORMATS[export_format]
+        )
+        filename = f"{self.model._meta.verbose_name_plural.replace(' ', '_')}.{export_format}"
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        logger.info(f"{request.user.email} exported {self.model.__name__} as {export_format}")
+        return response
 
 
 # ==============================
@@ -80,26 +231,155 @@ class ShipmentListCreateView(BaseUserView, RoleBasedQuerysetMixin, generics.List
     filter_backends = [DjangoFilterBackend]
     filterset_fields = ['shipment_no', 'transport', 'origin', 'destination', 'status']
     model = Shipment
+    cursor_ordering = ('shipment_no',)
     customer_field = 'parcels__customer__email'
     permission_classes = [IsAuthenticated, RoleBasedAccessPermission]
 
+    def get_queryset(self):
+        return super().get_queryset().with_counts()
+
+
+class ShipmentExportView(ExportMixin, ShipmentListCreateView):
+    export_fields = (
+        'shipment_no', 'transport', 'vessel', 'weight', 'weight_unit', 'volume', 'volume_unit',
+        'origin', 'destination', 'steps', 'status', 'latitude', 'longitude', 'created_at', 'updated_at',
+    )
+
 
-class ShipmentDetailView(StaffDeleteProtectedMixin, BaseUserView, RoleBasedQuerysetMixin, generics.RetrieveUpdateDestroyAPIView):
+class ShipmentDetailView(StaffDeleteProtectedMixin, ConditionalRetrieveMixin, BaseUserView, RoleBasedQuerysetMixin, generics.RetrieveUpdateDestroyAPIView):
     serializer_class = ShipmentSerializer
     model = Shipment
     lookup_field = 'pk'
     customer_field = 'parcels__customer__email'
     permission_classes = [IsAuthenticated, RoleBasedAccessPermission]
 
+    def get_queryset(self):
+        return super().get_queryset().with_counts()
+
 
 class ShipmentCustomersView(generics.ListAPIView):
     serializer_class = CustomerSerializer
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [StatelessReadJWTAuthentication]
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
         shipment_pk = self.kwargs['pk']
-        return Customer.objects.filter(parcels__shipment__pk=shipment_pk).distinct()
+        return Customer.objects.filter(parcels__shipment__pk=shipment_pk).distinct().with_stats(
+            shipment_no=self.request.query_params.get('shipment_no')
+        )
+
+
+class BulkIngestMixin:
+    """Request bodies and responses of the bulk ingest endpoints, see shipments.ingest."""
+    ndjson_types = NDJSON_TYPES
+
+    def media_type(self, request):
+        return request.content_type.split(';')[0].strip()
+
+    def ndjson_rows(self, request):
+        """The rows of an NDJSON request body, read line by line, or None for other media types."""
+        if self.media_type(request) not in self.ndjson_types:
+            return None
+        return iter_ndjson_rows(iter_lines(request.stream or []))
+
+    def ingest_response(self, request, report, counter, what):
+        logger.info(f"{request.user.email} sent {report[counter]} {what} ({report['failed']} rejected)")
+        return Response(report, status=status.HTTP_201_CREATED if report[counter] else status.HTTP_200_OK)
+
+
+class PositionListView(BulkIngestMixin, BaseUserView, RoleBasedQuerysetMixin, generics.ListAPIView):
+    """Latest position of each tracked shipment; POST ingests tracker pings.
+
+    GET filters with ``?bbox=west,south,east,north`` through the grid index.
+    POST takes a JSON array or an NDJSON body of ``{shipment, recorded_at,
+    latitude, longitude}`` objects and responds with the per-row error report;
+    pings already stored are counted as duplicates.
+    """
+    serializer_class = LatestPositionSerializer
+    filter_backends = [DjangoFilterBackend]
+    filterset_class = LatestPositionFilter
+    model = Shipment
+    cursor_ordering = ('shipment_no',)
+    customer_field = 'parcels__customer__email'
+    permission_classes = [IsAuthenticated, RoleBasedAccessPermission]
+    parser_classes = [JSONParser]
+
+    def get_queryset(self):
+        return super().get_queryset().filter(position_recorded_at__isnull=False).only(
+            'shipment_no', 'transport', 'vessel', 'status', 'latitude', 'longitude', 'position_recorded_at',
+        ).order_by('shipment_no')
+
+    def post(self, request, *args, **kwargs):
+        rows = self.ndjson_rows(request)
+        if rows is None:
+            if not isinstance(request.data, list):
+                return Response({"detail": "Expected a JSON array of positions."}, status=status.HTTP_400_BAD_REQUEST)
+            rows = request.data
+        return self.ingest_response(request, ingest_positions(rows), 'accepted', 'positions')
+
+
+class ShipmentPositionListView(BaseUserView, generics.ListAPIView):
+    """Track of one shipment, newest ping first, filtered by ``?since=``, ``?until=`` and ``?bbox=``."""
+    serializer_class = ShipmentPositionSerializer
+    filter_backends = [DjangoFilterBackend]
+    filterset_class = ShipmentPositionFilter
+    cursor_ordering = ('-recorded_at',)
+    permission_classes = [IsAuthenticated, RoleBasedAccessPermission]
+
+    def get_queryset(self):
+        user = self.request.user
+        shipment_no = self.kwargs['pk']
+        positions = ShipmentPosition.objects.filter(shipment_id=shipment_no).order_by('-recorded_at')
+        role = get_user_role(user)
+
+        if role in ['admin', 'staff']:
+            return positions
+        if role == 'customer':
+            # A single EXISTS instead of a parcel join keeps the track free of duplicates
+            owned = Parcel.objects.filter(shipment_id=shipment_no, customer__email=user.email)
+            return positions.filter(Exists(owned))
+        return positions.none()
+
+
+class ShipmentEventsView(View):
+    """Server-Sent Events stream of live shipment updates, replacing polling.
+
+    Pushes ``shipment`` events (status, steps and position of a saved
+    shipment) and ``position`` events (tracker pings), filtered by role;
+    ``?shipment=S1,S2`` narrows the stream. A reconnecting client's
+    ``Last-Event-ID`` header (or ``?last_event_id=``) replays the events it
+    missed. A ``resync`` event means events were dropped and the client
+    should reload. The stream ends when the access token expires, so the
+    client reconnects with a fresh one.
+    Needs the ASGI server: a WSGI worker would be held by every stream.
+    """
+
+    async def get(self, request, *args, **kwargs):
+        if not isinstance(request, ASGIRequest):
+            return JsonResponse({"detail": "Live updates are only served by the ASGI application."}, status=501)
+        try:
+            authenticated = await sync_to_async(EventStreamJWTAuthentication().authenticate)(request)
+        except APIException as e:
+            data = e.detail if isinstance(e.detail, (list, dict)) else {"detail": e.detail}
+            return JsonResponse(data, status=e.status_code, safe=False)
+        if authenticated is None:
+            return JsonResponse({"detail": "Authentication credentials were not provided."}, status=401)
+        user, token = authenticated
+
+        role = await sync_to_async(get_user_role)(user)
+        shipments = {number for number in request.GET.get('shipment', '').split(',') if number}
+        subscription = live.Subscription(
+            asyncio.get_running_loop(), email=user.email if role == 'customer' else None, shipments=shipments,
+        )
+        last_event_id = request.headers.get('Last-Event-ID') or request.GET.get('last_event_id')
+        last_event_id = int(last_event_id) if last_event_id and last_event_id.isdigit() else None
+        response = StreamingHttpResponse(
+            live.event_stream(subscription, token['exp'], last_event_id), content_type='text/event-stream',
+        )
+        response['Cache-Control'] = 'no-cache'
+        # Stop nginx from buffering the stream
+        response['X-Accel-Buffering'] = 'no'
+        return response
 
 
 # ==============================
@@ -114,37 +394,98 @@ class CustomerListCreateView(BaseUserView, RoleBasedQuerysetMixin, generics.List
         'name', 'email', 'phone',
         'parcels__shipment', 'parcels__shipment__shipment_no',
     ]
+    cursor_ordering = ('id',)
     permission_classes = [IsAuthenticated, RoleBasedAccessPermission]
 
     def get_queryset(self):
         queryset = super().get_queryset()
-        return queryset.distinct()
+        return queryset.distinct().with_stats(shipment_no=self.request.query_params.get('shipment_no'))
+
 
+class CustomerExportView(ExportMixin, CustomerListCreateView):
+    export_fields = ('id', 'name', 'email', 'phone', 'address', 'status', 'updated_at')
 
-class CustomerDetailView(StaffDeleteProtectedMixin, BaseUserView, RoleBasedQuerysetMixin, generics.RetrieveUpdateDestroyAPIView):
+
+class CustomerDetailView(StaffDeleteProtectedMixin, ConditionalRetrieveMixin, BaseUserView, RoleBasedQuerysetMixin, generics.RetrieveUpdateDestroyAPIView):
     serializer_class = CustomerSerializer
     model = Customer
     customer_field = 'email'
     permission_classes = [IsAuthenticated, RoleBasedAccessPermission, IsSelfOrAdmin]
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        return queryset.with_stats(shipment_no=self.request.query_params.get('shipment_no'))
+
 
 # ==============================
 #  Parcel Views
 # ==============================
-class ParcelListCreateView(BaseUserView, RoleBasedQuerysetMixin, generics.ListCreateAPIView):
+class ParcelListCreateView(ParcelQuerysetMixin, BaseUserView, RoleBasedQuerysetMixin, generics.ListCreateAPIView):
     serializer_class = ParcelSerializer
     filter_backends = [DjangoFilterBackend]
     filterset_fields = ['parcel_no', 'customer', 'shipment', 'shipment__shipment_no']
     model = Parcel
+    cursor_ordering = ('parcel_no',)
     customer_field = 'customer__email'
     permission_classes = [IsAuthenticated, RoleBasedAccessPermission]
 
 
-class ParcelDetailView(StaffDeleteProtectedMixin, BaseUserView, RoleBasedQuerysetMixin, generics.RetrieveUpdateDestroyAPIView):
+class ParcelExportView(ExportMixin, ParcelListCreateView):
+    export_fields = (
+        'parcel_no', 'shipment', 'customer', 'customer__name', 'weight', 'weight_unit', 'volume', 'volume_unit',
+        'charge', 'charge_currency', 'payment', 'commodity_type', 'description', 'status', 'updated_at',
+    )
+
+
+class ParcelDetailView(StaffDeleteProtectedMixin, ConditionalRetrieveMixin, ParcelQuerysetMixin, BaseUserView, RoleBasedQuerysetMixin, generics.RetrieveUpdateDestroyAPIView):
     serializer_class = ParcelSerializer
     model = Parcel
     customer_field = 'customer__email'
     permission_classes = [IsAuthenticated, RoleBasedAccessPermission]
+    last_modified_relations = ('shipment', 'customer')
+
+
+class ParcelImportView(BulkIngestMixin, BaseUserView, APIView):
+    """Bulk-creates parcels from a CSV, NDJSON or JSON manifest.
+
+    The manifest is either the raw request body (``Content-Type: text/csv``,
+    ``application/x-ndjson`` or ``application/json`` for an array) or a
+    multipart ``file`` upload. CSV and NDJSON are read line by line.
+    Responds with the per-row error report.
+    """
+    permission_classes = [IsAuthenticated, RoleBasedAccessPermission]
+    parser_classes = [MultiPartParser, JSONParser]
+
+    def post(self, request, *args, **kwargs):
+        content_type = self.media_type(request)
+        if content_type == 'multipart/form-data':
+            upload = request.FILES.get('file')
+            if upload is None:
+                return Response({"detail": "No file uploaded."}, status=status.HTTP_400_BAD_REQUEST)
+            name = upload.name.lower()
+            if name.endswith('.json') or upload.content_type == 'application/json':
+                try:
+                    rows = json.load(upload)
+                except ValueError:
+                    rows = None
+                if not isinstance(rows, list):
+                    return Response({"detail": "Expected a JSON array of parcels."}, status=status.HTTP_400_BAD_REQUEST)
+            elif name.endswith(('.ndjson', '.jsonl')) or upload.content_type in self.ndjson_types:
+                rows = iter_ndjson_rows(iter_lines(upload))
+            else:
+                rows = iter_csv_rows(iter_lines(upload))
+        elif content_type == 'application/json':
+            if not isinstance(request.data, list):
+                return Response({"detail": "Expected a JSON array of parcels."}, status=status.HTTP_400_BAD_REQUEST)
+            rows = request.data
+        elif content_type == 'text/csv':
+            rows = iter_csv_rows(iter_lines(request.stream or []))
+        elif (rows := self.ndjson_rows(request)) is None:
+            return Response(
+                {"detail": f'Unsupported media type "{content_type}".'},
+                status=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            )
+        return self.ingest_response(request, import_parcels(rows), 'created', 'parcels')
 
 
 # ==============================
@@ -155,62 +496,146 @@ class DocumentListCreateView(BaseUserView, RoleBasedQuerysetMixin, generics.List
     filter_backends = [DjangoFilterBackend]
     filterset_fields = ['document_no', 'shipment__shipment_no', 'customer__name', 'parcel__parcel_no', 'document_type']
     model = Document
+    cursor_ordering = ('-issued_date', 'document_no')
     customer_field = 'customer__email'
     permission_classes = [IsAuthenticated, RoleBasedAccessPermission]
 
 
-class DocumentDetailView(StaffDeleteProtectedMixin, BaseUserView, RoleBasedQuerysetMixin, generics.RetrieveUpdateDestroyAPIView):
+class DocumentDetailView(StaffDeleteProtectedMixin, ConditionalRetrieveMixin, BaseUserView, RoleBasedQuerysetMixin, generics.RetrieveUpdateDestroyAPIView):
     serializer_class = DocumentSerializer
     model = Document
     customer_field = 'customer__email'
     permission_classes = [IsAuthenticated, RoleBasedAccessPermission]
 
 
+class DocumentUploadMixin:
+    """Upload sessions of admins and staff; each sees only their own unless admin."""
+    permission_classes = [IsAuthenticated, IsAdminOrStaff]
+
+    def get_queryset(self):
+        uploads = DocumentUpload.objects.all()
+        if get_user_role(self.request.user) == 'admin':
+            return uploads
+        # Reads authenticate a claims-only user, which is no model instance
+        return uploads.filter(created_by_id=self.request.user.id)
+
+
+class DocumentUploadCreateView(DocumentUploadMixin, BaseUserView, generics.CreateAPIView):
+    """Opens a chunked upload: ``{filename, size, checksum, document: {...}}``.
+
+    ``checksum`` is the hex SHA-256 of the whole file and ``document`` the
+    fields of the Document created on commit.
+    """
+    serializer_class = DocumentUploadSerializer
+
+    def perform_create(self, serializer):
+        serializer.save(created_by=self.request.user)
+
+
+class DocumentUploadDetailView(DocumentUploadMixin, BaseUserView, generics.RetrieveDestroyAPIView):
+    """GET reports the offset to resume from; PUT or PATCH appends a chunk; DELETE aborts.
+
+    A chunk is the raw request body with ``Content-Range: bytes start-end/size``
+    where start is the current offset, and optionally a ``Content-Digest:
+    sha-256=:<base64>:`` header. It is streamed straight to storage.
+    """
+    serializer_class = DocumentUploadSerializer
+
+    def put(self, request, *args, **kwargs):
+        upload = self.get_object()
+        try:
+            start, length = uploads.parse_content_range(request.headers.get('Content-Range'), upload.size)
+            if int(request.META.get('CONTENT_LENGTH') or 0) != length:
+                raise uploads.ChunkError("Content-Length does not match Content-Range.")
+            digest = uploads.parse_content_digest(request.headers.get('Content-Digest'))
+            upload = uploads.write_chunk(upload, start, length, request.stream, digest)
+        except uploads.ChunkError as e:
+            upload.refresh_from_db(fields=['offset'])
+            return Response({"detail": str(e), "offset": upload.offset}, status=e.status_code)
+        return Response(self.get_serializer(upload).data)
+
+    def patch(self, request, *args, **kwargs):
+        return self.put(request, *args, **kwargs)
+
+    def perform_destroy(self, instance):
+        uploads.delete_parts(instance)
+        instance.delete()
+
+
+class DocumentUploadCommitView(DocumentUploadMixin, BaseUserView, generics.GenericAPIView):
+    """Creates the Document once every byte is uploaded and the checksum matches.
+
+    The body may correct fields of ``document`` given when the upload was opened.
+    """
+    serializer_class = DocumentMetadataSerializer
+    lookup_url_kwarg = 'pk'
+
+    def post(self, request, *args, **kwargs):
+        upload = self.get_object()
+        serializer = self.get_serializer(data={**upload.metadata, **request.data})
+        serializer.is_valid(raise_exception=True)
+        try:
+            document = uploads.commit_upload(upload, serializer)
+        except uploads.ChunkError as e:
+            return Response({"detail": str(e)}, status=e.status_code)
+        logger.info(f"{request.user.email} uploaded document {document.pk} ({upload.size} bytes) in {len(upload.parts)} chunks")
+        return Response(DocumentSerializer(document, context=self.get_serializer_context()).data, status=status.HTTP_201_CREATED)
+
+
 # ==============================
 # Invoice Views
 # ==============================
-class InvoiceListCreateView(BaseUserView, RoleBasedQuerysetMixin, generics.ListCreateAPIView):
+class InvoiceListCreateView(InvoiceQuerysetMixin, BaseUserView, RoleBasedQuerysetMixin, generics.ListCreateAPIView):
     serializer_class = InvoiceSerializer
     filter_backends = [DjangoFilterBackend]
     filterset_class = InvoiceFilter
     model = Invoice
     customer_field = 'customer__email'
     ordering = ['-issue_date']
+    cursor_ordering = ('-issue_date', 'invoice_no')
     permission_classes = [IsAuthenticated, RoleBasedAccessPermission]
 
 
-class InvoiceDetailView(StaffDeleteProtectedMixin, BaseUserView, RoleBasedQuerysetMixin, generics.RetrieveUpdateDestroyAPIView):
+class InvoiceExportView(ExportMixin, InvoiceListCreateView):
+    export_fields = (
+        'invoice_no', 'customer', 'customer__name', 'issue_date', 'due_date',
+        'total_amount', 'tax', 'final_amount', 'total_amount_currency', 'status', 'updated_at',
+    )
+
+
+class InvoiceDetailView(StaffDeleteProtectedMixin, ConditionalRetrieveMixin, InvoiceQuerysetMixin, BaseUserView, RoleBasedQuerysetMixin, generics.RetrieveUpdateDestroyAPIView):
     serializer_class = InvoiceSerializer
     model = Invoice
     customer_field = 'customer__email'
     permission_classes = [IsAuthenticated, RoleBasedAccessPermission]
+    last_modified_relations = ('customer',)
 
 
 # ==============================
 # Charts API
 # ==============================
 class ChartDataView(APIView):
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [StatelessReadJWTAuthentication]
     permission_classes = [IsAuthenticated]
 
     def get(self, request, *args, **kwargs):
-        revenue_data = Shipment.objects.annotate(
-            month=TruncMonth('created_at')
-        ).values('month').annotate(
-            air=Count('id', filter=Q(transport__iexact='Air')),
-            sea=Count('id', filter=Q(transport__iexact='Sea'))
+        stats = ShipmentMonthlyStats.objects.order_by()
+
+        revenue_data = stats.values('month').annotate(
+            air=Coalesce(Sum('shipment_count', filter=Q(transport='Air')), 0),
+            sea=Coalesce(Sum('shipment_count', filter=Q(transport='Sea')), 0)
         ).order_by('month')
 
         for entry in revenue_data:
             entry["name"] = entry["month"].strftime('%Y-%m') if entry["month"] else "Unknown"
 
-        air_vehicle_data = Shipment.objects.filter(
-            transport__iexact='Air'
-        ).values('vessel').annotate(value=Count('id'))
+        air_vehicle_data = stats.filter(
+            transport='Air'
+        ).values('vessel').annotate(value=Sum('shipment_count')).order_by('vessel')
 
-        marine_vehicle_data = Shipment.objects.filter(
-            transport__iexact='Marine'
-        ).values('vessel').annotate(value=Count('id'))
+        marine_vehicle_data = stats.filter(
+            transport='Sea'
+        ).values('vessel').annotate(value=Sum('shipment_count')).order_by('vessel')
 
         return Response({
             'revenueData': list(revenue_data),
@@ -222,47 +647,175 @@ class ChartDataView(APIView):
 # ==============================
 # PDF Invoice Generation
 # ==============================
-class GenerateInvoicePDF(APIView):
-    authentication_classes = [JWTAuthentication]
-    permission_classes = [IsAuthenticated]
+def with_pdf_data(invoices):
+    """Load what build_invoice_payload reads, in two queries for any number of invoices."""
+    items = InvoiceItem.objects.select_related('parcel').only(
+        'invoice', 'cost', 'cost_currency',
+        'parcel__parcel_no', 'parcel__commodity_type', 'parcel__description',
+    ).order_by('parcel_id')
+    return invoices.select_related('customer').prefetch_related(Prefetch('items', queryset=items))
+
+
+class InvoicePDFMixin:
+    """Serves invoice PDFs from the content-addressed render cache."""
+    model = Invoice
+    customer_field = 'customer__email'
+    permission_classes = [IsAuthenticated, RoleBasedAccessPermission]
 
+    def get_queryset(self):
+        return with_pdf_data(super().get_queryset())
+
+    def invoice_pdf_response(self, invoice):
+        path = get_invoice_pdf(build_invoice_payload(invoice))
+        if path is None:
+            # Still rendering in the pool; the client should retry shortly
+            return Response({"detail": "Invoice PDF is being generated."},
+                            status=status.HTTP_202_ACCEPTED, headers={'Retry-After': '2'})
+        return FileResponse(open(path, 'rb'), as_attachment=True, filename=f'invoice_{invoice.invoice_no}.pdf')
+
+
+class InvoicePDFView(InvoicePDFMixin, BaseUserView, RoleBasedQuerysetMixin, generics.GenericAPIView):
     def get(self, request, *args, **kwargs):
-        customer_id = kwargs.get('customer_id')
-        try:
-            customer = Customer.objects.get(id=customer_id)
-        except Customer.DoesNotExist:
+        return self.invoice_pdf_response(self.get_object())
+
+
+class GenerateInvoicePDF(InvoicePDFMixin, BaseUserView, RoleBasedQuerysetMixin, generics.GenericAPIView):
+    """PDF of the customer's most recent invoice."""
+    def get(self, request, *args, **kwargs):
+        invoice = self.get_queryset().filter(customer_id=kwargs.get('customer_id')).order_by('-issue_date').first()
+        if invoice is None:
             return Response(status=404)
+        return self.invoice_pdf_response(invoice)
 
-        buffer = io.BytesIO()
-        p = canvas.Canvas(buffer, pagesize=letter)
 
-        p.setFont("Helvetica-Bold", 16)
-        p.drawString(1 * inch, 10 * inch, "Invoice")
+class BundleMixin:
+    """Streams a ZIP of the documents and invoice PDFs of the looked-up object.
 
-        p.setFont("Helvetica", 12)
-        p.drawString(1 * inch, 9.5 * inch, f"Invoice for: {customer.name}")
-        p.drawString(1 * inch, 9.3 * inch, f"Email: {customer.email}")
-        p.drawString(1 * inch, 9.1 * inch, f"Phone: {customer.phone}")
+    Customers only get their own documents and invoices.
+    """
+    http_method_names = ['get', 'head', 'options']
+    content_negotiation_class = IgnoreClientContentNegotiation
+    permission_classes = [IsAuthenticated, RoleBasedAccessPermission]
+
+    def get_bundle_querysets(self, instance):
+        raise NotImplementedError
+
+    def scope(self, queryset):
+        if get_user_role(self.request.user) == 'customer':
+            return queryset.filter(customer__email=self.request.user.email)
+        return queryset
+
+    def get(self, request, *args, **kwargs):
+        instance = self.get_object()
+        documents, invoices = self.get_bundle_querysets(instance)
+        documents = self.scope(documents).only('document_no', 'file', 'issued_date').order_by('document_no')
+        invoices = with_pdf_data(self.scope(invoices)).order_by('invoice_no')
+
+        entries = itertools.chain(document_entries(documents), invoice_entries(invoices))
+        response = StreamingHttpResponse(stream_zip(entries), content_type='application/zip')
+        filename = f"{self.model.__name__.lower()}_{instance.pk}.zip"
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        logger.info(f"{request.user.email} downloaded the bundle of {self.model.__name__} ID={instance.pk}")
+        return response
+
+
+class ShipmentBundleView(BundleMixin, BaseUserView, RoleBasedQuerysetMixin, generics.GenericAPIView):
+    model = Shipment
+    customer_field = 'parcels__customer__email'
+
+    def get_bundle_querysets(self, shipment):
+        documents = Document.objects.filter(shipment=shipment)
+        invoices = Invoice.objects.filter(pk__in=InvoiceItem.objects.filter(parcel__shipment=shipment).values('invoice'))
+        return documents, invoices
+
+
+class CustomerBundleView(BundleMixin, BaseUserView, RoleBasedQuerysetMixin, generics.GenericAPIView):
+    model = Customer
+    customer_field = 'email'
 
-        p.setFont("Helvetica-Bold", 12)
-        p.drawString(1 * inch, 8.5 * inch, "Description")
-        p.drawString(4 * inch, 8.5 * inch, "Amount")
-        p.setFont("Helvetica", 12)
-        p.drawString(1 * inch, 8.3 * inch, "Parcel Shipping")
-        p.drawString(4 * inch, 8.3 * inch, "$100.00")
+    def get_bundle_querysets(self, customer):
+        return Document.objects.filter(customer=customer), Invoice.objects.filter(customer=customer)
 
-        p.showPage()
-        p.save()
 
-        buffer.seek(0)
-        return FileResponse(buffer, as_attachment=True, filename=f'invoice_{customer.name}.pdf')
+# ==============================
+# Search
+# ==============================
+class SearchView(BaseUserView, APIView):
+    """Full-text search over shipments, parcels and customers.
+
+    ``?q=`` is matched word by word as prefixes; ``?type=parcel,customer``
+    narrows the kinds searched. Customers only match what they own; hits are
+    loaded per kind with the usual role scoping and returned in rank order.
+    """
+    permission_classes = [IsAuthenticated, RoleBasedAccessPermission]
+    default_limit = 20
+    max_limit = 100
+    # kind -> (result key, customer lookup)
+    kinds = {
+        'shipment': ('shipments', 'parcels__customer__email'),
+        'parcel': ('parcels', 'customer__email'),
+        'customer': ('customers', 'email'),
+    }
+
+    def get_results_queryset(self, kind):
+        if kind == 'shipment':
+            return Shipment.objects.with_counts(), ShipmentSerializer
+        if kind == 'parcel':
+            return Parcel.objects.select_related('shipment', 'customer'), ParcelSerializer
+        return Customer.objects.all(), CustomerSummarySerializer
+
+    def get(self, request, *args, **kwargs):
+        query = request.query_params.get('q', '')
+        kinds = [kind for kind in request.query_params.get('type', '').split(',') if kind in self.kinds] or list(self.kinds)
+        try:
+            limit = max(1, min(int(request.query_params.get('limit', self.default_limit)), self.max_limit))
+        except ValueError:
+            limit = self.default_limit
+
+        role = get_user_role(request.user)
+        customer_ids = None
+        if role == 'customer':
+            # Scoped inside the search so the limit counts only the customer's own hits
+            customer_ids = list(Customer.objects.filter(email=request.user.email).values_list('pk', flat=True))
+
+        hits = {kind: [] for kind in kinds}
+        for kind, object_id in search(query, kinds, limit, customer_ids):
+            hits[kind].append(object_id)
+
+        results = {'query': query}
+        for kind in kinds:
+            key, customer_field = self.kinds[kind]
+            if not hits[kind]:
+                results[key] = []
+                continue
+            queryset, serializer_class = self.get_results_queryset(kind)
+            queryset = queryset.filter(pk__in=hits[kind])
+            if role == 'customer':
+                queryset = queryset.filter(**{customer_field: request.user.email}).distinct()
+            position = {object_id: index for index, object_id in enumerate(hits[kind])}
+            objects = sorted(queryset, key=lambda obj: position[str(obj.pk)])
+            results[key] = serializer_class(objects, many=True, context={'request': request}).data
+        return Response(results)
+
+
+# ==============================
+# Metrics
+# ==============================
+class MetricsView(BaseUserView, APIView):
+    """Prometheus text exposition of the API metrics, for admins and scrapers."""
+    permission_classes = [IsAdmin | HasMetricsToken]
+    content_negotiation_class = IgnoreClientContentNegotiation
+
+    def get(self, request, *args, **kwargs):
+        return HttpResponse(metrics.render_metrics(), content_type=metrics.CONTENT_TYPE)
 
 
 # ==============================
 # Step Views
 # ==============================
-class StepListCreateView(BaseUserView, generics.ListCreateAPIView):
+class StepListCreateView(ReferenceDataCacheMixin, BaseUserView, generics.ListCreateAPIView):
     serializer_class = StepSerializer
+    reference_category = 'steps'
     permission_classes = [IsAuthenticated]
     filter_backends = [DjangoFilterBackend]
     filterset_fields = ["is_active"]
@@ -277,8 +830,9 @@ class StepDetailView(BaseUserView, generics.RetrieveUpdateDestroyAPIView):
     permission_classes = [IsAuthenticated]
 
 
-class ActiveStepListView(BaseUserView, generics.ListAPIView):
+class ActiveStepListView(ReferenceDataCacheMixin, BaseUserView, generics.ListAPIView):
     serializer_class = StepSerializer
+    reference_category = 'steps'
     permission_classes = [IsAuthenticated]
     pagination_class = None
 
@@ -289,8 +843,9 @@ class ActiveStepListView(BaseUserView, generics.ListAPIView):
 # ==============================
 # Parameter Views
 # ==============================
-class ParameterListCreateView(BaseUserView, generics.ListCreateAPIView):
+class ParameterListCreateView(ReferenceDataCacheMixin, BaseUserView, generics.ListCreateAPIView):
     serializer_class = ParameterSerializer
+    reference_category = 'parameters'
     permission_classes = [IsAuthenticated]
     filter_backends = [DjangoFilterBackend]
     filterset_fields = ["category", "is_active", "is_default"]